@@ -0,0 +1,23 @@
+# app/core/database.py - Conexões SQLite embutidas compartilhadas pelos serviços da API.
+
+import os
+import sqlite3
+
+# Um único arquivo guarda tarefas, cache de resultados e estatísticas de motores
+DATABASE_PATH = os.environ.get("DATABASE_PATH", os.path.join("app", "data", "app.db"))
+
+
+def conectar_sqlite(caminho: str = DATABASE_PATH) -> sqlite3.Connection:
+    '''
+    Abre uma conexão SQLite em modo WAL, permitindo leitores concorrentes
+    enquanto um escritor (API ou worker) grava.
+    '''
+    if caminho != ":memory:":
+        os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    conexao = sqlite3.connect(caminho, timeout=30, check_same_thread=False, isolation_level=None)
+    conexao.row_factory = sqlite3.Row
+    conexao.execute("PRAGMA journal_mode=WAL")
+    # NORMAL é seguro em WAL e evita fsync a cada commit
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    conexao.execute("PRAGMA busy_timeout=30000")
+    return conexao
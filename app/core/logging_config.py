@@ -1,162 +1,182 @@
-# app/core/logging_config.py - Configuração para logging estruturado da API.
-# Autor: [Seu Nome/IA]
-# Data: [Data Atual]
-# Propósito: Define a configuração do sistema de logging para a aplicação,
-#            com foco em logs estruturados em JSON para fácil análise e monitoramento.
+# app/core/logging_config.py - Configuração do logging estruturado da API e dos workers.
+#
+# Os registros são formatados em JSON (um objeto por linha, com os campos passados em
+# `extra=`) e entregues a uma fila em memória; uma thread (QueueListener) faz a escrita,
+# de modo que o event loop nunca espera pelo lock nem pelo I/O do handler de saída.
 
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional, Tuple
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import random
 import sys
-# from python_json_logger import jsonlogger # Biblioteca popular para logging JSON em Python
-# import os # Para carregar configurações de ambiente, se necessário
+import uuid
 
-# NÍVEL DE LOG PADRÃO (pode ser sobrescrito por variável de ambiente)
-# LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# "json" em produção; "text" deixa a saída legível no terminal durante o desenvolvimento
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")
+# Fração das requisições cujos logs INFO/DEBUG são mantidos, por padrão de caminho (fnmatch).
+# WARNING ou mais grave nunca é descartado. Ex.: {"/api/v1/health": 0, "/api/v1/video/task/*": 0.1}
+LOG_SAMPLING = json.loads(
+    os.environ.get("LOG_SAMPLING", '{"/api/v1/health": 0.01, "/metrics": 0, "/api/v1/video/task/*": 0.1}')
+)
 
-def setup_logging(log_level: str = "INFO"):
-    '''
-    Configura o sistema de logging para a aplicação.
+CORRELATION_HEADER = "X-Correlation-ID"
+
+# Contexto da requisição (ou tarefa) corrente; asyncio copia o contexto para cada task
+correlation_id_var: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+_log_amostrado_var: ContextVar[bool] = ContextVar("log_amostrado", default=True)
+
+# Atributos que todo LogRecord tem; o resto veio de `extra=` e vai para o JSON
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Injeta o correlation_id do contexto corrente, salvo quando já veio em `extra=`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "correlation_id", None) is None:
+            record.correlation_id = correlation_id_var.get()
+        return True
+
+
+class AmostragemFilter(logging.Filter):
+    """Descarta logs INFO/DEBUG de requisições fora da amostra decidida pelo middleware."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _log_amostrado_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        dados: Dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO and not chave.startswith("_") and valor is not None:
+                dados[chave] = valor
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            dados["stack_trace"] = record.exc_text
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class _QueueHandlerLeve(QueueHandler):
+    """
+    O prepare() padrão formata a mensagem na thread que loga; aqui só o texto da mensagem
+    e da exceção é materializado e a serialização fica com a thread do QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _taxa_de_amostragem(caminho: str, regras: Dict[str, float]) -> float:
+    for padrao, taxa in regras.items():
+        if fnmatchcase(caminho, padrao):
+            return float(taxa)
+    return 1.0
+
+
+class CorrelacaoMiddleware:
+    """
+    Middleware ASGI puro: define o correlation_id da requisição (reaproveitando o cabeçalho
+    X-Correlation-ID/X-Request-ID do cliente ou do proxy), devolve-o na resposta e decide
+    uma vez por requisição se os logs de baixa severidade dela entram na amostra.
+    """
 
-    Esta função deve ser chamada o mais cedo possível no ciclo de vida da aplicação,
-    idealmente em app/main.py, antes da inicialização do FastAPI ou logo após.
+    def __init__(self, app: Any, regras_amostragem: Optional[Dict[str, float]] = None):
+        self.app = app
+        self.regras_amostragem = LOG_SAMPLING if regras_amostragem is None else regras_amostragem
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cabecalhos = dict(scope.get("headers") or [])
+        correlation_id = (
+            cabecalhos.get(b"x-correlation-id") or cabecalhos.get(b"x-request-id") or b""
+        ).decode("latin-1")[:128] or uuid.uuid4().hex
+        taxa = _taxa_de_amostragem(scope["path"], self.regras_amostragem)
+
+        async def send_com_cabecalho(mensagem: Dict[str, Any]) -> None:
+            if mensagem["type"] == "http.response.start":
+                cabecalhos_resposta: List[Tuple[bytes, bytes]] = list(mensagem.get("headers") or [])
+                cabecalhos_resposta.append((CORRELATION_HEADER.lower().encode(), correlation_id.encode("latin-1")))
+                mensagem = {**mensagem, "headers": cabecalhos_resposta}
+            await send(mensagem)
+
+        token_id = correlation_id_var.set(correlation_id)
+        token_amostra = _log_amostrado_var.set(taxa >= 1 or random.random() < taxa)
+        try:
+            await self.app(scope, receive, send_com_cabecalho)
+        finally:
+            _log_amostrado_var.reset(token_amostra)
+            correlation_id_var.reset(token_id)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(log_level: str = LOG_LEVEL, formato: str = LOG_FORMAT) -> None:
     '''
-    # logger_root = logging.getLogger() # Obtém o logger raiz
-    # logger_root.setLevel(log_level)
-    #
-    # # Remove handlers padrão existentes para evitar duplicação de logs
-    # for handler in logger_root.handlers[:]:
-    #     logger_root.removeHandler(handler)
-    #
-    # # Handler para enviar logs para a saída padrão (stdout ou stderr)
-    # stream_handler = logging.StreamHandler(sys.stdout) # Usar sys.stdout é comum para containers
-    # stream_handler.setLevel(log_level)
-
-    # FORMATADOR JSON
-    # ---------------
-    # Usar um formatador JSON para que os logs sejam estruturados e fáceis de processar
-    # por sistemas de gerenciamento de logs como ELK Stack, Splunk, Grafana Loki, etc.
-    #
-    # Exemplo de campos a serem incluídos (alguns são padrão, outros via 'extra'):
-    #
-    # formatter = jsonlogger.JsonFormatter(
-    #     # Campos padrão do logging que queremos incluir:
-    #     fmt='%(asctime)s %(levelname)s %(name)s %(module)s %(funcName)s %(lineno)d %(message)s'
-    #     # Adicionar campos customizados que podem ser passados via 'extra' no logging:
-    #     # Estes são exemplos, podem ser adaptados conforme a necessidade.
-    #     # '%(correlation_id)s %(request_id)s %(client_ip)s %(endpoint)s %(http_method)s '
-    #     # '%(task_id)s %(video_url)s %(engine_used)s %(ffmpeg_command)s '
-    #     # '%(duration_ms)s %(stack_trace)s' # stack_trace para erros
-    #     ,
-    #     # Renomear campos padrão para nomes mais comuns em logs JSON, se desejado:
-    #     # rename_fields={
-    #     #     "asctime": "timestamp",
-    #     #     "levelname": "level",
-    #     #     "name": "logger_name",
-    #     #     "funcName": "function_name",
-    #     #     "lineno": "line_number"
-    #     # },
-    #     # Configurar o timestamp para formato ISO 8601 UTC:
-    #     # datefmt='iso', # ou '%Y-%m-%dT%H:%M:%S.%fZ'
-    # )
-    #
-    # # stream_handler.setFormatter(formatter)
-    # # logger_root.addHandler(stream_handler)
-
-    # CAMPOS DETALHADOS PARA LOGS ESTRUTURADOS (EXEMPLOS):
-    # ----------------------------------------------------
-    # - timestamp (string): Data e hora do evento no formato ISO 8601 UTC. (Padrão 'asctime')
-    # - level (string): Nível de severidade do log (DEBUG, INFO, WARNING, ERROR, CRITICAL). (Padrão 'levelname')
-    # - message (string): A mensagem de log principal. (Padrão 'message')
-    # - logger_name (string): Nome do logger que emitiu o log. (Padrão 'name')
-    # - module (string): Módulo Python onde o log foi originado. (Padrão 'module')
-    # - function_name (string): Nome da função que emitiu o log. (Padrão 'funcName')
-    # - line_number (int): Número da linha no arquivo fonte. (Padrão 'lineno')
-    #
-    # Campos de Contexto da Requisição (adicionar via 'extra'):
-    # - correlation_id (string): ID único para rastrear uma requisição através de múltiplos logs/serviços.
-    #                            Gerado no início da requisição (e.g., em um middleware).
-    # - request_id (string): Similar ao correlation_id, pode ser específico do FastAPI ou servidor web.
-    # - client_ip (string): Endereço IP do cliente. Considerar X-Forwarded-For e questões de privacidade.
-    # - endpoint (string): Endpoint da API que foi acessado (ex: "/api/v1/download").
-    # - http_method (string): Método HTTP utilizado (GET, POST, PUT, DELETE, etc.).
-    # - request_params (dict/string): Parâmetros da requisição (query e corpo).
-    #                                 !!! IMPORTANTE: Dados sensíveis (senhas, tokens, PII) DEVEM ser
-    #                                 anonimizados, omitidos ou mascarados antes de serem logados. !!!
-    # - user_agent (string): User-Agent do cliente.
-    #
-    # Campos Específicos da Aplicação (adicionar via 'extra'):
-    # - task_id (string): ID da tarefa Celery, quando aplicável.
-    # - video_url (string): URL do vídeo sendo processada.
-    # - engine_used (string): Nome do motor de download utilizado na tentativa.
-    # - ffmpeg_command (string): Comando FFmpeg executado (se curto e relevante; evitar logar comandos muito longos).
-    #
-    # Campos de Diagnóstico e Erro (adicionar via 'extra' ou automaticamente pelo logger):
-    # - stack_trace (string/list): Stack trace completo quando um erro/exceção é logado.
-    #                               O módulo 'logging' já captura informações de exceção com logger.exception().
-    # - error_type (string): Tipo da exceção (ex: "ValueError", "DownloadFailedError").
-    #
-    # Campos de Performance (adicionar via 'extra'):
-    # - duration_ms (float/int): Duração de uma operação específica ou da requisição inteira em milissegundos.
-
-    # EXEMPLO DE COMO USAR O LOGGER CONFIGURADO EM OUTROS MÓDULOS:
-    # -----------------------------------------------------------
-    # import logging
-    # logger = logging.getLogger(__name__) # Boa prática usar o nome do módulo atual
-    #
-    # def minha_funcao(parametro_sensivel="senha123"):
-    #     logger.info(
-    #         "Minha função foi chamada.",
-    #         extra={
-    #             "correlation_id": "abc-123",
-    #             "endpoint": "/minha_rota",
-    #             "meu_parametro": "valor_do_parametro",
-    #             # Exemplo de sanitização MUITO SIMPLES (NÃO USAR EM PRODUÇÃO):
-    #             "parametro_sensivel_log": f"{parametro_sensivel[:2]}***{parametro_sensivel[-2:]}" if parametro_sensivel else None
-    #         }
-    #     )
-    #     try:
-    #         # ... alguma lógica ...
-    #         # if erro:
-    #         #    raise ValueError("Algo deu errado")
-    #         pass
-    #     except Exception as e:
-    #         logger.error(
-    #             f"Erro na minha_funcao: {str(e)}",
-    #             exc_info=True, # Adiciona stack trace ao log (se o formatador suportar ou for padrão)
-    #             extra={"correlation_id": "abc-123", "error_type": type(e).__name__}
-    #         )
-    #         # Ou usar logger.exception("Mensagem de erro") que faz o mesmo que error com exc_info=True
-
-    # NÍVEIS DE LOG APROPRIADOS:
-    # --------------------------
-    # - DEBUG: Informação detalhada, tipicamente de interesse apenas durante o desenvolvimento e depuração.
-    # - INFO: Confirmação de que as coisas estão funcionando como esperado. Eventos significativos da aplicação.
-    # - WARNING: Algo inesperado aconteceu, ou indicação de algum problema potencial no futuro próximo
-    #            (ex: 'uso de disco quase no limite'). A aplicação continua funcionando.
-    # - ERROR: Devido a um problema mais sério, o software não foi capaz de realizar alguma função.
-    # - CRITICAL: Um erro sério, indicando que o próprio programa pode ser incapaz de continuar rodando.
-
-    # CONSIDERAÇÕES ADICIONAIS:
-    # -------------------------
-    # - LoggerAdapters ou Filters: Podem ser usados para injetar automaticamente informações de contexto
-    #   (como correlation_id) em todas as mensagens de log sem precisar passá-las no 'extra' toda vez.
-    # - Configuração via Dicionário: Para configurações mais complexas, Python logging suporta
-    #   configuração via um dicionário (logging.config.dictConfig).
-    # - Variáveis de Ambiente: O nível de log e outros parâmetros de logging podem ser configurados
-    #   através de variáveis de ambiente para flexibilidade entre diferentes ambientes (dev, staging, prod).
-
-    print("Módulo app/core/logging_config.py com a função setup_logging() e comentários detalhados sobre estrutura e formato de logs (JSON) foi conceitualmente definido.")
-    print("A configuração real do logger (instanciação e adição de handlers/formatters) está comentada, mas a descrição está presente.")
-
-# Para testar conceitualmente (não será executado pelo worker diretamente):
-# if __name__ == "__main__":
-# setup_logging("DEBUG")
-# test_logger = logging.getLogger("meu_modulo_teste")
-# test_logger.debug("Este é um log de debug.", extra={"correlation_id": "xyz-789", "custom_field": "valor_teste"})
-# test_logger.info("Este é um log de info.")
-# test_logger.warning("Este é um log de warning.")
-# try:
-# 1 / 0
-# except ZeroDivisionError:
-# test_logger.error("Este é um log de erro com stack trace.", exc_info=True) # exc_info=True para capturar o stack trace
-# # ou
-# # test_logger.exception("Este é um log de exceção, também com stack trace.") # Mais conciso
+    Configura o logging da aplicação: um QueueHandler no logger raiz e um QueueListener
+    que escreve em stdout. Deve ser chamada o mais cedo possível (app/main.py, workers).
+    '''
+    global _listener
+    encerrar_logging()
+
+    saida = logging.StreamHandler(sys.stdout)
+    if formato == "json":
+        saida.setFormatter(JsonFormatter())
+    else:
+        saida.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+    fila: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler_fila = _QueueHandlerLeve(fila)
+    # Os filtros rodam na thread que loga, onde o contexto da requisição está visível
+    handler_fila.addFilter(CorrelationIdFilter())
+    handler_fila.addFilter(AmostragemFilter())
+
+    raiz = logging.getLogger()
+    for handler in raiz.handlers[:]:
+        raiz.removeHandler(handler)
+    raiz.addHandler(handler_fila)
+    raiz.setLevel(log_level)
+
+    # O uvicorn instala handlers próprios; com propagação tudo passa pela mesma fila
+    for nome in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logger_uvicorn = logging.getLogger(nome)
+        logger_uvicorn.handlers = []
+        logger_uvicorn.propagate = True
+
+    _listener = QueueListener(fila, saida, respect_handler_level=True)
+    _listener.start()
+
+
+def encerrar_logging() -> None:
+    """Para o QueueListener, escrevendo o que ainda estiver na fila."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(encerrar_logging)
@@ -0,0 +1,138 @@
+# app/core/metrics.py - Métricas Prometheus da API e dos workers
+#
+# Com PROMETHEUS_MULTIPROC_DIR definido (mesmo diretório para os processos uvicorn e os
+# workers Celery do host), cada processo grava suas amostras em arquivos mmap e o /metrics
+# agrega todos eles. Sem a variável, vale o registro padrão do próprio processo.
+
+from typing import Any, Dict
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+MULTIPROCESSO = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+_BALDES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+_BALDES_LONGOS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200)
+_BALDES_VAZAO = tuple(2 ** n * 64 * 1024 for n in range(0, 12))  # 64 KiB/s a 128 MiB/s
+
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "Latência das requisições HTTP por rota",
+    ["method", "route", "status"], buckets=_BALDES_LATENCIA,
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "Requisições HTTP em andamento",
+    ["method"], multiprocess_mode="livesum",
+)
+extraction_duration_seconds = Histogram(
+    "extraction_duration_seconds", "Tempo de extração de metadados (yt-dlp) por domínio",
+    ["domain", "outcome"], buckets=_BALDES_LATENCIA,
+)
+extraction_coalesced_total = Counter(
+    "extraction_coalesced_total", "Extrações evitadas por requisições idênticas simultâneas",
+)
+cache_lookups_total = Counter(
+    "cache_lookups_total", "Consultas aos caches de metadados, de resultados e de handles de info",
+    ["cache", "outcome"],
+)
+task_queue_wait_seconds = Histogram(
+    "task_queue_wait_seconds", "Tempo entre a criação da tarefa e o início no worker",
+    ["queue"], buckets=_BALDES_LONGOS,
+)
+download_duration_seconds = Histogram(
+    "download_duration_seconds", "Duração de cada tentativa de download por motor",
+    ["engine", "outcome"], buckets=_BALDES_LONGOS,
+)
+download_throughput_bytes_per_second = Histogram(
+    "download_throughput_bytes_per_second", "Vazão dos downloads concluídos por motor",
+    ["engine"], buckets=_BALDES_VAZAO,
+)
+download_bytes_total = Counter(
+    "download_bytes_total", "Bytes baixados por motor", ["engine"],
+)
+tasks_cancelled_total = Counter(
+    "tasks_cancelled_total", "Tarefas canceladas pelo cliente ou por inatividade", ["reason"],
+)
+download_dir_usage_bytes = Gauge(
+    "download_dir_usage_bytes", "Bytes ocupados no diretório de downloads",
+    multiprocess_mode="livemax",
+)
+download_dir_quota_bytes = Gauge(
+    "download_dir_quota_bytes", "Cota configurada para o diretório de downloads",
+    multiprocess_mode="livemax",
+)
+
+
+def _rota_do_escopo(scope: Dict[str, Any]) -> str:
+    """
+    Template da rota (ex.: /api/v1/download/{task_id}), evitando uma série por ID. O
+    roteador grava a rota encontrada em scope["route"]; em routers incluídos com prefixo
+    o `path_format` dela é relativo, então o prefixo (fixo) é o trecho do caminho antes
+    do sufixo que a rota casou. Sem rota encontrada (404) o rótulo é fixo.
+    """
+    rota = scope.get("route")
+    formato = getattr(rota, "path_format", None)
+    if formato is None:
+        return "desconhecida"
+    caminho = scope["path"]
+    inicio = 0
+    while inicio != -1:
+        if rota.path_regex.match(caminho[inicio:]):
+            return caminho[:inicio] + formato
+        inicio = caminho.find("/", inicio + 1)
+    return formato
+
+
+class MetricasMiddleware:
+    """Middleware ASGI puro: não interfere no streaming nem na extensão zero-copy das respostas."""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        metodo = scope["method"]
+        status_resposta = {"codigo": 500}
+
+        async def send_com_status(mensagem: Dict[str, Any]) -> None:
+            if mensagem["type"] == "http.response.start":
+                status_resposta["codigo"] = mensagem["status"]
+            await send(mensagem)
+
+        em_andamento = http_requests_in_progress.labels(metodo)
+        em_andamento.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_com_status)
+        finally:
+            em_andamento.dec()
+            # O roteador atualiza o próprio escopo, então a rota só é conhecida depois da chamada
+            rota = _rota_do_escopo(scope)
+            http_request_duration_seconds.labels(metodo, rota, str(status_resposta["codigo"])).observe(
+                time.perf_counter() - inicio
+            )
+
+
+def gerar_metricas() -> bytes:
+    if MULTIPROCESSO:
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro)
+    return generate_latest(REGISTRY)
+
+
+def marcar_processo_encerrado(pid: int) -> None:
+    """Remove as amostras "live" de um processo que terminou (workers Celery, uvicorn)."""
+    if MULTIPROCESSO:
+        multiprocess.mark_process_dead(pid)
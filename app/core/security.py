@@ -1,7 +1,9 @@
 # app/core/security.py - Módulo para funcionalidades de segurança e autenticação.
 
-# from fastapi import Security, HTTPException, status
-# from fastapi.security.api_key import APIKeyHeader
+import hashlib
+
+from fastapi import Request, Security, HTTPException, status
+from fastapi.security.api_key import APIKeyHeader
 
 API_KEY_HEADER_NAME = "X-API-Key"
 api_key_header_scheme = APIKeyHeader(name=API_KEY_HEADER_NAME, auto_error=True)
@@ -29,4 +31,12 @@ async def verificar_api_key(api_key: str = Security(api_key_header_scheme)):
         # Retornamos um valor default para a simulação não quebrar chamadas.
         return {"client_name": "Cliente Simulado Bloqueado"}
 
+def identificar_cliente(request: Request) -> str:
+    """Identidade usada nos limites por cliente: a API Key, ou o IP quando ela não é enviada."""
+    api_key = request.headers.get(API_KEY_HEADER_NAME)
+    if api_key:
+        # Só um resumo da chave vai para os registros de tarefa e para o broker
+        return f"key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}"
+    return f"ip:{request.client.host if request.client else 'desconhecido'}"
+
 print("Módulo de segurança (app/core/security.py) com esquema de API Key conceitualmente definido.")
@@ -3,13 +3,42 @@
 try:
     from fastapi import FastAPI, Request, HTTPException, Response, status
     from fastapi.middleware.cors import CORSMiddleware
-    from fastapi.responses import JSONResponse, FileResponse
+    from fastapi.responses import JSONResponse
+    from starlette.concurrency import run_in_threadpool
     import os
     import logging
     import json
     import random
+    import uuid
     from typing import Dict, List, Optional, Any
+    from app.core.logging_config import CorrelacaoMiddleware, setup_logging
+    from app.core.metrics import (
+        CONTENT_TYPE_LATEST,
+        MetricasMiddleware,
+        download_dir_quota_bytes,
+        download_dir_usage_bytes,
+        gerar_metricas,
+    )
     from app.routes import api_router
+    from app.services.extraction_executor import (
+        ExecutorSaturadoError,
+        ExtracaoTimeoutError,
+        encerrar_executor_extracao,
+    )
+    from app.services.extraction_service import obter_info_video
+    from app.services.execution_backend import encerrar_execution_backend
+    from app.services.file_delivery import responder_arquivo
+    from app.services.info_handles import get_info_handles
+    from app.services.rate_limiter import get_limitador
+    from app.services.result_cache import get_result_cache
+    from app.services.result_storage import (
+        e_remoto,
+        entregar_resultado,
+        get_armazenamento_local,
+        verificar_assinatura,
+    )
+    from app.services.storage_manager import STORAGE_DIR, get_gerenciador_armazenamento
+    from app.services.task_store import get_task_store
 except ImportError as e:
     import sys
     print(f"Erro de importação: {e}")
@@ -19,11 +48,8 @@ except ImportError as e:
     print("pip install pydantic>=2.0.0")
     sys.exit(1)
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-)
+# Configurar logging (JSON via fila; LOG_LEVEL, LOG_FORMAT e LOG_SAMPLING no ambiente)
+setup_logging()
 logger = logging.getLogger("video-api")
 
 # Criar a aplicação FastAPI
@@ -43,12 +69,34 @@ app_fastapi.add_middleware(
     allow_headers=["*"],
 )
 
+# Latência e requisições em andamento por rota (template, não a URL concreta)
+app_fastapi.add_middleware(MetricasMiddleware)
+# Correlation ID e amostragem de logs por rota; o mais externo, para cobrir todos os demais
+app_fastapi.add_middleware(CorrelacaoMiddleware)
+
 # Criar pasta para downloads se não existir
 os.makedirs("app/download", exist_ok=True)
 
 # Incluir as rotas da API
 app_fastapi.include_router(api_router, prefix="/api/v1")
 
+async def _extrair_info_ou_erro(url: str, mensagem_erro: str) -> Dict[str, Any]:
+    """Roda a extração no executor limitado e traduz falhas em respostas HTTP."""
+    try:
+        return await obter_info_video(url)
+    except ExecutorSaturadoError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado extraindo outros vídeos, tente novamente em instantes",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    except ExtracaoTimeoutError:
+        logger.error(f"Tempo limite excedido ao extrair: {url}")
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=mensagem_erro)
+    except Exception as exc:
+        logger.error(f"{mensagem_erro}: {exc}")
+        raise HTTPException(status_code=500, detail=mensagem_erro)
+
 # Rotas básicas
 @app_fastapi.get("/api/v1/health", tags=["Health Check"], status_code=status.HTTP_200_OK)
 async def health_check():
@@ -61,31 +109,32 @@ async def health_check():
         }
     }
 
+@app_fastapi.get("/metrics", tags=["Health Check"], include_in_schema=False)
+async def metrics():
+    gerenciador = get_gerenciador_armazenamento()
+    # O uso é medido só aqui e no zelador; a varredura do diretório não deve bloquear o loop
+    download_dir_usage_bytes.set(await run_in_threadpool(gerenciador.uso))
+    download_dir_quota_bytes.set(gerenciador.cota)
+    return Response(content=gerar_metricas(), media_type=CONTENT_TYPE_LATEST)
+
 @app_fastapi.get("/api/v1/video/info", tags=["Video"])
 async def get_video_info(url: str):
     if not url:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="URL não fornecida")
 
     logger.info(f"Solicitando informações para URL: {url}")
-    from yt_dlp import YoutubeDL
-
-    try:
-        with YoutubeDL({"skip_download": True}) as ydl:
-            info = ydl.extract_info(url, download=False)
+    info = await _extrair_info_ou_erro(url, "Falha ao obter informações do vídeo")
 
-        return {
-            "success": True,
-            "data": {
-                "title": info.get("title"),
-                "thumbnailUrl": info.get("thumbnail"),
-                "duration": info.get("duration"),
-                "author": info.get("uploader"),
-                "viewCount": info.get("view_count")
-            },
-        }
-    except Exception as exc:
-        logger.error(f"Erro ao obter informações: {exc}")
-        raise HTTPException(status_code=500, detail="Falha ao obter informações do vídeo")
+    return {
+        "success": True,
+        "data": {
+            "title": info.get("title"),
+            "thumbnailUrl": info.get("thumbnail"),
+            "duration": info.get("duration"),
+            "author": info.get("uploader"),
+            "viewCount": info.get("view_count")
+        },
+    }
 
 @app_fastapi.get("/api/v1/video/options", tags=["Video"])
 async def get_video_options(url: str):
@@ -93,27 +142,23 @@ async def get_video_options(url: str):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="URL não fornecida")
 
     logger.info(f"Solicitando opções de download para URL: {url}")
+    info = await _extrair_info_ou_erro(url, "Falha ao obter opções")
 
-    from yt_dlp import YoutubeDL
-
-    try:
-        with YoutubeDL({"skip_download": True}) as ydl:
-            info = ydl.extract_info(url, download=False)
-        formats = [
-            {
-                "format_id": f.get("format_id"),
-                "ext": f.get("ext"),
-                "filesize": f.get("filesize"),
-                "format_note": f.get("format_note"),
-                "video_codec": f.get("vcodec"),
-                "audio_codec": f.get("acodec"),
-            }
-            for f in info.get("formats", []) if f.get("filesize")
-        ]
-        return {"success": True, "data": formats}
-    except Exception as exc:
-        logger.error(f"Erro ao obter opções: {exc}")
-        raise HTTPException(status_code=500, detail="Falha ao obter opções")
+    formats = [
+        {
+            "format_id": f.get("format_id"),
+            "ext": f.get("ext"),
+            "filesize": f.get("filesize"),
+            "format_note": f.get("format_note"),
+            "video_codec": f.get("vcodec"),
+            "audio_codec": f.get("acodec"),
+        }
+        for f in info.get("formats", []) if f.get("filesize")
+    ]
+    # O cliente devolve o handle (e o format_id escolhido) no pedido de download, e o
+    # worker usa esta mesma extração em vez de repeti-la
+    info_handle = await run_in_threadpool(get_info_handles().criar, url, info)
+    return {"success": True, "data": formats, "info_handle": info_handle}
 
 @app_fastapi.post("/api/v1/video/download", tags=["Video"])
 async def start_download(request: Request):
@@ -134,10 +179,11 @@ async def start_download(request: Request):
         
         logger.info(f"Iniciando download para URL: {url}")
 
-        from app.tasks.download_tasks import processar_download_video
-        result = processar_download_video.delay({"video_url": url})
+        from app.routes.download_endpoint import process_download_task
+        task_id = str(uuid.uuid4())
+        task_status = await process_download_task(task_id, request_data.model_dump(mode="json"))
 
-        return {"success": True, "data": {"task_id": result.id, "status": "pending"}}
+        return {"success": True, "data": {"task_id": task_id, "status": task_status}}
     except json.JSONDecodeError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -171,9 +217,9 @@ async def check_task_status(task_id: str):
         "data": response
     }
 
-@app_fastapi.get("/api/v1/download/{task_id}", tags=["Video"])
-async def download_file(task_id: str):
-    """Endpoint para download do arquivo processado"""
+@app_fastapi.api_route("/api/v1/download/{task_id}", methods=["GET", "HEAD"], tags=["Video"])
+async def download_file(task_id: str, request: Request):
+    """Endpoint para download do arquivo processado (suporta Range, ETag e HEAD)"""
     if not task_id:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -182,58 +228,41 @@ async def download_file(task_id: str):
     
     logger.info(f"Solicitando download do arquivo para tarefa: {task_id}")
     
-    # Verificar se existe um arquivo de tarefa para o task_id
-    task_file = os.path.join("app", "download", f"{task_id}.json")
+    task_data = get_task_store().obter(task_id)
     
-    if not os.path.exists(task_file):
+    if task_data is None:
         logger.warning(f"Tentativa de download para tarefa inexistente: {task_id}")
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Tarefa {task_id} não encontrada"
         )
     
-    try:
-        # Ler dados da tarefa
-        with open(task_file, "r") as f:
-            task_data = json.load(f)
-        
-        # Verificar se a tarefa está concluída
-        if task_data.get("status") != "completed":
-            logger.warning(f"Tentativa de download para tarefa não concluída: {task_id}")
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Tarefa {task_id} não está concluída"
-            )
-        
-        # Para demonstração, criar um arquivo de texto temporário
-        output_file = os.path.join("app", "download", f"{task_id}.txt")
-        
-        # Verificar se o arquivo já existe, se não, criar um arquivo de exemplo
-        if not os.path.exists(output_file):
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write(f"Este é um arquivo de exemplo para a tarefa {task_id}.\n")
-                f.write("Em uma implementação real, este seria o vídeo ou áudio baixado.\n")
-                f.write(f"URL: {task_data.get('download_data', {}).get('video_url', 'N/A')}\n")
-                f.write(f"Formato: {task_data.get('download_data', {}).get('format', 'N/A')}\n")
-        
-        # Gerar um nome de arquivo mais amigável
-        download_filename = f"download-{task_id}.txt"
-        
-        # Em uma implementação real, o tipo de arquivo e nome seria determinado pelo formato selecionado
-        # Por exemplo: video-title.mp4 ou audio-title.mp3
-        
-        # Determinar o tipo MIME com base na extensão (em implementação real)
-        media_type = "text/plain"  # Para arquivos de texto em nossa demonstração
-        # Em produção: "video/mp4" para vídeos MP4, "audio/mpeg" para áudios MP3, etc.
-        
-        # FileResponse configura os cabeçalhos necessários para download no navegador
-        return FileResponse(
-            path=output_file,
-            filename=download_filename,
-            media_type=media_type,
-            # Force o download como "attachment" para que o navegador baixe em vez de exibir
-            headers={"Content-Disposition": f"attachment; filename=\"{download_filename}\""}
+    # Verificar se a tarefa está concluída
+    if task_data.get("status") != "completed":
+        logger.warning(f"Tentativa de download para tarefa não concluída: {task_id}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tarefa {task_id} não está concluída"
         )
+    
+    output_file = task_data.get("file_path")
+    # Resultados em object storage são confiados ao índice; só os locais são checados no disco
+    if not output_file or not (e_remoto(output_file) or os.path.exists(output_file)):
+        logger.warning(f"Arquivo da tarefa {task_id} não está mais disponível")
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            # Despejado por falta de espaço: o registro guarda o motivo
+            detail=task_data.get("error") or f"Arquivo da tarefa {task_id} não está mais disponível"
+        )
+    
+    if task_data.get("result_cache_key"):
+        # Mantém o arquivo quente para o despejo LRU do gerenciador de armazenamento
+        get_result_cache().marcar_servido(task_data["result_cache_key"])
+
+    try:
+        # Nome amigável com a extensão real do arquivo armazenado (ex: download-<id>.mp4)
+        download_filename = f"download-{task_id}{os.path.splitext(output_file)[1]}"
+        return entregar_resultado(request.headers, output_file, download_filename, request.method)
     except Exception as e:
         logger.error(f"Erro ao processar download para tarefa {task_id}: {str(e)}")
         raise HTTPException(
@@ -241,6 +270,27 @@ async def download_file(task_id: str):
             detail=f"Erro ao processar download: {str(e)}"
         )
 
+@app_fastapi.api_route("/api/v1/files/{nome_arquivo}", methods=["GET", "HEAD"], tags=["Video"])
+async def download_assinado(nome_arquivo: str, expires: int, name: str, signature: str, request: Request):
+    """Serve um resultado local pelo link assinado do redirect (RESULT_LOCAL_REDIRECT)"""
+    if not verificar_assinatura(nome_arquivo, expires, name, signature):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Link inválido ou expirado"
+        )
+    if nome_arquivo.startswith(".") or os.path.basename(nome_arquivo) != nome_arquivo:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Arquivo não encontrado"
+        )
+    caminho = os.path.join(STORAGE_DIR, nome_arquivo)
+    if not os.path.isfile(caminho):
+        raise HTTPException(
+            status_code=status.HTTP_410_GONE,
+            detail="Arquivo não está mais disponível"
+        )
+    return responder_arquivo(request.headers, caminho, name, request.method)
+
 # Manipulador de exceções para toda a aplicação
 @app_fastapi.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
@@ -257,11 +307,19 @@ async def generic_exception_handler(request: Request, exc: Exception):
 # Evento de inicialização
 @app_fastapi.on_event("startup")
 async def startup_event():
+    # Combinações de backend inválidas falham na subida, não na primeira requisição
+    get_limitador()
+    get_armazenamento_local()
+    if os.environ.get("STORAGE_JANITOR_ENABLED", "true").lower() == "true":
+        get_gerenciador_armazenamento().iniciar_zelador()
     logger.info("Aplicação FastAPI iniciada com sucesso")
 
 # Evento de encerramento
 @app_fastapi.on_event("shutdown")
 async def shutdown_event():
+    encerrar_executor_extracao()
+    encerrar_execution_backend()
+    get_gerenciador_armazenamento().parar_zelador()
     logger.info("Aplicação FastAPI encerrada")
 
 logger.info("Aplicação FastAPI (app_fastapi) em app/main.py criada e configurada.")
@@ -30,3 +30,4 @@ class DownloadEngine(str, Enum):
     RTMPDUMP = 'rtmpdump'
     GALLERY_DL = 'gallery-dl'
     YOU_GET = 'you-get'
+    SEGMENTED = 'segmented'
@@ -1,6 +1,6 @@
 # app/models/request_schemas.py - Define os esquemas de requisição da API.
 
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, validator, HttpUrl
 import re
 from .enums import AllowedFormats, DownloadEngine
@@ -12,6 +12,8 @@ class DownloadRequest(BaseModel):
     audio_only: Optional[bool] = False
     start_time: Optional[str] = None  # Formato HH:MM:SS
     end_time: Optional[str] = None  # Formato HH:MM:SS
+    format_id: Optional[str] = None  # Formato escolhido em /video/options
+    info_handle: Optional[str] = None  # Handle devolvido por /video/options
 
     # Validador para formato
     @validator('format')
@@ -33,6 +35,23 @@ class DownloadRequest(BaseModel):
             allowed_engines = [e.value for e in DownloadEngine]
             raise ValueError(f"Engine inválido. Engines permitidos: {', '.join(allowed_engines)}")
     
+    # format_id vira seletor do yt-dlp: só um ID simples, sem operadores (/, +, [], ...)
+    @validator('format_id')
+    def validate_format_id(cls, v):
+        if v is None:
+            return v
+        if not re.match(r'^[A-Za-z0-9_.=-]{1,64}$', v):
+            raise ValueError("format_id inválido")
+        return v
+
+    @validator('info_handle')
+    def validate_info_handle(cls, v):
+        if v is None:
+            return v
+        if not re.match(r'^[A-Za-z0-9_-]{1,64}$', v):
+            raise ValueError("info_handle inválido")
+        return v
+
     # Validador para tempos
     @validator('start_time', 'end_time')
     def validate_time_format(cls, v):
@@ -60,3 +79,31 @@ class DownloadRequest(BaseModel):
             if end_seconds <= start_seconds:
                 raise ValueError("end_time deve ser posterior a start_time")
         return v
+
+
+class BatchDownloadRequest(BaseModel):
+    requests: Optional[List[DownloadRequest]] = None  # Lista explícita de downloads
+    # Opções aplicadas a cada item da playlist
+    format: Optional[str] = None
+    engine: Optional[str] = None
+    audio_only: Optional[bool] = False
+    playlist_url: Optional[HttpUrl] = None  # Ou uma playlist/canal a ser expandido
+
+    # Validador para formato e engine dos itens da playlist
+    @validator('format')
+    def validate_format(cls, v):
+        return DownloadRequest.validate_format(v) if v is not None else v
+
+    @validator('engine')
+    def validate_engine(cls, v):
+        return DownloadRequest.validate_engine(v)
+
+    # Validador para exigir exatamente uma das fontes
+    @validator('playlist_url', always=True)
+    def validate_source(cls, v, values):
+        requests = values.get('requests')
+        if bool(requests) == bool(v):
+            raise ValueError("Informe 'requests' ou 'playlist_url' (apenas um deles)")
+        if v and not values.get('format'):
+            raise ValueError("'format' é obrigatório para playlists")
+        return v
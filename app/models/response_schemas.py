@@ -14,6 +14,9 @@ class TaskStatusData(BaseModel):
     progress: Optional[int] = None
     download_url: Optional[str] = None
     error: Optional[str] = None
+    # Presentes apenas em tarefas de lote (batch/playlist)
+    summary: Optional[Dict[str, int]] = None
+    children: Optional[List["TaskStatusData"]] = None
 
 class TaskStatusResponse(BaseModel):
     success: bool = True
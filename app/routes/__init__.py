@@ -1,11 +1,15 @@
 # app/routes/__init__.py - Inicialização dos módulos de rotas FastAPI
 
 from fastapi import APIRouter
+from . import admin_endpoint
 from . import download_endpoint
 from . import status_endpoint
+from . import stream_endpoint
 
 api_router = APIRouter()
 api_router.include_router(download_endpoint.router, prefix="/video/download", tags=["Download"])
 api_router.include_router(status_endpoint.router, prefix="/video/task", tags=["Status"])
+api_router.include_router(stream_endpoint.router, prefix="/video/task", tags=["Status"])
+api_router.include_router(admin_endpoint.router, prefix="/admin", tags=["Admin"])
 
 print("Módulo de rotas FastAPI (app/routes/__init__.py) inicializado.")
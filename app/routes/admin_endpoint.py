@@ -0,0 +1,29 @@
+# app/routes/admin_endpoint.py - Endpoints administrativos (estatísticas internas)
+
+from fastapi import APIRouter
+from starlette.concurrency import run_in_threadpool
+from app.services.engine_stats import get_engine_stats
+from app.services.storage_manager import get_gerenciador_armazenamento
+from app.services.trimming import get_metricas_recorte
+import logging
+
+admin_logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get("/engines/stats")
+async def get_engine_stats_endpoint():
+    """Estatísticas por (domínio, motor) usadas na seleção adaptativa de motores."""
+    estatisticas = sorted(get_engine_stats().listar(), key=lambda r: (r["domain"], r["engine"]))
+    admin_logger.debug(f"Estatísticas de motores consultadas ({len(estatisticas)} entradas).")
+    return {"success": True, "data": estatisticas}
+
+@router.get("/trimming/stats")
+async def get_trimming_stats_endpoint():
+    """Bytes baixados e economizados pelos downloads com start_time/end_time."""
+    return {"success": True, "data": get_metricas_recorte().estatisticas()}
+
+@router.get("/storage/stats")
+async def get_storage_stats_endpoint():
+    """Uso do diretório de downloads em relação à cota e às marcas de despejo."""
+    return {"success": True, "data": await run_in_threadpool(get_gerenciador_armazenamento().estatisticas)}
@@ -1,46 +1,295 @@
 # app/routes/download_endpoint.py - Endpoint para submeter tarefas de download
 
-from fastapi import APIRouter, status, Request, HTTPException, Depends
-from app.models.request_schemas import DownloadRequest
+from fastapi import APIRouter, BackgroundTasks, status, Request, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from app.core.logging_config import correlation_id_var
+from app.core.security import identificar_cliente
+from app.services.audio_pipeline import e_pedido_de_audio
+from app.services.cancellation import get_cancelamentos
+from app.models.request_schemas import BatchDownloadRequest, DownloadRequest
 from app.models.response_schemas import TaskCreationResponse
+from app.services.execution_backend import get_execution_backend
+from app.services.extraction_executor import get_executor_extracao
+from app.services.extraction_service import extrair_entradas_playlist, obter_info_video
+from app.services.info_handles import get_info_handles
+from app.services.file_delivery import tipo_de_midia
+from app.services.rate_limiter import LimiteAtingidoError, get_limitador
+from app.services.result_cache import gerar_chave_resultado, get_result_cache
+from app.services.result_storage import entregar_resultado
+from app.services.storage_manager import ArmazenamentoCheioError, get_gerenciador_armazenamento
+from app.services.stream_passthrough import (
+    STREAM_TEE_DEFAULT,
+    RemuxIndisponivelError,
+    TransmissaoDownload,
+    TransmissaoError,
+    montar_comandos,
+)
+from app.services.task_store import get_task_store
+from typing import List
 import uuid
 import logging
 import os
-import json
-from datetime import datetime
 
 # Configuração do logger
 download_logger = logging.getLogger(__name__)
 
+# Limite de itens por lote/playlist e tamanho dos blocos de enfileiramento
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "500"))
+BATCH_ENQUEUE_CHUNK = int(os.environ.get("BATCH_ENQUEUE_CHUNK", "50"))
+
 # Criação do router
 router = APIRouter()
 
-# Função para simular o processamento assíncrono (será substituída por Celery em produção)
+def _registro_atendido_pelo_cache(task_id: str, download_data: dict):
+    """Monta o registro de uma tarefa já concluída se houver resultado idêntico armazenado."""
+    cache = get_result_cache()
+    chave = gerar_chave_resultado(download_data)
+    entrada = cache.buscar(chave)
+    if entrada is None:
+        return None
+    cache.adicionar_referencia(chave, task_id)
+    download_logger.info(f"Tarefa {task_id} atendida pelo cache de resultados", extra={"task_id": task_id})
+    return {
+        "task_id": task_id,
+        "download_data": download_data,
+        "status": "completed",
+        "progress": 100,
+        "file_path": entrada["file_path"],
+        "download_url": f"/api/v1/download/{task_id}",
+        "result_cache_key": chave,
+    }
+
+async def _info_para_transmissao(download_data: dict):
+    """Metadados para escolher a origem de áudio da transmissão (handle, cache ou extração)."""
+    if not e_pedido_de_audio(download_data):
+        return None
+    if download_data.get("info_handle"):
+        info = await run_in_threadpool(
+            get_info_handles().obter, download_data["info_handle"], download_data["video_url"]
+        )
+        if info is not None:
+            return info
+    try:
+        return await obter_info_video(download_data["video_url"])
+    except Exception as e:
+        # Sem metadados a transmissão segue com o seletor genérico; o próprio yt-dlp reporta o erro
+        download_logger.warning(f"Metadados indisponíveis para a transmissão: {str(e)}")
+        return None
+
+async def _verificar_admissao():
+    """Recusa novos downloads (503) quando o disco está perto de encher."""
+    try:
+        # A medição do diretório pode varrer o disco; fora do loop de eventos
+        await run_in_threadpool(get_gerenciador_armazenamento().verificar_admissao)
+    except ArmazenamentoCheioError as e:
+        download_logger.warning(f"Download recusado por falta de espaço: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Armazenamento temporariamente cheio, tente novamente em instantes",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+def _admitir_cliente(download_data: dict, task_ids=()):
+    """Aplica os limites do cliente (token bucket e downloads em andamento); 429 se excedidos."""
+    cliente = download_data.get("client_id")
+    if not cliente:
+        return
+    try:
+        get_limitador().admitir_cliente(cliente, tuple(task_ids))
+    except LimiteAtingidoError as e:
+        download_logger.warning(f"Cliente {cliente} limitado: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+# Registra a tarefa e a submete ao backend de execução configurado (Celery ou em processo)
 async def process_download_task(task_id: str, download_data: dict):
     """
-    Função que simula o processamento assíncrono de uma tarefa de download.
-    Em produção, isso seria feito por um worker Celery.
+    Registra a tarefa no TaskStore e a envia para execução.
+    Retorna o status inicial da tarefa ("completed" quando atendida pelo cache).
     """
-    # Criar diretório de downloads se não existir
-    download_dir = os.path.join("app", "download")
-    os.makedirs(download_dir, exist_ok=True)
-    
-    # Simular o processamento salvando os dados da tarefa
-    task_file = os.path.join(download_dir, f"{task_id}.json")
-    with open(task_file, "w") as f:
-        json.dump({
-            "task_id": task_id,
-            "download_data": download_data,
-            "status": "pending",
-            "created_at": datetime.now().isoformat()
-        }, f)
+    # Resultado idêntico já armazenado: a tarefa nasce concluída, sem novo download
+    registro = _registro_atendido_pelo_cache(task_id, download_data)
+    if registro is not None:
+        get_task_store().criar(**registro)
+        return "completed"
+
+    await _verificar_admissao()
+    _admitir_cliente(download_data, (task_id,))
+    get_task_store().criar(task_id, download_data)
+    try:
+        await get_execution_backend().submeter(task_id, download_data)
+    except Exception:
+        if download_data.get("client_id"):
+            get_limitador().liberar_cliente(download_data["client_id"], task_id)
+        raise
     
     download_logger.info(f"Tarefa de download {task_id} criada para URL: {download_data.get('video_url')}")
-    return task_id
+    return "pending"
+
+async def enqueue_batch_children(parent_id: str, payloads: List[dict]) -> List[str]:
+    """Cria e submete as tarefas filhas de um lote em bloco (uma transação, um envio)."""
+    registros, submissoes, child_ids = [], [], []
+    for payload in payloads:
+        task_id = str(uuid.uuid4())
+        child_ids.append(task_id)
+        payload = {**payload, "parent_id": parent_id}
+        registro = _registro_atendido_pelo_cache(task_id, payload)
+        if registro is None:
+            registro = {"task_id": task_id, "download_data": payload}
+            submissoes.append((task_id, payload))
+        registros.append(registro)
+
+    store = get_task_store()
+    store.criar_varios(registros)
+    await get_execution_backend().submeter_lote(submissoes)
+    store.adicionar_filhos(parent_id, child_ids)
+    return child_ids
+
+async def expand_playlist_task(parent_id: str, playlist_url: str, base_payload: dict):
+    """Expande a playlist após a resposta ao cliente e enfileira os itens em blocos."""
+    store = get_task_store()
+    try:
+        urls = await get_executor_extracao().executar(extrair_entradas_playlist, playlist_url, BATCH_MAX_ITEMS)
+        for inicio in range(0, len(urls), BATCH_ENQUEUE_CHUNK):
+            if get_cancelamentos().motivo(parent_id):
+                download_logger.info(f"Lote {parent_id} cancelado durante a expansão.", extra={"task_id": parent_id})
+                return
+            payloads = [{**base_payload, "video_url": url} for url in urls[inicio:inicio + BATCH_ENQUEUE_CHUNK]]
+            await enqueue_batch_children(parent_id, payloads)
+        store.atualizar(parent_id, expanding=False)
+        download_logger.info(
+            f"Playlist do lote {parent_id} expandida em {len(urls)} tarefas.",
+            extra={"task_id": parent_id, "children": len(urls)}
+        )
+    except Exception as e:
+        download_logger.error(
+            f"Falha ao expandir playlist do lote {parent_id}: {str(e)}",
+            extra={"task_id": parent_id, "video_url": playlist_url, "error": str(e)}
+        )
+        store.atualizar(parent_id, expanding=False, status="failed", error=f"Falha ao expandir playlist: {str(e)}")
+
+@router.post("/batch", response_model=TaskCreationResponse, status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_batch_download_endpoint(
+    request_data: BatchDownloadRequest, request: Request, background_tasks: BackgroundTasks
+):
+    correlation_id = correlation_id_var.get()
+    parent_id = str(uuid.uuid4())
+    payload = request_data.model_dump(mode="json")
+    payload["correlation_id"] = correlation_id
+    payload["client_id"] = identificar_cliente(request)
+
+    if request_data.requests and len(request_data.requests) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"O lote aceita no máximo {BATCH_MAX_ITEMS} itens"
+        )
+
+    await _verificar_admissao()
+    # O lote conta como uma requisição; as filhas são contidas pelos limites por domínio no worker
+    _admitir_cliente(payload)
+    store = get_task_store()
+    store.criar(parent_id, payload, kind="batch", children=[], expanding=bool(request_data.playlist_url))
+
+    if request_data.requests:
+        filhos = [{**item, "correlation_id": correlation_id} for item in payload["requests"]]
+        await enqueue_batch_children(parent_id, filhos)
+    else:
+        base_payload = {
+            "format": payload["format"],
+            "engine": payload["engine"],
+            "audio_only": payload["audio_only"],
+            "start_time": None,
+            "end_time": None,
+            "correlation_id": correlation_id,
+        }
+        background_tasks.add_task(expand_playlist_task, parent_id, payload["playlist_url"], base_payload)
+
+    download_logger.info(
+        f"Lote {parent_id} criado.",
+        extra={"correlation_id": correlation_id, "task_id": parent_id, "playlist": bool(request_data.playlist_url)}
+    )
+    return TaskCreationResponse(success=True, data={"task_id": parent_id, "status": "pending"})
+
+@router.post("/stream")
+async def stream_download_endpoint(
+    request_data: DownloadRequest, request: Request, save_copy: bool = STREAM_TEE_DEFAULT
+):
+    """
+    Entrega o vídeo enquanto ele é baixado, sem esperar o arquivo completo em disco.
+    Com `save_copy`, uma cópia é gravada e registrada no cache de resultados.
+    """
+    correlation_id = correlation_id_var.get()
+    task_id = str(uuid.uuid4())
+    payload = request_data.model_dump(mode="json")
+    payload["correlation_id"] = correlation_id
+    payload["client_id"] = identificar_cliente(request)
+    nome_download = f"download-{task_id}.{payload['format']}"
+    store = get_task_store()
+
+    # Resultado já armazenado: serve o arquivo pronto (com Range) em vez de baixar de novo
+    registro = _registro_atendido_pelo_cache(task_id, payload)
+    if registro is not None:
+        store.criar(**registro, kind="stream")
+        return entregar_resultado(request.headers, registro["file_path"], nome_download, request.method)
+
+    try:
+        comandos = montar_comandos(payload, await _info_para_transmissao(payload))
+    except RemuxIndisponivelError as e:
+        download_logger.error(str(e), extra={"correlation_id": correlation_id, "task_id": task_id})
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+
+    if save_copy:
+        await _verificar_admissao()
+    _admitir_cliente(payload, (task_id,))
+    store.criar(task_id, payload, kind="stream", status="processing")
+    chave_resultado = gerar_chave_resultado(payload)
+    destino = None
+    if save_copy:
+        os.makedirs(os.path.join("app", "download"), exist_ok=True)
+        destino = os.path.join("app", "download", f"{task_id}.{payload['format']}")
+
+    def ao_concluir(caminho, total_bytes):
+        campos = {"status": "completed", "progress": 100, "downloaded_bytes": total_bytes}
+        if caminho is not None:
+            get_result_cache().registrar(chave_resultado, caminho, task_id, total_bytes)
+            campos.update(file_path=caminho, download_url=f"/api/v1/download/{task_id}", result_cache_key=chave_resultado)
+        store.atualizar(task_id, **campos)
+        get_limitador().liberar_cliente(payload["client_id"], task_id)
+
+    def ao_falhar(motivo):
+        store.atualizar(task_id, status="failed", error=motivo)
+        get_limitador().liberar_cliente(payload["client_id"], task_id)
+
+    transmissao = TransmissaoDownload(comandos, destino, ao_concluir, ao_falhar)
+    try:
+        await transmissao.iniciar()
+    except TransmissaoError as e:
+        download_logger.error(
+            f"Falha ao iniciar transmissão de {request_data.video_url}: {str(e)}",
+            extra={"correlation_id": correlation_id, "task_id": task_id, "error": str(e)}
+        )
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Falha ao iniciar a transmissão: {str(e)}"
+        )
+
+    download_logger.info(
+        f"Transmissão {task_id} iniciada para {request_data.video_url}.",
+        extra={"correlation_id": correlation_id, "task_id": task_id, "save_copy": save_copy}
+    )
+    return StreamingResponse(
+        transmissao.corpo(),
+        media_type=tipo_de_midia(nome_download),
+        headers={"X-Task-ID": task_id, "Content-Disposition": f'attachment; filename="{nome_download}"'},
+    )
 
 @router.post("", response_model=TaskCreationResponse, status_code=status.HTTP_202_ACCEPTED)
 async def enqueue_download_task_endpoint(request_data: DownloadRequest, request: Request):
-    correlation_id = request.headers.get("X-Correlation-ID", str(uuid.uuid4()))
+    correlation_id = correlation_id_var.get()
     download_logger.info(
         "Requisição de download recebida.",
         extra={
@@ -55,20 +304,16 @@ async def enqueue_download_task_endpoint(request_data: DownloadRequest, request:
     )
     
     # Converter o modelo Pydantic para dicionário
-    task_payload_dict = request_data.dict()
-    task_payload_dict["video_url"] = str(request_data.video_url)  # Converter HttpUrl para string
+    # mode="json" converte HttpUrl e os Enums de formato/motor em strings simples
+    task_payload_dict = request_data.model_dump(mode="json")
     task_payload_dict["correlation_id"] = correlation_id
+    task_payload_dict["client_id"] = identificar_cliente(request)
     
     try:
         # Gerar ID único para a tarefa
         task_id = str(uuid.uuid4())
         
-        # Em produção, isso seria enviado para uma fila Celery
-        # task_instance = processar_download_video.delay(dados_requisicao_dict=task_payload_dict)
-        # task_id = task_instance.id
-        
-        # Por enquanto, processamos de forma síncrona (simulação)
-        await process_download_task(task_id, task_payload_dict)
+        task_status = await process_download_task(task_id, task_payload_dict)
         
         download_logger.info(
             f"Tarefa de download {task_id} criada e enfileirada para {request_data.video_url}.",
@@ -80,9 +325,11 @@ async def enqueue_download_task_endpoint(request_data: DownloadRequest, request:
             success=True,
             data={
                 "task_id": task_id,
-                "status": "pending"
+                "status": task_status
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         download_logger.error(
             f"Falha ao enfileirar tarefa de download para {request_data.video_url}: {str(e)}",
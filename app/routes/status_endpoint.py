@@ -1,30 +1,71 @@
 # app/routes/status_endpoint.py - Endpoint para consultar status de tarefas de download
 
 from fastapi import APIRouter, HTTPException, status, Request
+from app.core.logging_config import correlation_id_var
 from app.models.response_schemas import TaskStatusResponse, TaskStatusData
 from app.models.enums import TaskStatus
+from app.services.cancellation import cancelar_tarefa, get_cancelamentos
+from app.services.task_store import get_task_store
+from typing import Any, Dict, List, Tuple
 import logging
-import os
-import json
-import random
-from datetime import datetime, timedelta
 
 status_logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+_ESTADOS_TERMINAIS = {TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value}
+
+
+def _dados_da_tarefa(registro: Dict[str, Any]) -> TaskStatusData:
+    return TaskStatusData(
+        task_id=registro["task_id"],
+        status=TaskStatus(registro.get("status", "pending")),
+        progress=registro.get("progress"),
+        download_url=registro.get("download_url"),
+        error=registro.get("error"),
+    )
+
+
+def _agregar_lote(registro: Dict[str, Any]) -> Tuple[str, int, Dict[str, int], List[Dict[str, Any]]]:
+    """Calcula status, progresso e contagem por status de um lote a partir das tarefas filhas."""
+    filhos = get_task_store().obter_varios(registro.get("children") or [])
+    resumo: Dict[str, int] = {estado.value: 0 for estado in TaskStatus}
+    for filho in filhos:
+        resumo[filho["status"]] = resumo.get(filho["status"], 0) + 1
+    resumo["total"] = len(filhos)
+
+    progresso_total = sum(
+        100 if filho["status"] in _ESTADOS_TERMINAIS else (filho.get("progress") or 0)
+        for filho in filhos
+    )
+    progresso = int(progresso_total / len(filhos)) if filhos else 0
+
+    if registro.get("status") in (TaskStatus.FAILED.value, TaskStatus.CANCELLED.value):
+        # Falha na expansão da playlist e cancelamento do lote são registrados diretamente no pai
+        estado = registro["status"]
+    elif not filhos:
+        estado = TaskStatus.PROCESSING.value if registro.get("expanding") else TaskStatus.PENDING.value
+    elif registro.get("expanding") or any(f["status"] not in _ESTADOS_TERMINAIS for f in filhos):
+        todos_pendentes = all(f["status"] == TaskStatus.PENDING.value for f in filhos)
+        estado = TaskStatus.PENDING.value if todos_pendentes and not registro.get("expanding") else TaskStatus.PROCESSING.value
+    elif resumo[TaskStatus.COMPLETED.value] > 0:
+        estado = TaskStatus.COMPLETED.value
+    else:
+        estado = TaskStatus.FAILED.value
+    return estado, progresso, resumo, filhos
+
 @router.get("/{task_id}", response_model=TaskStatusResponse)
 async def get_download_task_status_endpoint(task_id: str, request: Request):
-    correlation_id = request.headers.get("X-Correlation-ID", "unknown")
+    correlation_id = correlation_id_var.get()
     status_logger.info(
         f"Consulta de status para tarefa {task_id}.",
         extra={"correlation_id": correlation_id, "task_id": task_id}
     )
     
-    # Verificar se existe um arquivo de tarefa para o task_id
-    task_file = os.path.join("app", "download", f"{task_id}.json")
-    
-    if not os.path.exists(task_file):
+    # Leitura somente em memória/SQLite; consultas de status nunca gravam em disco
+    task_data = get_task_store().obter(task_id)
+
+    if task_data is None:
         status_logger.warning(
             f"Tentativa de consultar status para tarefa inexistente: {task_id}.",
             extra={"correlation_id": correlation_id, "task_id": task_id}
@@ -33,56 +74,26 @@ async def get_download_task_status_endpoint(task_id: str, request: Request):
             status_code=status.HTTP_404_NOT_FOUND, 
             detail=f"Tarefa {task_id} não encontrada."
         )
+
+    # Consulta do cliente adia o cancelamento por inatividade (no-op se desativado)
+    get_cancelamentos().registrar_interesse(task_id)
     
     try:
-        # Ler dados da tarefa
-        with open(task_file, "r") as f:
-            task_data = json.load(f)
-        
-        # Verificar o tempo de criação para simular progresso
-        created_at = datetime.fromisoformat(task_data.get("created_at", datetime.now().isoformat()))
-        elapsed_seconds = (datetime.now() - created_at).total_seconds()
-        
-        # Simular progresso baseado no tempo decorrido
         task_status = task_data.get("status", "pending")
-        progress = None
-        download_url = None
-        error = None
-        
-        if elapsed_seconds < 5:
-            task_status = "pending"
-            progress = 0
-        elif elapsed_seconds < 15:
-            task_status = "processing"
-            progress = min(int((elapsed_seconds - 5) * 10), 90)  # Progresso de 0 a 90%
-        else:
-            # Após 15 segundos, finalizar com sucesso (90% do tempo) ou falha (10% do tempo)
-            if random.random() < 0.9:  # 90% de chance de sucesso
-                task_status = "completed"
-                progress = 100
-                download_url = f"/api/v1/download/{task_id}"
-            else:
-                task_status = "failed"
-                error = "Erro simulado durante o download"
-        
-        # Atualizar o status no arquivo
-        task_data["status"] = task_status
-        task_data["progress"] = progress
-        task_data["download_url"] = download_url
-        task_data["error"] = error
-        task_data["updated_at"] = datetime.now().isoformat()
-        
-        with open(task_file, "w") as f:
-            json.dump(task_data, f)
+        progress = task_data.get("progress")
+        download_url = task_data.get("download_url")
+        error = task_data.get("error")
         
         # Criar resposta
-        task_status_data = TaskStatusData(
-            task_id=task_id,
-            status=TaskStatus(task_status),
-            progress=progress,
-            download_url=download_url,
-            error=error
-        )
+        task_status_data = _dados_da_tarefa(task_data)
+
+        if task_data.get("kind") == "batch":
+            # Uma única consulta para todas as filhas, em vez de um GET por item
+            task_status, progress, summary, filhos = _agregar_lote(task_data)
+            task_status_data.status = TaskStatus(task_status)
+            task_status_data.progress = progress
+            task_status_data.summary = summary
+            task_status_data.children = [_dados_da_tarefa(filho) for filho in filhos]
         
         status_logger.debug(
             f"Status retornado para tarefa {task_id}: {task_status}",
@@ -108,5 +119,32 @@ async def get_download_task_status_endpoint(task_id: str, request: Request):
             detail=f"Erro ao processar status da tarefa: {str(e)}"
         )
 
+@router.post("/{task_id}/cancel", response_model=TaskStatusResponse)
+async def cancel_download_task_endpoint(task_id: str, request: Request):
+    correlation_id = correlation_id_var.get()
+    registro = get_task_store().obter(task_id)
+    if registro is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tarefa {task_id} não encontrada.")
+    if registro.get("kind") == "stream":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Transmissões são canceladas encerrando a conexão.",
+        )
+    # O status gravado no pai de um lote não acompanha as filhas; vale o agregado
+    estado = _agregar_lote(registro)[0] if registro.get("kind") == "batch" else registro.get("status")
+    if estado in (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Tarefa {task_id} já terminou com status {estado}.",
+        )
+
+    # Idempotente: cancelar de novo devolve o registro já cancelado
+    registro = await cancelar_tarefa(task_id)
+    status_logger.info(
+        f"Cancelamento solicitado para tarefa {task_id}.",
+        extra={"correlation_id": correlation_id, "task_id": task_id}
+    )
+    return TaskStatusResponse(success=True, data=_dados_da_tarefa(registro))
+
 print("Comentário sobre como proteger o endpoint de status com API Key adicionado conceitualmente a app/routes/status_endpoint.py.")
 print("Comentários de logging conceitual adicionados/atualizados em app/routes/status_endpoint.py.")
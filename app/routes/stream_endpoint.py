@@ -0,0 +1,135 @@
+# app/routes/stream_endpoint.py - Streaming de progresso de tarefas via SSE e WebSocket
+
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from app.services.cancellation import get_cancelamentos
+from app.services.progress_pubsub import ESTADOS_FINAIS, get_progress_pubsub
+from app.services.task_store import get_task_store
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, Optional
+import json
+import logging
+import os
+import time
+
+import anyio
+
+stream_logger = logging.getLogger(__name__)
+
+# Intervalo de keep-alive quando nenhum evento chega
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get("STREAM_HEARTBEAT_SECONDS", "15"))
+# Sem eventos por este intervalo, o estado é relido do TaskStore (evento perdido ou pub/sub sem alcance)
+STREAM_POLL_SECONDS = float(os.environ.get("STREAM_POLL_SECONDS", "2"))
+
+router = APIRouter()
+
+
+def _snapshot(registro: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "task_id": registro["task_id"],
+        "status": registro.get("status"),
+        "progress": registro.get("progress"),
+        "downloaded_bytes": registro.get("downloaded_bytes"),
+        "total_bytes": registro.get("total_bytes"),
+        "download_url": registro.get("download_url"),
+        "error": registro.get("error"),
+    }
+
+
+async def _eventos_da_tarefa(task_id: str) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """
+    Gera o estado atual da tarefa seguido dos eventos publicados até um estado final.
+    Quando nada chega por STREAM_POLL_SECONDS, relê o TaskStore e emite o snapshot se ele
+    mudou, para que o stream avance e termine mesmo sem o evento. Produz None a cada
+    STREAM_HEARTBEAT_SECONDS sem eventos, para keep-alive.
+    """
+    # Assina antes de ler o snapshot para não perder eventos publicados entre as duas etapas
+    assinatura = await get_progress_pubsub().assinar(task_id)
+    cancelamentos = get_cancelamentos()
+    store = get_task_store()
+    try:
+        registro = store.obter(task_id)
+        if registro is None:
+            return
+        ultimo_snapshot = _snapshot(registro)
+        yield ultimo_snapshot
+        if registro.get("status") in ESTADOS_FINAIS:
+            return
+        ultimo_envio = time.monotonic()
+        while True:
+            # Um stream aberto conta como cliente acompanhando (gravação limitada por intervalo)
+            cancelamentos.registrar_interesse(task_id)
+            evento = await assinatura.proximo(min(STREAM_POLL_SECONDS, STREAM_HEARTBEAT_SECONDS))
+            if evento is None:
+                registro = store.obter(task_id)
+                if registro is None:
+                    return
+                if _snapshot(registro) != ultimo_snapshot:
+                    ultimo_snapshot = evento = _snapshot(registro)
+            if evento is not None:
+                ultimo_envio = time.monotonic()
+                yield evento
+                if evento.get("status") in ESTADOS_FINAIS:
+                    return
+            elif time.monotonic() - ultimo_envio >= STREAM_HEARTBEAT_SECONDS:
+                ultimo_envio = time.monotonic()
+                yield None
+    finally:
+        # Também roda quando o consumidor é cancelado (cliente desconectou)
+        with anyio.CancelScope(shield=True):
+            await assinatura.fechar()
+
+
+@router.get("/{task_id}/events")
+async def stream_task_events_endpoint(task_id: str, request: Request):
+    if get_task_store().obter(task_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Tarefa {task_id} não encontrada.")
+
+    stream_logger.info(f"Stream SSE aberto para tarefa {task_id}.", extra={"task_id": task_id})
+
+    async def gerar_sse() -> AsyncIterator[str]:
+        async for evento in _eventos_da_tarefa(task_id):
+            if await request.is_disconnected():
+                return
+            if evento is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: progress\ndata: {json.dumps(evento)}\n\n"
+
+    return StreamingResponse(
+        gerar_sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/{task_id}/ws")
+async def websocket_task_events_endpoint(websocket: WebSocket, task_id: str):
+    if get_task_store().obter(task_id) is None:
+        await websocket.close(code=4404)
+        return
+
+    await websocket.accept()
+    stream_logger.info(f"WebSocket aberto para tarefa {task_id}.", extra={"task_id": task_id})
+
+    async def enviar_eventos(grupo: anyio.abc.TaskGroup) -> None:
+        async with aclosing(_eventos_da_tarefa(task_id)) as eventos:
+            async for evento in eventos:
+                if evento is not None:
+                    await websocket.send_json(evento)
+        await websocket.close()
+        grupo.cancel_scope.cancel()
+
+    async def aguardar_desconexao(grupo: anyio.abc.TaskGroup) -> None:
+        # Sem eventos nada é enviado; só a leitura percebe que o cliente foi embora
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        stream_logger.debug(f"Cliente desconectou do WebSocket da tarefa {task_id}.")
+        grupo.cancel_scope.cancel()
+
+    try:
+        async with anyio.create_task_group() as grupo:
+            grupo.start_soon(enviar_eventos, grupo)
+            grupo.start_soon(aguardar_desconexao, grupo)
+    except WebSocketDisconnect:
+        stream_logger.debug(f"Cliente desconectou do WebSocket da tarefa {task_id}.")
@@ -0,0 +1,138 @@
+"""Caminho rápido para pedidos só de áudio: nunca baixa vídeo e só transcodifica quando precisa."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import logging
+import os
+import subprocess
+import threading
+
+from app.services.cancellation import TarefaCanceladaError
+
+audio_logger = logging.getLogger(__name__)
+
+# Processos ffmpeg de transcodificação simultâneos (cada um limitado a uma thread)
+AUDIO_TRANSCODE_WORKERS = int(os.environ.get("AUDIO_TRANSCODE_WORKERS", str(os.cpu_count() or 2)))
+
+FORMATOS_AUDIO = {"mp3", "m4a", "aac", "ogg", "wav"}
+
+# Codecs que cada contêiner aceita sem transcodificar
+_CODECS_NATIVOS: Dict[str, tuple] = {
+    "mp3": ("mp3",),
+    "m4a": ("mp4a", "aac"),
+    "aac": ("mp4a", "aac"),
+    "ogg": ("opus", "vorbis"),
+    "wav": (),
+}
+
+# Preferência de formato de origem: o codec nativo do contêiner pedido evita a transcodificação
+_SELETORES: Dict[str, str] = {
+    "mp3": "bestaudio[acodec=mp3]/bestaudio/best",
+    "m4a": "bestaudio[ext=m4a]/bestaudio[acodec^=mp4a]/bestaudio/best",
+    "aac": "bestaudio[acodec^=mp4a]/bestaudio/best",
+    "ogg": "bestaudio[acodec=opus]/bestaudio[acodec=vorbis]/bestaudio/best",
+    "wav": "bestaudio/best",
+}
+
+_MUXER: Dict[str, str] = {"mp3": "mp3", "m4a": "ipod", "aac": "adts", "ogg": "ogg", "wav": "wav"}
+
+_CODEC_SAIDA: Dict[str, List[str]] = {
+    "mp3": ["-c:a", "libmp3lame", "-q:a", "2"],
+    "m4a": ["-c:a", "aac", "-b:a", "192k"],
+    "aac": ["-c:a", "aac", "-b:a", "192k"],
+    "ogg": ["-c:a", "libopus", "-b:a", "128k"],
+    "wav": ["-c:a", "pcm_s16le"],
+}
+
+NENHUMA = "nenhuma"
+REMUX = "remux"
+TRANSCODIFICAR = "transcodificar"
+
+
+def e_pedido_de_audio(dados_requisicao: Dict[str, Any]) -> bool:
+    return bool(dados_requisicao.get("audio_only")) or dados_requisicao.get("format") in FORMATOS_AUDIO
+
+
+def formato_de_saida(dados_requisicao: Dict[str, Any]) -> str:
+    """Contêiner final; `audio_only` com formato de vídeo (ex.: mp4) gera m4a."""
+    formato = dados_requisicao.get("format")
+    return formato if formato in FORMATOS_AUDIO else "m4a"
+
+
+def seletor_audio(formato: str) -> str:
+    return _SELETORES.get(formato, "bestaudio/best")
+
+
+def planejar_conversao(acodec: Optional[str], extensao: Optional[str], formato: str) -> str:
+    """
+    Decide o trabalho mínimo para entregar `formato`: nada se o arquivo já está no
+    contêiner certo, remux (cópia do fluxo) se só o contêiner difere, e transcodificação
+    apenas quando o codec de origem não cabe no contêiner pedido.
+    """
+    codec = (acodec or "").lower()
+    if not any(codec.startswith(nativo) for nativo in _CODECS_NATIVOS.get(formato, ())):
+        return TRANSCODIFICAR
+    return NENHUMA if extensao == formato else REMUX
+
+
+def _executar_ffmpeg(argumentos: List[str], cancelado: Optional[Callable[[], bool]] = None) -> None:
+    """Roda o ffmpeg; com `cancelado`, checa-o a cada meio segundo e mata o processo se der True."""
+    processo = subprocess.Popen(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y", *argumentos],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    while True:
+        try:
+            _, erros = processo.communicate(timeout=0.5 if cancelado is not None else None)
+            break
+        except subprocess.TimeoutExpired:
+            if cancelado():
+                processo.kill()
+                processo.communicate()
+                raise TarefaCanceladaError("ffmpeg interrompido pelo cancelamento da tarefa")
+    if processo.returncode != 0:
+        raise RuntimeError(f"ffmpeg falhou: {erros.decode('utf-8', 'replace').strip()}")
+
+
+_pool_transcodificacao: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool_transcodificacao() -> ThreadPoolExecutor:
+    global _pool_transcodificacao
+    # Workers em threads chegam aqui juntos; dois pools dobrariam o limite de AUDIO_TRANSCODE_WORKERS
+    if _pool_transcodificacao is None:
+        with _pool_lock:
+            if _pool_transcodificacao is None:
+                _pool_transcodificacao = ThreadPoolExecutor(
+                    max_workers=AUDIO_TRANSCODE_WORKERS, thread_name_prefix="transcodificacao"
+                )
+    return _pool_transcodificacao
+
+
+def finalizar_audio(
+    origem: str, acodec: Optional[str], formato: str, cancelado: Optional[Callable[[], bool]] = None
+) -> str:
+    """
+    Converte o áudio baixado para `formato` com o menor custo possível; retorna o caminho final.
+    `cancelado` é repassado ao ffmpeg para interromper a conversão de uma tarefa cancelada.
+    """
+    extensao = os.path.splitext(origem)[1].lstrip(".").lower()
+    plano = planejar_conversao(acodec, extensao, formato)
+    audio_logger.info("Plano de conversão de áudio", extra={"acodec": acodec, "source_ext": extensao, "plan": plano})
+    if plano == NENHUMA:
+        return origem
+
+    destino = f"{os.path.splitext(origem)[0]}.{formato}"
+    if destino == origem:
+        destino = f"{os.path.splitext(origem)[0]}.out.{formato}"
+    entrada = ["-i", origem, "-vn", "-map", "0:a:0"]
+    saida = ["-f", _MUXER[formato], destino]
+    if plano == REMUX:
+        # Cópia do fluxo é limitada por I/O; não ocupa o pool de CPU
+        _executar_ffmpeg([*entrada, "-c:a", "copy", *saida], cancelado)
+    else:
+        argumentos = [*entrada, "-threads", "1", *_CODEC_SAIDA[formato], *saida]
+        _get_pool_transcodificacao().submit(_executar_ffmpeg, argumentos, cancelado).result()
+    os.remove(origem)
+    return destino
@@ -0,0 +1,207 @@
+"""Cancelamento de tarefas: sinal compartilhado entre API e workers, checado de forma cooperativa."""
+from typing import Any, Dict, Optional
+import logging
+import os
+import threading
+import time
+
+import anyio
+
+from app.core.database import DATABASE_PATH, conectar_sqlite
+from app.core.metrics import tasks_cancelled_total
+from app.models.enums import TaskStatus
+from app.services.execution_backend import get_execution_backend
+from app.services.progress_pubsub import ESTADOS_FINAIS, get_progress_pubsub
+from app.services.rate_limiter import get_limitador
+from app.services.storage_manager import remover_parciais
+from app.services.task_store import get_task_store
+
+cancel_logger = logging.getLogger(__name__)
+
+# Intervalo mínimo entre consultas ao sinal feitas pelos hooks do worker
+CANCEL_CHECK_INTERVAL = float(os.environ.get("CANCEL_CHECK_INTERVAL", "1"))
+# Cancela tarefas que nenhum cliente consultou (status, SSE ou WebSocket) neste período; 0 desativa
+TASK_IDLE_CANCEL_AFTER = float(os.environ.get("TASK_IDLE_CANCEL_AFTER", "0"))
+# Cada processo da API grava a última consulta de uma tarefa no máximo uma vez por intervalo
+TASK_IDLE_TOUCH_INTERVAL = float(os.environ.get("TASK_IDLE_TOUCH_INTERVAL", "30"))
+# Sinais vivem tanto quanto os registros de tarefa que o zelador mantém
+_SINAL_TTL = int(os.environ.get("TASK_RECORD_TTL", str(7 * 24 * 3600)))
+
+MOTIVO_CLIENTE = "cancelled by client"
+MOTIVO_INATIVIDADE = "cancelled: no client activity"
+
+
+class TarefaCanceladaError(Exception):
+    """A tarefa foi cancelada; quem a executa deve parar e descartar o que produziu."""
+
+
+class CancelamentoStore:
+    """
+    Pedido de cancelamento e última atividade do cliente por tarefa, no SQLite compartilhado.
+
+    Fica fora do registro da tarefa porque o worker regrava o registro inteiro a cada
+    atualização de progresso e poderia desfazer um cancelamento feito pela API; aqui
+    cada lado grava só a própria coluna.
+    """
+
+    def __init__(self, caminho: str = DATABASE_PATH):
+        self._conexao = conectar_sqlite(caminho)
+        self._lock = threading.Lock()
+        self._ultimo_toque: Dict[str, float] = {}
+        self._conexao.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS task_signals (
+                task_id TEXT PRIMARY KEY,
+                cancel_reason TEXT,
+                cancelled_at REAL,
+                client_seen_at REAL
+            );
+            """
+        )
+
+    def _expirar(self) -> None:
+        self._conexao.execute(
+            "DELETE FROM task_signals WHERE MAX(COALESCE(cancelled_at, 0), COALESCE(client_seen_at, 0)) < ?",
+            (time.time() - _SINAL_TTL,),
+        )
+
+    def solicitar(self, task_id: str, motivo: str) -> bool:
+        """Grava o pedido de cancelamento; False se a tarefa já tinha um."""
+        with self._lock:
+            self._expirar()
+            cursor = self._conexao.execute(
+                "INSERT INTO task_signals (task_id, cancel_reason, cancelled_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(task_id) DO UPDATE SET cancel_reason = excluded.cancel_reason, "
+                "cancelled_at = excluded.cancelled_at WHERE task_signals.cancel_reason IS NULL",
+                (task_id, motivo, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def obter(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT cancel_reason, client_seen_at FROM task_signals WHERE task_id = ?", (task_id,)
+            ).fetchone()
+        return dict(linha) if linha is not None else None
+
+    def motivo(self, task_id: str) -> Optional[str]:
+        sinais = self.obter(task_id)
+        return sinais["cancel_reason"] if sinais else None
+
+    def registrar_interesse(self, task_id: str) -> None:
+        """Marca que um cliente ainda acompanha a tarefa; só grava com o auto-cancelamento ativo."""
+        if TASK_IDLE_CANCEL_AFTER <= 0:
+            return
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._ultimo_toque.get(task_id, float("-inf")) < TASK_IDLE_TOUCH_INTERVAL:
+                return
+            if len(self._ultimo_toque) > 4096:
+                self._ultimo_toque.clear()
+            self._ultimo_toque[task_id] = agora
+            self._expirar()
+            self._conexao.execute(
+                "INSERT INTO task_signals (task_id, client_seen_at) VALUES (?, ?) "
+                "ON CONFLICT(task_id) DO UPDATE SET client_seen_at = excluded.client_seen_at",
+                (task_id, time.time()),
+            )
+
+
+_cancelamentos: Optional[CancelamentoStore] = None
+
+
+def get_cancelamentos() -> CancelamentoStore:
+    global _cancelamentos
+    if _cancelamentos is None:
+        _cancelamentos = CancelamentoStore()
+    return _cancelamentos
+
+
+class VerificadorCancelamento:
+    """
+    Checagem cooperativa dentro do worker. Hooks de progresso e de pós-processamento do
+    yt-dlp, o motor segmentado e o ffmpeg chamam `verificar()`, que consulta o sinal no
+    máximo a cada CANCEL_CHECK_INTERVAL e levanta TarefaCanceladaError. Com
+    TASK_IDLE_CANCEL_AFTER, a tarefa sem consulta de cliente desde `criado_em` (epoch)
+    por mais que o limite se cancela sozinha.
+    """
+
+    def __init__(self, task_id: str, criado_em: Optional[float] = None, intervalo: Optional[float] = None):
+        self.task_id = task_id
+        self.motivo: Optional[str] = None
+        self._criado_em = criado_em or time.time()
+        self._intervalo = CANCEL_CHECK_INTERVAL if intervalo is None else intervalo
+        self._proxima_consulta = 0.0
+
+    def cancelado(self, forcar: bool = False) -> bool:
+        if self.motivo is not None:
+            return True
+        agora = time.monotonic()
+        if not forcar and agora < self._proxima_consulta:
+            return False
+        self._proxima_consulta = agora + self._intervalo
+        sinais = get_cancelamentos().obter(self.task_id) or {}
+        self.motivo = sinais.get("cancel_reason") or self._motivo_inatividade(sinais.get("client_seen_at"))
+        return self.motivo is not None
+
+    def _motivo_inatividade(self, visto_em: Optional[float]) -> Optional[str]:
+        if TASK_IDLE_CANCEL_AFTER <= 0:
+            return None
+        if time.time() - max(visto_em or 0.0, self._criado_em) <= TASK_IDLE_CANCEL_AFTER:
+            return None
+        cancelamentos = get_cancelamentos()
+        if cancelamentos.solicitar(self.task_id, MOTIVO_INATIVIDADE):
+            tasks_cancelled_total.labels("idle").inc()
+            cancel_logger.info("Tarefa sem cliente acompanhando; cancelando", extra={"task_id": self.task_id})
+        # Um cancelamento do cliente gravado no mesmo instante prevalece
+        return cancelamentos.motivo(self.task_id)
+
+    def verificar(self) -> None:
+        if self.cancelado():
+            raise TarefaCanceladaError(self.motivo)
+
+    def hook(self, _dados: Dict[str, Any]) -> None:
+        """Assinatura de `progress_hooks`/`postprocessor_hooks` do yt-dlp."""
+        self.verificar()
+
+
+async def cancelar_tarefa(task_id: str, motivo: str = MOTIVO_CLIENTE) -> Optional[Dict[str, Any]]:
+    """
+    Cancela a tarefa (num lote, todas as filhas ainda não terminadas): grava o sinal lido
+    pelo worker, marca o registro, retira a tarefa da fila do backend e libera o slot do
+    cliente. Parciais de tarefas que ainda não tinham começado saem aqui; as em andamento
+    são limpas pelo próprio worker ao abortar. Retorna o registro (None se não existe).
+    """
+    store = get_task_store()
+    registro = store.obter(task_id)
+    if registro is None or registro.get("status") in ESTADOS_FINAIS:
+        return registro
+
+    lote = registro.get("kind") == "batch"
+    if lote:
+        for filho in store.obter_varios(registro.get("children") or []):
+            if filho["status"] not in ESTADOS_FINAIS:
+                await cancelar_tarefa(filho["task_id"], motivo)
+    # No lote, o sinal também interrompe a expansão da playlist
+    if get_cancelamentos().solicitar(task_id, motivo) and not lote:
+        tasks_cancelled_total.labels("client").inc()
+
+    pendente = registro.get("status") == TaskStatus.PENDING.value
+    registro = store.atualizar(task_id, status=TaskStatus.CANCELLED.value, error=motivo)
+    try:
+        get_progress_pubsub().publicar(task_id, {"task_id": task_id, "status": TaskStatus.CANCELLED.value, "error": motivo})
+    except Exception as exc:
+        # O registro já diz cancelled; streams abertos o encontram ao reler o TaskStore
+        cancel_logger.warning("Falha ao publicar cancelamento", extra={"task_id": task_id, "error": str(exc)})
+    cancel_logger.info("Tarefa cancelada", extra={"task_id": task_id, "reason": motivo})
+    if lote:
+        return registro
+
+    await get_execution_backend().cancelar(task_id)
+    cliente = (registro.get("download_data") or {}).get("client_id")
+    if cliente:
+        get_limitador().liberar_cliente(cliente, task_id)
+    if pendente:
+        # Uma tentativa anterior (reentrega) pode ter deixado parciais
+        await anyio.to_thread.run_sync(remover_parciais, task_id)
+    return registro
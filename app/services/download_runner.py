@@ -0,0 +1,375 @@
+"""Execução de uma tarefa de download, independente do mecanismo de fila."""
+from app.core.metrics import (
+    download_bytes_total,
+    download_duration_seconds,
+    download_throughput_bytes_per_second,
+    task_queue_wait_seconds,
+)
+from app.services.audio_pipeline import (
+    TRANSCODIFICAR,
+    e_pedido_de_audio,
+    finalizar_audio,
+    formato_de_saida,
+    planejar_conversao,
+    seletor_audio,
+)
+from app.services.cancellation import TarefaCanceladaError, VerificadorCancelamento
+from app.services.engine_manager import extrair_dominio, selecionar_motores_para_url
+from app.services.engine_stats import MedidorDownload, get_engine_stats
+from app.services.extraction_service import obter_info_video_sincrono
+from app.services.info_handles import get_info_handles
+from app.services.metadata_cache import get_metadata_cache
+from app.services.progress_pubsub import PublicadorProgresso
+from app.services.rate_limiter import get_limitador
+from app.services.result_cache import gerar_chave_resultado, get_result_cache
+from app.services.result_storage import PublicacaoResultadoError, get_armazenamento_resultados
+from app.services.segmented_downloader import baixar_segmentado, selecionar_formato_progressivo
+from app.services.storage_manager import remover_arquivos_da_tarefa, remover_parciais
+from app.services.task_store import get_task_store
+from app.services.trimming import (
+    estimar_tamanho_completo,
+    get_metricas_recorte,
+    intervalo_recorte,
+    opcoes_recorte_ytdlp,
+)
+from datetime import datetime
+import logging
+import os
+import time
+from yt_dlp import YoutubeDL
+
+runner_logger = logging.getLogger(__name__)
+
+
+def _info_do_handle(dados_requisicao_dict: dict) -> dict:
+    """Extração feita em /video/options, se o pedido trouxe um handle ainda válido para o vídeo."""
+    handle = dados_requisicao_dict.get('info_handle')
+    if not handle:
+        return None
+    info = get_info_handles().obter(handle, dados_requisicao_dict.get('video_url') or '')
+    if info is None:
+        runner_logger.info("Handle de info expirado ou inválido, extraindo novamente", extra={"info_handle": handle})
+    return info
+
+
+def seletor_por_format_id(format_id: str, info: dict = None) -> str:
+    """Seletor do yt-dlp para o formato escolhido; formatos só de vídeo recebem o melhor áudio."""
+    formato = next((f for f in (info or {}).get('formats') or [] if f.get('format_id') == format_id), None)
+    if formato and formato.get('acodec') == 'none' and formato.get('vcodec') != 'none':
+        return f"{format_id}+bestaudio/{format_id}"
+    return format_id
+
+
+def _formato_so_de_audio(format_id: str, info: dict = None) -> bool:
+    formato = next((f for f in (info or {}).get('formats') or [] if f.get('format_id') == format_id), None)
+    return bool(formato) and formato.get('vcodec') == 'none' and formato.get('acodec') != 'none'
+
+
+def _baixar_com_ytdlp(ydl: YoutubeDL, video_url: str, info: dict = None) -> dict:
+    """Baixa a partir dos metadados já extraídos (handle ou cache), reextraindo se estiverem expirados."""
+    if info is None:
+        info = obter_info_video_sincrono(video_url)
+    try:
+        return ydl.process_ie_result(info, download=True)
+    except TarefaCanceladaError:
+        raise
+    except Exception as e:
+        # URLs assinadas no handle ou no cache podem ter expirado; tenta com extração nova
+        runner_logger.info(f"Metadados em cache falharam para {video_url}, reextraindo: {e}")
+        get_metadata_cache().remover(video_url)
+        return ydl.extract_info(video_url, download=True)
+
+
+def _baixar_com_segmentado(
+    task_id: str, dados_requisicao_dict: dict, output_dir: str, ao_progredir, info: dict = None
+) -> tuple:
+    """Baixa o melhor formato progressivo HTTP com o motor segmentado nativo; retorna (caminho, formato)."""
+    video_url = dados_requisicao_dict.get('video_url')
+    if info is None:
+        info = obter_info_video_sincrono(video_url)
+    formato = selecionar_formato_progressivo(info, dados_requisicao_dict)
+    if formato is None:
+        raise ValueError("Nenhum formato progressivo HTTP disponível para o motor segmentado")
+    file_path = os.path.join(output_dir, f"{task_id}.{formato.get('ext') or 'bin'}")
+    headers = formato.get('http_headers') or info.get('http_headers') or {}
+    # Destino estável por tarefa: uma reentrega retoma o .part pelo checkpoint
+    identidade = f"{info.get('id')}:{formato.get('format_id')}"
+    baixar_segmentado(formato['url'], file_path, headers=headers, ao_progredir=ao_progredir, identidade=identidade)
+    return file_path, formato
+
+
+def _concluir_tarefa(
+    store, publicador, task_id: str, file_path: str, engine: str, chave_resultado: str, **campos
+) -> dict:
+    download_url = f"/api/v1/download/{task_id}"
+    store.atualizar(
+        task_id,
+        status='completed',
+        progress=100,
+        file_path=file_path,
+        engine_used=engine,
+        download_url=download_url,
+        result_cache_key=chave_resultado,
+        **campos,
+    )
+    publicador.publicar('completed', forcar=True, progress=100, download_url=download_url)
+    return {
+        'task_id': task_id,
+        'status': 'completed',
+        'file_path': file_path,
+        'engine_used': engine
+    }
+
+
+def _medir_recorte(info: dict, file_path: str, medidor: MedidorDownload) -> dict:
+    """Compara os bytes do trecho baixado com a estimativa do download completo."""
+    bytes_baixados = max(medidor.bytes, os.path.getsize(file_path))
+    bytes_completo = estimar_tamanho_completo(info)
+    economia = get_metricas_recorte().registrar(bytes_baixados, bytes_completo)
+    runner_logger.info(
+        "Download recortado concluído",
+        extra={"bytes_fetched": bytes_baixados, "bytes_full_estimate": bytes_completo, "bytes_saved": economia},
+    )
+    return {'bytes_fetched': bytes_baixados, 'bytes_saved': economia}
+
+
+def _registrar_tentativa(stats, domain: str, engine: str, sucesso: bool, medidor: MedidorDownload) -> None:
+    """Alimenta o EWMA usado na escolha de motores e as métricas Prometheus por motor."""
+    stats.registrar(domain, engine, sucesso, medidor.ttfb, medidor.vazao() if sucesso else None)
+    download_duration_seconds.labels(engine, 'success' if sucesso else 'failure').observe(
+        time.monotonic() - medidor.inicio
+    )
+    if sucesso and medidor.bytes:
+        download_bytes_total.labels(engine).inc(medidor.bytes)
+        download_throughput_bytes_per_second.labels(engine).observe(medidor.vazao())
+
+
+def _observar_espera_na_fila(registro: dict, fila: str) -> None:
+    try:
+        criado_em = datetime.fromisoformat(registro['created_at'])
+    except (KeyError, TypeError, ValueError):
+        return
+    task_queue_wait_seconds.labels(fila).observe(max((datetime.now() - criado_em).total_seconds(), 0))
+
+
+def _publicar_resultado(chave_resultado: str, file_path: str, task_id: str) -> str:
+    """Envia o arquivo pronto ao armazenamento de resultados e o registra no cache; devolve o localizador."""
+    tamanho = os.path.getsize(file_path)
+    localizador = get_armazenamento_resultados().publicar(file_path)
+    get_result_cache().registrar(chave_resultado, localizador, task_id, tamanho)
+    return localizador
+
+
+def _falhar_tarefa(store, publicador, task_id: str, erro: str) -> dict:
+    store.atualizar(task_id, status='failed', error=erro)
+    publicador.publicar('failed', forcar=True, error=erro)
+    return {'task_id': task_id, 'status': 'failed', 'error': erro}
+
+
+def _criado_em(registro: dict) -> float:
+    try:
+        return datetime.fromisoformat(registro['created_at']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _abortar_cancelada(store, publicador, task_id: str, motivo: str) -> dict:
+    """Descarta tudo o que a tarefa produziu (nada foi para o cache) e confirma o cancelamento."""
+    remover_arquivos_da_tarefa(task_id, os.path.join('app', 'download'))
+    # Regrava o status: uma atualização de progresso concorrente pode ter desfeito o da API
+    store.atualizar(task_id, status='cancelled', error=motivo)
+    publicador.publicar('cancelled', forcar=True, error=motivo)
+    runner_logger.info(f"Tarefa {task_id} cancelada; worker liberado", extra={"task_id": task_id, "reason": motivo})
+    return {'task_id': task_id, 'status': 'cancelled', 'error': motivo}
+
+
+def _novo_publicador(store, task_id: str) -> PublicadorProgresso:
+    return PublicadorProgresso(
+        task_id,
+        ao_publicar=lambda campos: store.atualizar(
+            task_id,
+            progress=campos['progress'],
+            downloaded_bytes=campos['downloaded_bytes'],
+            total_bytes=campos['total_bytes'],
+        ),
+    )
+
+
+def concluir_pos_processamento(
+    task_id: str, file_path: str, acodec: str, formato_audio: str, chave_resultado: str, engine: str
+) -> dict:
+    """Transcodifica um áudio já baixado e conclui a tarefa (executado na fila de pós-processamento)."""
+    store = get_task_store()
+    publicador = _novo_publicador(store, task_id)
+    verificador = VerificadorCancelamento(task_id)
+    if verificador.cancelado(forcar=True):
+        return _abortar_cancelada(store, publicador, task_id, verificador.motivo)
+    try:
+        file_path = finalizar_audio(file_path, acodec, formato_audio, verificador.cancelado)
+        file_path = _publicar_resultado(chave_resultado, file_path, task_id)
+    except TarefaCanceladaError:
+        return _abortar_cancelada(store, publicador, task_id, verificador.motivo)
+    except Exception as e:
+        runner_logger.warning(f"Pós-processamento da tarefa {task_id} falhou: {e}")
+        return _falhar_tarefa(store, publicador, task_id, str(e))
+    return _concluir_tarefa(store, publicador, task_id, file_path, engine, chave_resultado)
+
+
+def executar_download(
+    task_id: str, dados_requisicao_dict: dict, agendar_pos_processamento=None, fila: str = 'in-process'
+) -> dict:
+    """
+    Executa uma tarefa de download; usada pelo Celery e pelo backend em processo.
+
+    Antes de tocar a origem reserva um slot no semáforo do domínio; sem slot, levanta
+    LimiteAtingidoError e quem executa deve reenfileirar a tarefa após `retry_after`.
+    Com `agendar_pos_processamento`, transcodificações de áudio são entregues a ele
+    (ex.: a fila Celery de pós-processamento) em vez de ocupar o worker de download.
+    `fila` só rotula a métrica de tempo de espera na fila.
+    Tarefas canceladas (ver app/services/cancellation.py) param no próximo hook de
+    progresso ou checagem do ffmpeg e retornam com status "cancelled".
+    """
+    domain = extrair_dominio(dados_requisicao_dict.get('video_url') or '')
+    limitador = get_limitador()
+    store = get_task_store()
+    verificador = VerificadorCancelamento(task_id, _criado_em(store.obter(task_id) or {}))
+    if verificador.cancelado(forcar=True):
+        # Cancelada ainda na fila: não reserva slot no domínio nem toca a origem
+        if dados_requisicao_dict.get('client_id'):
+            limitador.liberar_cliente(dados_requisicao_dict['client_id'], task_id)
+        return _abortar_cancelada(store, _novo_publicador(store, task_id), task_id, verificador.motivo)
+    limitador.iniciar_no_dominio(domain, task_id)
+    try:
+        return _executar_download(task_id, dados_requisicao_dict, agendar_pos_processamento, fila, verificador)
+    finally:
+        limitador.liberar_dominio(domain, task_id)
+        if dados_requisicao_dict.get('client_id'):
+            limitador.liberar_cliente(dados_requisicao_dict['client_id'], task_id)
+
+
+def _executar_download(
+    task_id: str, dados_requisicao_dict: dict, agendar_pos_processamento=None, fila: str = 'in-process',
+    verificador: VerificadorCancelamento = None,
+) -> dict:
+    video_url = dados_requisicao_dict.get('video_url')
+    engine_client = dados_requisicao_dict.get('engine')
+
+    store = get_task_store()
+    registro = store.obter(task_id)
+    if registro is None:
+        store.criar(task_id, dados_requisicao_dict)
+    else:
+        _observar_espera_na_fila(registro, fila)
+    if verificador is None:
+        verificador = VerificadorCancelamento(task_id, _criado_em(registro or {}))
+    store.atualizar(task_id, status='processing')
+    publicador = _novo_publicador(store, task_id)
+    publicador.publicar('processing', forcar=True, progress=0)
+
+    cache_resultados = get_result_cache()
+    chave_resultado = gerar_chave_resultado(dados_requisicao_dict)
+    entrada = cache_resultados.buscar(chave_resultado)
+    if entrada is not None:
+        runner_logger.info(f"Resultado em cache reutilizado para {video_url}")
+        cache_resultados.adicionar_referencia(chave_resultado, task_id)
+        return _concluir_tarefa(
+            store, publicador, task_id, entrada['file_path'], 'result-cache', chave_resultado
+        )
+
+    engines = selecionar_motores_para_url(video_url, engine_client)
+    intervalo = intervalo_recorte(dados_requisicao_dict)
+    if intervalo is not None:
+        # O motor segmentado só baixa o arquivo inteiro; recortes ficam com o yt-dlp
+        engines = [engine for engine in engines if engine != 'segmented'] or ['yt-dlp']
+    output_dir = os.path.join('app', 'download')
+    os.makedirs(output_dir, exist_ok=True)
+
+    domain = extrair_dominio(video_url)
+    stats = get_engine_stats()
+    # Pedidos de áudio baixam só a faixa de áudio e convertem com o menor custo possível
+    audio = e_pedido_de_audio(dados_requisicao_dict)
+    formato_audio = formato_de_saida(dados_requisicao_dict) if audio else None
+    # Com handle de /video/options o worker vai direto ao download, sem nova extração
+    info_previa = _info_do_handle(dados_requisicao_dict)
+    format_id = dados_requisicao_dict.get('format_id')
+
+    for engine in engines:
+        medidor = MedidorDownload()
+
+        def ao_progredir(d: dict) -> None:
+            verificador.verificar()
+            medidor.hook(d)
+            publicador.hook_ytdlp(d)
+
+        try:
+            if engine == 'segmented':
+                dados_motor = {**dados_requisicao_dict, 'audio_only': True} if audio else dados_requisicao_dict
+                file_path, formato_baixado = _baixar_com_segmentado(
+                    task_id, dados_motor, output_dir, ao_progredir, info_previa
+                )
+            else:
+                ydl_opts = {
+                    'outtmpl': os.path.join(output_dir, f"{task_id}.%(ext)s"),
+                    'progress_hooks': [ao_progredir],
+                    # Entre as etapas de merge/conversão do yt-dlp
+                    'postprocessor_hooks': [verificador.hook],
+                    # O template é estável por tarefa; numa reentrega o yt-dlp continua os .part
+                    # (e os fragmentos já baixados, via .ytdl) em vez de recomeçar do zero
+                    'continuedl': True,
+                }
+                if intervalo is not None:
+                    ydl_opts.update(opcoes_recorte_ytdlp(intervalo))
+                info_formatos = (info_previa or get_metadata_cache().obter(video_url)) if format_id else None
+                if audio:
+                    # Um format_id com vídeo baixaria vídeo num pedido de áudio; só vale se for só áudio
+                    ydl_opts['format'] = (
+                        format_id if _formato_so_de_audio(format_id, info_formatos) else seletor_audio(formato_audio)
+                    )
+                elif format_id:
+                    ydl_opts['format'] = seletor_por_format_id(format_id, info_formatos)
+                with YoutubeDL(ydl_opts) as ydl:
+                    info = _baixar_com_ytdlp(ydl, video_url, info_previa)
+                # Após merge/pós-processamento a extensão final pode diferir do template
+                downloads = info.get('requested_downloads') or [{}]
+                file_path = downloads[0].get('filepath') or ydl.prepare_filename(info)
+                formato_baixado = {**info, **downloads[0]}
+            if audio:
+                acodec = formato_baixado.get('acodec')
+                extensao = os.path.splitext(file_path)[1].lstrip('.').lower()
+                verificador.verificar()
+                if agendar_pos_processamento is not None and planejar_conversao(acodec, extensao, formato_audio) == TRANSCODIFICAR:
+                    _registrar_tentativa(stats, domain, engine, True, medidor)
+                    agendar_pos_processamento(task_id, file_path, acodec, formato_audio, chave_resultado, engine)
+                    runner_logger.info(f"Transcodificação da tarefa {task_id} enviada ao pós-processamento")
+                    return {'task_id': task_id, 'status': 'processing', 'file_path': file_path, 'engine_used': engine}
+                file_path = finalizar_audio(file_path, acodec, formato_audio, verificador.cancelado)
+            # Última chance antes de publicar o resultado no cache
+            verificador.verificar()
+            runner_logger.info(f"Download concluído com {engine} para {video_url}")
+            _registrar_tentativa(stats, domain, engine, True, medidor)
+            campos = {}
+            if intervalo is not None:
+                campos = _medir_recorte(info, file_path, medidor)
+            # Com object storage o arquivo sai do disco do worker e file_path vira s3://...
+            file_path = _publicar_resultado(chave_resultado, file_path, task_id)
+            # Parciais de motores que falharam antes deste não serão mais retomados
+            remover_parciais(task_id, output_dir)
+            return _concluir_tarefa(store, publicador, task_id, file_path, engine, chave_resultado, **campos)
+        except Exception as e:
+            # O yt-dlp pode embrulhar a exceção do hook; o sinal decide
+            if isinstance(e, TarefaCanceladaError) or verificador.cancelado(forcar=True):
+                return _abortar_cancelada(store, publicador, task_id, verificador.motivo)
+            if isinstance(e, PublicacaoResultadoError):
+                # O download funcionou; outro motor não resolveria uma falha do armazenamento
+                runner_logger.error(f"Resultado da tarefa {task_id} não foi publicado: {e}")
+                remover_arquivos_da_tarefa(task_id, output_dir)
+                return _falhar_tarefa(store, publicador, task_id, str(e))
+            runner_logger.warning(f"Motor {engine} falhou para {video_url}: {e}")
+            _registrar_tentativa(stats, domain, engine, False, medidor)
+            if info_previa is not None:
+                # As URLs assinadas do handle podem ter expirado; os próximos motores extraem de novo
+                info_previa = None
+                get_info_handles().remover(dados_requisicao_dict['info_handle'])
+            continue
+    remover_parciais(task_id, output_dir)
+    return _falhar_tarefa(store, publicador, task_id, 'all engines failed')
@@ -1,18 +1,137 @@
-"""Gerencia escolha de motores de download."""
-from typing import List, Dict, Optional
+"""Gerencia escolha de motores de download e o roteamento de URLs (domínio e vídeo canônicos)."""
+from functools import lru_cache
+from typing import Callable, List, Dict, NamedTuple, Optional, Tuple
 import urllib.parse
 import logging
+import os
+import re
+
+from app.services.engine_stats import get_engine_stats
 
 engine_logger = logging.getLogger(__name__)
 
+# Ordem padrão de tentativa; reordenada em tempo de execução pelas estatísticas observadas
 REGISTRY_DE_MOTORES: Dict[str, List[str]] = {
     "youtube.com": ["yt-dlp"],
     "youtu.be": ["yt-dlp"],
-    "vimeo.com": ["yt-dlp"],
-    "DEFAULT": ["yt-dlp"],
+    "vimeo.com": ["yt-dlp", "segmented"],
+    "DEFAULT": ["yt-dlp", "segmented"],
 }
 
-MOTORES_SUPORTADOS: List[str] = ["yt-dlp"]
+# "segmented" é o motor nativo multi-conexão (app/services/segmented_downloader.py),
+# usado para formatos progressivos HTTP.
+MOTORES_SUPORTADOS: List[str] = ["yt-dlp", "segmented"]
+
+# URLs distintas lembradas pelo roteador; cada entrada custa algumas centenas de bytes
+URL_ROUTER_CACHE_SIZE = int(os.environ.get("URL_ROUTER_CACHE_SIZE", "65536"))
+
+_ID_VIDEO = re.compile(r"[A-Za-z0-9_-]+")
+_ID_NUMERICO = re.compile(r"[0-9]+")
+
+
+class RotaURL(NamedTuple):
+    """Resultado do roteamento: domínio registrado (chave de motores e estatísticas) e vídeo canônico."""
+
+    dominio: str
+    site: Optional[str]
+    video_id: Optional[str]
+    chave: str
+
+
+def _id_youtube(dominio: str, partes: Tuple[str, ...], consulta: str) -> Optional[str]:
+    if partes == ("watch",):
+        candidato = urllib.parse.parse_qs(consulta).get("v", [None])[0]
+    elif len(partes) >= 2 and partes[0] in ("shorts", "embed", "live", "v", "e"):
+        candidato = partes[1]
+    elif dominio == "youtu.be" and len(partes) == 1:
+        # Em youtube.com um único segmento é canal ou página (/@canal, /feed), sem id
+        candidato = partes[0]
+    else:
+        return None
+    return candidato if candidato and _ID_VIDEO.fullmatch(candidato) else None
+
+
+def _id_vimeo(dominio: str, partes: Tuple[str, ...], consulta: str) -> Optional[str]:
+    # player.vimeo.com/video/<id> e vimeo.com/showcase|album/<coleção>/video/<id>: o id segue "video"
+    for anterior, parte in zip(partes, partes[1:]):
+        if anterior in ("video", "videos") and _ID_NUMERICO.fullmatch(parte):
+            return parte
+    # vimeo.com/<id>, vimeo.com/channels/<canal>/<id>, vimeo.com/groups/<grupo>/videos/<id>
+    for parte in reversed(partes):
+        if _ID_NUMERICO.fullmatch(parte):
+            return parte
+    return None
+
+
+# site -> (domínios cobertos, incluindo subdomínios; extrator do id a partir do domínio, caminho e query)
+SITES_CANONICOS: Dict[str, Tuple[Tuple[str, ...], Callable[[str, Tuple[str, ...], str], Optional[str]]]] = {
+    "youtube": (("youtube.com", "youtu.be", "youtube-nocookie.com"), _id_youtube),
+    "vimeo": (("vimeo.com",), _id_vimeo),
+}
+
+
+def _compilar_arvore() -> Dict[str, dict]:
+    """
+    Árvore de sufixos de domínio, rótulo a rótulo do fim para o começo (com -> youtube).
+    O nó de um domínio registrado guarda ("" ->) o par (domínio registrado, site).
+    """
+    arvore: Dict[str, dict] = {}
+    registrados = {dominio: None for dominio in REGISTRY_DE_MOTORES if dominio != "DEFAULT"}
+    for site, (dominios, _extrator) in SITES_CANONICOS.items():
+        registrados.update((dominio, site) for dominio in dominios)
+    for dominio, site in registrados.items():
+        no = arvore
+        for rotulo in reversed(dominio.split(".")):
+            no = no.setdefault(rotulo, {})
+        no[""] = (dominio, site)
+    return arvore
+
+
+_arvore_dominios = _compilar_arvore()
+
+
+def recompilar_rotas() -> None:
+    """Reconstrói a árvore após alterar REGISTRY_DE_MOTORES ou SITES_CANONICOS e esquece as rotas memorizadas."""
+    global _arvore_dominios
+    _arvore_dominios = _compilar_arvore()
+    rotear_url.cache_clear()
+
+
+def _casar_dominio(host: str) -> Tuple[str, Optional[str]]:
+    """Maior sufixo registrado de `host` (m.youtube.com -> youtube.com); sem registro, o host sem 'www.'."""
+    no = _arvore_dominios
+    casado = None
+    for rotulo in reversed(host.split(".")):
+        no = no.get(rotulo)
+        if no is None:
+            break
+        casado = no.get("", casado)
+    if casado is not None:
+        return casado
+    return (host[4:] if host.startswith("www.") else host), None
+
+
+@lru_cache(maxsize=URL_ROUTER_CACHE_SIZE)
+def rotear_url(video_url: str) -> RotaURL:
+    """Domínio registrado e chave canônica (site:id) da URL; memorizado por URL."""
+    texto = video_url.strip()
+    try:
+        parsed = urllib.parse.urlsplit(texto)
+        if not parsed.netloc:
+            # Sem esquema ("youtu.be/abc") o host acabaria no caminho
+            parsed = urllib.parse.urlsplit(f"//{texto}")
+        host = (parsed.hostname or "").rstrip(".")
+    except ValueError:
+        return RotaURL("", None, None, video_url)
+    dominio, site = _casar_dominio(host)
+    if site is not None:
+        partes = tuple(parte for parte in parsed.path.split("/") if parte)
+        video_id = SITES_CANONICOS[site][1](dominio, partes, parsed.query)
+        if video_id is not None:
+            return RotaURL(dominio, site, video_id, f"{site}:{video_id}")
+    # Sem id conhecido: a URL normalizada (sem esquema, 'www.' e fragmento) ainda agrupa repetições
+    query = f"?{parsed.query}" if parsed.query else ""
+    return RotaURL(dominio, site, None, f"{dominio}{parsed.path.rstrip('/')}{query}")
 
 def selecionar_motores_para_url(video_url: str, motor_especificado_pelo_cliente: Optional[str] = None, **kwargs) -> List[str]:
     """Retorna lista de motores a usar para determinada URL."""
@@ -27,11 +146,32 @@ def selecionar_motores_para_url(video_url: str, motor_especificado_pelo_cliente:
             return [motor_especificado_pelo_cliente]
         engine_logger.warning("Motor nao suportado, usando padrao", extra={"correlation_id": correlation_id})
 
-    try:
-        parsed = urllib.parse.urlparse(video_url)
-        domain = parsed.netloc.lower().replace("www.", "")
-    except Exception as exc:
-        engine_logger.error("Erro ao parsear URL", extra={"correlation_id": correlation_id, "error": str(exc)})
+    domain = extrair_dominio(video_url)
+    if not domain:
+        engine_logger.error("Erro ao parsear URL", extra={"correlation_id": correlation_id})
         return REGISTRY_DE_MOTORES["DEFAULT"]
 
-    return REGISTRY_DE_MOTORES.get(domain, REGISTRY_DE_MOTORES["DEFAULT"])
+    motores = REGISTRY_DE_MOTORES.get(domain, REGISTRY_DE_MOTORES["DEFAULT"])
+    ordenados = get_engine_stats().ordenar_motores(domain, motores)
+    if ordenados != motores:
+        engine_logger.debug(
+            "Motores reordenados pelas estatísticas",
+            extra={"correlation_id": correlation_id, "domain": domain, "engines": ordenados}
+        )
+    return ordenados
+
+
+def extrair_dominio(video_url: str) -> str:
+    """Domínio usado como chave de registro e de estatísticas (subdomínios de sites conhecidos agrupados)."""
+    return rotear_url(video_url).dominio
+
+
+def dominio_para_metricas(video_url: str) -> str:
+    """Domínio registrado, ou "other": hosts arbitrários vindos de usuários não criam séries novas."""
+    rota = rotear_url(video_url)
+    return rota.dominio if rota.site is not None or rota.dominio in REGISTRY_DE_MOTORES else "other"
+
+
+def chave_canonica_video(video_url: str) -> str:
+    """Normaliza variações de URL de um mesmo vídeo para uma chave estável (ex.: youtube:<id>)."""
+    return rotear_url(video_url).chave
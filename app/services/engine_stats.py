@@ -0,0 +1,193 @@
+"""Estatísticas observadas por (domínio, motor) para seleção adaptativa de motores."""
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import os
+import threading
+import time
+
+from app.core.database import DATABASE_PATH, conectar_sqlite
+
+stats_logger = logging.getLogger(__name__)
+
+# Peso da amostra mais recente nas médias móveis exponenciais
+ENGINE_STATS_ALPHA = float(os.environ.get("ENGINE_STATS_ALPHA", "0.3"))
+# Após esse tempo sem amostras, metade do desvio em relação ao "neutro" é esquecido,
+# permitindo que um motor que falhou volte a ser tentado
+ENGINE_STATS_HALF_LIFE = float(os.environ.get("ENGINE_STATS_HALF_LIFE", str(6 * 3600)))
+# Motores abaixo dessa taxa de sucesso (com amostras suficientes) vão para o fim da lista
+ENGINE_SKIP_THRESHOLD = float(os.environ.get("ENGINE_SKIP_THRESHOLD", "0.2"))
+ENGINE_MIN_SAMPLES = int(os.environ.get("ENGINE_MIN_SAMPLES", "3"))
+
+_TAXA_NEUTRA = 1.0
+
+
+class MedidorDownload:
+    """Mede tempo até o primeiro byte e vazão a partir de eventos no formato dos progress_hooks."""
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.ttfb: Optional[float] = None
+        self.bytes = 0
+
+    def hook(self, d: Dict[str, Any]) -> None:
+        baixados = d.get("downloaded_bytes") or 0
+        if self.ttfb is None and baixados > 0:
+            self.ttfb = time.monotonic() - self.inicio
+        self.bytes = max(self.bytes, baixados)
+
+    def vazao(self) -> Optional[float]:
+        duracao = time.monotonic() - self.inicio
+        return self.bytes / duracao if self.bytes and duracao > 0 else None
+
+
+class EngineStats:
+    """
+    EWMA de taxa de sucesso, TTFB e vazão, persistido em SQLite para sobreviver a reinícios.
+
+    Vários processos (workers Celery e API) gravam a mesma tabela: cada amostra é
+    combinada com a linha lida dentro da própria transação de escrita, e a cópia em
+    memória é recarregada quando `PRAGMA data_version` indica gravação de outro processo.
+    """
+
+    def __init__(self, caminho: str = DATABASE_PATH):
+        self._conexao = conectar_sqlite(caminho)
+        self._lock = threading.Lock()
+        self._conexao.execute(
+            """
+            CREATE TABLE IF NOT EXISTS engine_stats (
+                domain TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                success_rate REAL NOT NULL,
+                ttfb_seconds REAL,
+                throughput_bps REAL,
+                samples INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (domain, engine)
+            )
+            """
+        )
+        self._stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._versao_dados: Optional[int] = None
+
+    def _recarregar(self) -> None:
+        # A tabela tem uma linha por (domínio, motor); reler tudo é barato
+        versao = self._conexao.execute("PRAGMA data_version").fetchone()[0]
+        if versao == self._versao_dados:
+            return
+        self._stats = {
+            (linha["domain"], linha["engine"]): dict(linha)
+            for linha in self._conexao.execute("SELECT * FROM engine_stats")
+        }
+        self._versao_dados = versao
+
+    @staticmethod
+    def _ewma(atual: Optional[float], amostra: Optional[float]) -> Optional[float]:
+        if amostra is None:
+            return atual
+        if atual is None:
+            return amostra
+        return ENGINE_STATS_ALPHA * amostra + (1 - ENGINE_STATS_ALPHA) * atual
+
+    @staticmethod
+    def _taxa_com_decaimento(registro: Dict[str, Any], agora: float) -> float:
+        fator = 0.5 ** ((agora - registro["updated_at"]) / ENGINE_STATS_HALF_LIFE)
+        return _TAXA_NEUTRA + (registro["success_rate"] - _TAXA_NEUTRA) * fator
+
+    def registrar(
+        self,
+        domain: str,
+        engine: str,
+        sucesso: bool,
+        ttfb: Optional[float] = None,
+        vazao: Optional[float] = None,
+    ) -> None:
+        agora = time.time()
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = self._conexao.execute(
+                    "SELECT * FROM engine_stats WHERE domain = ? AND engine = ?", (domain, engine)
+                ).fetchone()
+                registro = self._combinar(dict(linha) if linha else None, domain, engine, sucesso, ttfb, vazao, agora)
+                self._conexao.execute(
+                    "INSERT OR REPLACE INTO engine_stats "
+                    "(domain, engine, success_rate, ttfb_seconds, throughput_bps, samples, updated_at) "
+                    "VALUES (:domain, :engine, :success_rate, :ttfb_seconds, :throughput_bps, :samples, :updated_at)",
+                    registro,
+                )
+                self._conexao.execute("COMMIT")
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+            self._stats[(domain, engine)] = registro
+
+    @classmethod
+    def _combinar(
+        cls,
+        registro: Optional[Dict[str, Any]],
+        domain: str,
+        engine: str,
+        sucesso: bool,
+        ttfb: Optional[float],
+        vazao: Optional[float],
+        agora: float,
+    ) -> Dict[str, Any]:
+        if registro is None:
+            return {
+                "domain": domain,
+                "engine": engine,
+                "success_rate": 1.0 if sucesso else 0.0,
+                "ttfb_seconds": ttfb,
+                "throughput_bps": vazao,
+                "samples": 1,
+                "updated_at": agora,
+            }
+        taxa_atual = cls._taxa_com_decaimento(registro, agora)
+        registro["success_rate"] = cls._ewma(taxa_atual, 1.0 if sucesso else 0.0)
+        registro["ttfb_seconds"] = cls._ewma(registro["ttfb_seconds"], ttfb)
+        registro["throughput_bps"] = cls._ewma(registro["throughput_bps"], vazao)
+        registro["samples"] += 1
+        registro["updated_at"] = agora
+        return registro
+
+    def ordenar_motores(self, domain: str, motores: List[str]) -> List[str]:
+        """
+        Reordena `motores` pela taxa de sucesso observada no domínio (vazão como desempate).
+        Motores com taxa abaixo de ENGINE_SKIP_THRESHOLD vão para o fim, mantidos apenas
+        como último recurso. Sem dados, a ordem original do registro é preservada.
+        """
+        agora = time.time()
+        with self._lock:
+            self._recarregar()
+            registros = {motor: self._stats.get((domain, motor)) for motor in motores}
+
+        def chave(item: Tuple[int, str]) -> Tuple[bool, float, float, int]:
+            posicao, motor = item
+            registro = registros[motor]
+            if registro is None:
+                return (False, -_TAXA_NEUTRA, 0.0, posicao)
+            taxa = self._taxa_com_decaimento(registro, agora)
+            pular = registro["samples"] >= ENGINE_MIN_SAMPLES and taxa < ENGINE_SKIP_THRESHOLD
+            # Taxas arredondadas para que pequenas diferenças não anulem o desempate por vazão
+            return (pular, -round(taxa, 1), -(registro["throughput_bps"] or 0.0), posicao)
+
+        return [motor for _, motor in sorted(enumerate(motores), key=chave)]
+
+    def listar(self) -> List[Dict[str, Any]]:
+        agora = time.time()
+        with self._lock:
+            self._recarregar()
+            return [
+                {**registro, "effective_success_rate": self._taxa_com_decaimento(registro, agora)}
+                for registro in self._stats.values()
+            ]
+
+
+_engine_stats: Optional[EngineStats] = None
+
+
+def get_engine_stats() -> EngineStats:
+    global _engine_stats
+    if _engine_stats is None:
+        _engine_stats = EngineStats()
+    return _engine_stats
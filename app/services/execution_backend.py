@@ -0,0 +1,178 @@
+"""Backends plugáveis de execução das tarefas de download (Celery ou em processo)."""
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import os
+import threading
+
+import anyio
+
+execution_logger = logging.getLogger(__name__)
+
+# "celery" envia para o broker; "inprocess" executa no próprio processo da API
+EXECUTION_BACKEND = os.environ.get("EXECUTION_BACKEND", "celery")
+INPROCESS_CONCURRENCY = int(os.environ.get("INPROCESS_CONCURRENCY", "2"))
+
+
+class ExecutionBackend(ABC):
+    """Submete tarefas de download já registradas no TaskStore."""
+
+    nome: str = ""
+
+    @abstractmethod
+    async def submeter(self, task_id: str, dados_requisicao: Dict[str, Any]) -> None:
+        ...
+
+    async def submeter_lote(self, itens: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """Submete várias tarefas; backends podem sobrescrever para enviar em bloco."""
+        for task_id, dados_requisicao in itens:
+            await self.submeter(task_id, dados_requisicao)
+
+    async def cancelar(self, task_id: str) -> None:
+        """Retira da fila uma tarefa ainda não iniciada; as em andamento param pelo sinal cooperativo."""
+
+    def encerrar(self) -> None:
+        """Libera recursos do backend no desligamento da aplicação."""
+
+
+class CeleryBackend(ExecutionBackend):
+    nome = "celery"
+
+    @staticmethod
+    def _opcoes_roteamento(dados_requisicao: Dict[str, Any]) -> Dict[str, Any]:
+        from app.tasks.celery_config import prioridade_no_broker
+        from app.tasks.routing import escolher_fila
+
+        fila, prioridade = escolher_fila(dados_requisicao)
+        return {"queue": fila, "priority": prioridade_no_broker(prioridade)}
+
+    async def submeter(self, task_id: str, dados_requisicao: Dict[str, Any]) -> None:
+        from app.tasks.download_tasks import processar_download_video
+
+        # A publicação no broker é I/O de rede bloqueante; fica fora do event loop
+        await anyio.to_thread.run_sync(
+            lambda: processar_download_video.apply_async(
+                args=[dados_requisicao], task_id=task_id, **self._opcoes_roteamento(dados_requisicao)
+            )
+        )
+
+    async def submeter_lote(self, itens: List[Tuple[str, Dict[str, Any]]]) -> None:
+        from app.tasks.download_tasks import processar_download_video
+
+        def publicar_todas() -> None:
+            # Uma única conexão com o broker para o lote inteiro
+            with processar_download_video.app.producer_or_acquire() as producer:
+                for task_id, dados_requisicao in itens:
+                    processar_download_video.apply_async(
+                        args=[dados_requisicao], task_id=task_id, producer=producer,
+                        **self._opcoes_roteamento(dados_requisicao),
+                    )
+
+        await anyio.to_thread.run_sync(publicar_todas)
+
+    async def cancelar(self, task_id: str) -> None:
+        from app.tasks.celery_config import celery_app_instance
+
+        # Sem terminate: a mensagem na fila é descartada pelos workers e a tarefa em
+        # andamento para sozinha ao ler o sinal, limpando os próprios parciais
+        await anyio.to_thread.run_sync(lambda: celery_app_instance.control.revoke(task_id))
+
+
+class InProcessBackend(ExecutionBackend):
+    """Pool de workers no próprio processo, com concorrência limitada.
+
+    A submissão é assíncrona e não bloqueia o event loop. Como a função de download
+    (yt-dlp, ffmpeg) é bloqueante, ela roda em um pool dedicado de INPROCESS_CONCURRENCY
+    threads; tarefas excedentes aguardam na fila do pool sem passar por um broker.
+    """
+
+    nome = "inprocess"
+
+    def __init__(self, concorrencia: int = INPROCESS_CONCURRENCY):
+        self.concorrencia = concorrencia
+        self._pool = ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="download")
+        self._futuros: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    async def submeter(self, task_id: str, dados_requisicao: Dict[str, Any]) -> None:
+        from app.services.download_runner import executar_download
+
+        futuro = self._pool.submit(self._executar, executar_download, task_id, dados_requisicao)
+        with self._lock:
+            self._futuros[task_id] = futuro
+        futuro.add_done_callback(lambda _f: self._remover(task_id))
+
+    def _executar(self, funcao: Any, task_id: str, dados_requisicao: Dict[str, Any]) -> Any:
+        from app.services.rate_limiter import LimiteAtingidoError
+
+        try:
+            return funcao(task_id, dados_requisicao)
+        except LimiteAtingidoError as exc:
+            # Origem no limite: reenfileira após o intervalo sugerido, sem ocupar uma thread esperando
+            execution_logger.info(f"Tarefa {task_id} adiada por {exc.retry_after}s: {exc}")
+            temporizador = threading.Timer(
+                exc.retry_after, self._reenfileirar, args=(funcao, task_id, dados_requisicao)
+            )
+            temporizador.daemon = True
+            temporizador.start()
+            return None
+        except Exception:
+            execution_logger.exception(f"Falha não tratada na tarefa {task_id}")
+            raise
+
+    def _reenfileirar(self, funcao: Any, task_id: str, dados_requisicao: Dict[str, Any]) -> None:
+        try:
+            futuro = self._pool.submit(self._executar, funcao, task_id, dados_requisicao)
+        except RuntimeError:
+            return  # pool encerrado
+        with self._lock:
+            self._futuros[task_id] = futuro
+        futuro.add_done_callback(lambda _f: self._remover(task_id))
+
+    def _remover(self, task_id: str) -> None:
+        with self._lock:
+            self._futuros.pop(task_id, None)
+
+    async def cancelar(self, task_id: str) -> None:
+        with self._lock:
+            futuro = self._futuros.get(task_id)
+        # Só tem efeito se a tarefa ainda espera na fila do pool; um reenfileiramento
+        # pendente (LimiteAtingidoError) encontra o sinal ao começar
+        if futuro is not None and futuro.cancel():
+            execution_logger.info(f"Tarefa {task_id} removida da fila do pool")
+
+    @property
+    def em_andamento(self) -> int:
+        return len(self._futuros)
+
+    def aguardar(self, task_id: str, timeout: Optional[float] = None) -> Any:
+        """Bloqueia até a tarefa terminar (útil em testes e scripts)."""
+        with self._lock:
+            futuro = self._futuros.get(task_id)
+        return futuro.result(timeout) if futuro is not None else None
+
+    def encerrar(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_backend: Optional[ExecutionBackend] = None
+
+
+def get_execution_backend() -> ExecutionBackend:
+    """Retorna o backend configurado em EXECUTION_BACKEND."""
+    global _backend
+    if _backend is None:
+        if EXECUTION_BACKEND == "inprocess":
+            _backend = InProcessBackend()
+        else:
+            _backend = CeleryBackend()
+        execution_logger.info(f"Backend de execução: {_backend.nome}")
+    return _backend
+
+
+def encerrar_execution_backend() -> None:
+    global _backend
+    if _backend is not None:
+        _backend.encerrar()
+        _backend = None
@@ -0,0 +1,111 @@
+"""Executor limitado para rodar extrações bloqueantes (yt-dlp) fora do event loop."""
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+import asyncio
+import logging
+import os
+import threading
+
+executor_logger = logging.getLogger(__name__)
+
+# "thread" (padrão) ou "process"; o pool de processos exige funções importáveis no nível do módulo
+EXTRACTION_EXECUTOR_KIND = os.environ.get("EXTRACTION_EXECUTOR_KIND", "thread")
+EXTRACTION_POOL_SIZE = int(os.environ.get("EXTRACTION_POOL_SIZE", "4"))
+# Quantas chamadas podem aguardar na fila além das que já estão executando
+EXTRACTION_QUEUE_SIZE = int(os.environ.get("EXTRACTION_QUEUE_SIZE", "16"))
+EXTRACTION_TIMEOUT = float(os.environ.get("EXTRACTION_TIMEOUT", "60"))
+EXTRACTION_RETRY_AFTER = int(os.environ.get("EXTRACTION_RETRY_AFTER", "5"))
+
+
+class ExecutorSaturadoError(Exception):
+    """Levantada quando não há vaga livre no executor de extração."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Executor de extração saturado")
+        self.retry_after = retry_after
+
+
+class ExtracaoTimeoutError(Exception):
+    """Levantada quando a extração excede o tempo limite por chamada."""
+
+
+class ExecutorExtracao:
+    """Pool de tamanho fixo com fila limitada; recusa novas chamadas quando cheio."""
+
+    def __init__(
+        self,
+        tamanho: int = EXTRACTION_POOL_SIZE,
+        tamanho_fila: int = EXTRACTION_QUEUE_SIZE,
+        timeout: float = EXTRACTION_TIMEOUT,
+        retry_after: int = EXTRACTION_RETRY_AFTER,
+        tipo: str = EXTRACTION_EXECUTOR_KIND,
+    ):
+        self.tamanho = tamanho
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._pool: Executor
+        if tipo == "process":
+            self._pool = ProcessPoolExecutor(max_workers=tamanho)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=tamanho, thread_name_prefix="extracao")
+        # A vaga só é devolvida quando a função termina de fato, mesmo após um timeout,
+        # para que chamadas presas não façam o pool crescer além do limite configurado.
+        self._vagas = threading.BoundedSemaphore(tamanho + tamanho_fila)
+        self._capacidade = tamanho + tamanho_fila
+        self._ocupadas = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ocupacao(self) -> int:
+        return self._ocupadas
+
+    def _liberar_vaga(self, _futuro: Any) -> None:
+        with self._lock:
+            self._ocupadas -= 1
+        self._vagas.release()
+
+    async def executar(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """Executa `func(*args)` no pool e aguarda o resultado sem bloquear o event loop."""
+        if not self._vagas.acquire(blocking=False):
+            executor_logger.warning(
+                "Executor de extração saturado",
+                extra={"capacity": self._capacidade, "retry_after": self.retry_after}
+            )
+            raise ExecutorSaturadoError(self.retry_after)
+        with self._lock:
+            self._ocupadas += 1
+
+        try:
+            futuro = self._pool.submit(func, *args)
+        except Exception:
+            self._liberar_vaga(None)
+            raise
+        futuro.add_done_callback(self._liberar_vaga)
+
+        limite = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(futuro), limite)
+        except asyncio.TimeoutError:
+            executor_logger.warning("Extração excedeu o tempo limite", extra={"timeout": limite})
+            raise ExtracaoTimeoutError(f"Extração excedeu {limite}s")
+
+    def encerrar(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_executor: Optional[ExecutorExtracao] = None
+
+
+def get_executor_extracao() -> ExecutorExtracao:
+    """Retorna o executor compartilhado do processo, criando-o na primeira chamada."""
+    global _executor
+    if _executor is None:
+        _executor = ExecutorExtracao()
+    return _executor
+
+
+def encerrar_executor_extracao() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.encerrar()
+        _executor = None
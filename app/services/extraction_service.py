@@ -0,0 +1,80 @@
+"""Extração de metadados de vídeos com yt-dlp."""
+from typing import Any, Dict, List
+import logging
+import time
+
+from app.core.metrics import extraction_coalesced_total, extraction_duration_seconds
+from app.services.engine_manager import chave_canonica_video, dominio_para_metricas
+from app.services.extraction_executor import get_executor_extracao
+from app.services.metadata_cache import get_metadata_cache
+from app.services.single_flight import SingleFlight
+
+extraction_logger = logging.getLogger(__name__)
+
+# Extrações concorrentes da mesma URL canônica compartilham uma única chamada ao yt-dlp
+extracoes_em_andamento = SingleFlight(extraction_coalesced_total)
+
+
+def extrair_info_video(video_url: str) -> Dict[str, Any]:
+    """Chamada bloqueante ao yt-dlp; deve rodar fora do event loop."""
+    from yt_dlp import YoutubeDL
+
+    inicio = time.perf_counter()
+    resultado = "error"
+    try:
+        with YoutubeDL({"skip_download": True}) as ydl:
+            info = ydl.extract_info(video_url, download=False)
+            resultado = "success"
+            # sanitize_info remove objetos não serializáveis, permitindo pool de processos
+            return ydl.sanitize_info(info)
+    finally:
+        extraction_duration_seconds.labels(dominio_para_metricas(video_url), resultado).observe(
+            time.perf_counter() - inicio
+        )
+
+
+def extrair_entradas_playlist(playlist_url: str, limite: int) -> List[str]:
+    """
+    Lista as URLs dos itens de uma playlist/canal com extração plana: só a listagem
+    é consultada, cada vídeo é extraído depois pelo worker da sua própria tarefa.
+    """
+    from yt_dlp import YoutubeDL
+
+    opcoes = {"skip_download": True, "extract_flat": "in_playlist", "lazy_playlist": True, "playlistend": limite}
+    with YoutubeDL(opcoes) as ydl:
+        info = ydl.extract_info(playlist_url, download=False, process=False)
+        if info.get("_type") not in ("playlist", "multi_video"):
+            return [info.get("webpage_url") or playlist_url]
+        urls: List[str] = []
+        for entrada in info.get("entries") or []:
+            if len(urls) >= limite:
+                break
+            url = entrada.get("url") or entrada.get("webpage_url") if entrada else None
+            if url:
+                urls.append(url)
+        return urls
+
+
+def obter_info_video_sincrono(video_url: str) -> Dict[str, Any]:
+    """Versão bloqueante com leitura do cache, usada pelos workers de download."""
+    cache = get_metadata_cache()
+    info = cache.obter(video_url)
+    if info is None:
+        info = extrair_info_video(video_url)
+        cache.salvar(video_url, info)
+    return info
+
+
+async def obter_info_video(video_url: str) -> Dict[str, Any]:
+    """Retorna os metadados do cache ou os extrai no executor limitado."""
+    cache = get_metadata_cache()
+    info = cache.obter(video_url)
+    if info is not None:
+        return info
+
+    async def extrair_e_salvar() -> Dict[str, Any]:
+        info_extraida = await get_executor_extracao().executar(extrair_info_video, video_url)
+        cache.salvar(video_url, info_extraida)
+        return info_extraida
+
+    return await extracoes_em_andamento.executar(chave_canonica_video(video_url), extrair_e_salvar)
@@ -0,0 +1,250 @@
+"""Entrega de arquivos com suporte a Range (206), validadores HTTP e zero-copy."""
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+import logging
+import mimetypes
+import os
+import uuid
+
+import anyio
+from fastapi import Response, status
+
+delivery_logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024
+# Pedidos com mais intervalos que isso recebem o arquivo inteiro (evita abuso de multipart)
+MAX_RANGES = 16
+
+# Tipos que o módulo mimetypes não conhece em todas as plataformas
+_TIPOS_EXTRAS = {
+    ".mkv": "video/x-matroska",
+    ".webm": "video/webm",
+    ".flv": "video/x-flv",
+    ".m4a": "audio/mp4",
+    ".aac": "audio/aac",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".mp4": "video/mp4",
+    ".avi": "video/x-msvideo",
+}
+
+Intervalo = Tuple[int, int]  # (início, fim) inclusivos
+
+
+def tipo_de_midia(caminho: str) -> str:
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao in _TIPOS_EXTRAS:
+        return _TIPOS_EXTRAS[extensao]
+    tipo, _ = mimetypes.guess_type(caminho)
+    return tipo or "application/octet-stream"
+
+
+def gerar_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def interpretar_range(cabecalho: str, tamanho: int) -> Optional[List[Intervalo]]:
+    """
+    Converte `Range: bytes=...` em intervalos ordenados e mesclados.
+    Retorna None se o cabeçalho for inválido (deve ser ignorado) e lista vazia se
+    nenhum intervalo for satisfazível (416).
+    """
+    unidade, _, especificacao = cabecalho.partition("=")
+    if unidade.strip().lower() != "bytes" or not especificacao:
+        return None
+    intervalos: List[Intervalo] = []
+    for parte in especificacao.split(","):
+        inicio_txt, separador, fim_txt = parte.strip().partition("-")
+        if not separador:
+            return None
+        try:
+            if inicio_txt == "":
+                # Sufixo: últimos N bytes
+                sufixo = int(fim_txt)
+                if sufixo <= 0:
+                    continue
+                intervalos.append((max(tamanho - sufixo, 0), tamanho - 1))
+                continue
+            inicio = int(inicio_txt)
+            fim = int(fim_txt) if fim_txt else tamanho - 1
+        except ValueError:
+            return None
+        if inicio >= tamanho:
+            continue
+        if inicio > fim:
+            return None
+        intervalos.append((inicio, min(fim, tamanho - 1)))
+
+    intervalos.sort()
+    mesclados: List[Intervalo] = []
+    for inicio, fim in intervalos:
+        if mesclados and inicio <= mesclados[-1][1] + 1:
+            mesclados[-1] = (mesclados[-1][0], max(mesclados[-1][1], fim))
+        else:
+            mesclados.append((inicio, fim))
+    return mesclados
+
+
+def _if_range_valido(if_range: str, etag: str, mtime: float) -> bool:
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    try:
+        return int(mtime) <= parsedate_to_datetime(if_range).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _nao_modificado(cabecalhos: Mapping[str, str], etag: str, mtime: float) -> bool:
+    if_none_match = cabecalhos.get("if-none-match")
+    if if_none_match is not None:
+        candidatos = [c.strip() for c in if_none_match.split(",")]
+        return "*" in candidatos or etag in candidatos or f"W/{etag}" in candidatos
+    if_modified_since = cabecalhos.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class ArquivoResponse(Response):
+    """
+    Envia trechos de um arquivo. Sem cópia para o processo só quando o servidor ASGI oferece
+    a extensão: "http.response.pathsend" para o arquivo inteiro (Granian, Hypercorn) ou
+    "http.response.zerocopysend" para trechos. O uvicorn não anuncia nenhuma das duas; nele
+    o arquivo sai em blocos lidos numa thread, e o sendfile fica com o proxy na frente
+    (ver RESULT_LOCAL_REDIRECT).
+    """
+
+    def __init__(
+        self,
+        caminho: str,
+        partes: Iterable[Tuple[bytes, int, int]],
+        status_code: int,
+        headers: Mapping[str, str],
+        media_type: str,
+        enviar_corpo: bool = True,
+    ):
+        super().__init__(content=None, status_code=status_code, headers=dict(headers), media_type=media_type)
+        self.caminho = caminho
+        # Cada parte: (prefixo em bytes, offset, quantidade); prefixo vazio fora do multipart
+        self.partes = list(partes)
+        self.sufixo = b""
+        self.enviar_corpo = enviar_corpo
+
+    def _arquivo_inteiro(self) -> bool:
+        # pathsend não tem offset nem prefixos: só serve a resposta 200 do arquivo todo
+        if len(self.partes) != 1 or self.sufixo:
+            return False
+        prefixo, offset, quantidade = self.partes[0]
+        return not prefixo and offset == 0 and quantidade == os.path.getsize(self.caminho)
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.enviar_corpo or scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        extensoes = scope.get("extensions") or {}
+        if "http.response.pathsend" in extensoes and self._arquivo_inteiro():
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(self.caminho)})
+            return
+        zero_copy = "http.response.zerocopysend" in extensoes
+        with open(self.caminho, "rb") as arquivo:
+            for prefixo, offset, quantidade in self.partes:
+                if prefixo:
+                    await send({"type": "http.response.body", "body": prefixo, "more_body": True})
+                if zero_copy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": arquivo.fileno(),
+                        "offset": offset,
+                        "count": quantidade,
+                        "more_body": True,
+                    })
+                    continue
+                restante = quantidade
+                await anyio.to_thread.run_sync(arquivo.seek, offset)
+                while restante > 0:
+                    bloco = await anyio.to_thread.run_sync(arquivo.read, min(CHUNK_SIZE, restante))
+                    if not bloco:
+                        break
+                    restante -= len(bloco)
+                    await send({"type": "http.response.body", "body": bloco, "more_body": True})
+        await send({"type": "http.response.body", "body": self.sufixo, "more_body": False})
+
+
+def responder_arquivo(
+    cabecalhos: Mapping[str, str],
+    caminho: str,
+    nome_download: Optional[str] = None,
+    metodo: str = "GET",
+) -> Response:
+    """Monta a resposta para servir `caminho`, respeitando Range/If-Range e validadores."""
+    stat_result = os.stat(caminho)
+    tamanho = stat_result.st_size
+    etag = gerar_etag(stat_result)
+    media_type = tipo_de_midia(caminho)
+    base = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+    if nome_download:
+        base["Content-Disposition"] = f'attachment; filename="{nome_download}"'
+    enviar_corpo = metodo != "HEAD"
+
+    if _nao_modificado(cabecalhos, etag, stat_result.st_mtime):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=base)
+
+    intervalos = None
+    cabecalho_range = cabecalhos.get("range")
+    if cabecalho_range:
+        if_range = cabecalhos.get("if-range")
+        if if_range is None or _if_range_valido(if_range, etag, stat_result.st_mtime):
+            intervalos = interpretar_range(cabecalho_range, tamanho)
+            if intervalos is not None and not intervalos:
+                return Response(
+                    status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+                    headers={**base, "Content-Range": f"bytes */{tamanho}"},
+                )
+            if intervalos is not None and len(intervalos) > MAX_RANGES:
+                intervalos = None
+
+    if not intervalos:
+        return ArquivoResponse(
+            caminho, [(b"", 0, tamanho)], status.HTTP_200_OK,
+            {**base, "Content-Length": str(tamanho)}, media_type, enviar_corpo,
+        )
+
+    if len(intervalos) == 1:
+        inicio, fim = intervalos[0]
+        return ArquivoResponse(
+            caminho, [(b"", inicio, fim - inicio + 1)], status.HTTP_206_PARTIAL_CONTENT,
+            {**base, "Content-Length": str(fim - inicio + 1), "Content-Range": f"bytes {inicio}-{fim}/{tamanho}"},
+            media_type, enviar_corpo,
+        )
+
+    fronteira = uuid.uuid4().hex
+    partes = []
+    total = 0
+    for inicio, fim in intervalos:
+        prefixo = (
+            f"--{fronteira}\r\nContent-Type: {media_type}\r\n"
+            f"Content-Range: bytes {inicio}-{fim}/{tamanho}\r\n\r\n"
+        ).encode("latin-1")
+        if partes:
+            prefixo = b"\r\n" + prefixo
+        partes.append((prefixo, inicio, fim - inicio + 1))
+        total += len(prefixo) + fim - inicio + 1
+    sufixo = f"\r\n--{fronteira}--\r\n".encode("latin-1")
+    resposta = ArquivoResponse(
+        caminho, partes, status.HTTP_206_PARTIAL_CONTENT,
+        {**base, "Content-Length": str(total + len(sufixo))},
+        f"multipart/byteranges; boundary={fronteira}", enviar_corpo,
+    )
+    resposta.sufixo = sufixo
+    return resposta
@@ -0,0 +1,103 @@
+"""Handles de curta duração que levam a extração feita em /video/options até o worker de download."""
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import zlib
+
+from app.core.database import DATABASE_PATH, conectar_sqlite
+from app.core.metrics import cache_lookups_total
+from app.services.engine_manager import chave_canonica_video
+
+handles_logger = logging.getLogger(__name__)
+
+INFO_HANDLE_TTL = int(os.environ.get("INFO_HANDLE_TTL", "900"))
+# Extrações cujas URLs assinadas vencem antes disso não são reaproveitadas
+INFO_HANDLE_EXPIRY_MARGIN = int(os.environ.get("INFO_HANDLE_EXPIRY_MARGIN", "300"))
+
+
+def expiracao_urls_assinadas(info: Dict[str, Any]) -> Optional[float]:
+    """Menor instante (epoch) de expiração das URLs de mídia, quando elas o informam (ex.: `expire=`)."""
+    menor: Optional[float] = None
+    for formato in info.get("formats") or [info]:
+        url = formato.get("url")
+        if not url:
+            continue
+        expira = parse_qs(urlparse(url).query).get("expire")
+        if expira and expira[0].isdigit():
+            menor = float(expira[0]) if menor is None else min(menor, float(expira[0]))
+    return menor
+
+
+class InfoHandleStore:
+    """
+    Guarda o dict de info do yt-dlp sob um handle aleatório, no SQLite compartilhado pela
+    API e pelos workers. O handle só vale para a mesma URL canônica e até expirar o TTL
+    ou a primeira URL assinada do dict; depois disso o worker volta a extrair.
+    """
+
+    def __init__(self, caminho: str = DATABASE_PATH, ttl: int = INFO_HANDLE_TTL):
+        self.ttl = ttl
+        self._conexao = conectar_sqlite(caminho)
+        self._lock = threading.Lock()
+        self._conexao.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS info_handles (
+                handle TEXT PRIMARY KEY,
+                video_key TEXT NOT NULL,
+                info BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_info_handles_expires ON info_handles (expires_at);
+            """
+        )
+
+    def criar(self, video_url: str, info: Dict[str, Any]) -> str:
+        handle = secrets.token_urlsafe(16)
+        expira = time.time() + self.ttl
+        expira_urls = expiracao_urls_assinadas(info)
+        if expira_urls is not None:
+            expira = min(expira, expira_urls - INFO_HANDLE_EXPIRY_MARGIN)
+        # O dict de info de sites grandes passa de centenas de KB; compressão rápida basta
+        dados = zlib.compress(json.dumps(info).encode("utf-8"), 1)
+        with self._lock:
+            self._conexao.execute("DELETE FROM info_handles WHERE expires_at < ?", (time.time(),))
+            self._conexao.execute(
+                "INSERT INTO info_handles (handle, video_key, info, expires_at) VALUES (?, ?, ?, ?)",
+                (handle, chave_canonica_video(video_url), dados, expira),
+            )
+        return handle
+
+    def obter(self, handle: str, video_url: str) -> Optional[Dict[str, Any]]:
+        """Info guardada sob `handle`, ou None se não existir, tiver expirado ou for de outro vídeo."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT video_key, info, expires_at FROM info_handles WHERE handle = ?", (handle,)
+            ).fetchone()
+        if linha is None or linha["expires_at"] < time.time():
+            cache_lookups_total.labels("info_handle", "miss").inc()
+            return None
+        if linha["video_key"] != chave_canonica_video(video_url):
+            handles_logger.warning("Handle de info usado com outro vídeo", extra={"video_url": video_url})
+            cache_lookups_total.labels("info_handle", "miss").inc()
+            return None
+        cache_lookups_total.labels("info_handle", "hit").inc()
+        return json.loads(zlib.decompress(linha["info"]))
+
+    def remover(self, handle: str) -> None:
+        with self._lock:
+            self._conexao.execute("DELETE FROM info_handles WHERE handle = ?", (handle,))
+
+
+_info_handles: Optional[InfoHandleStore] = None
+
+
+def get_info_handles() -> InfoHandleStore:
+    global _info_handles
+    if _info_handles is None:
+        _info_handles = InfoHandleStore()
+    return _info_handles
@@ -0,0 +1,166 @@
+"""Cache de metadados de vídeo com TTL e despejo LRU, com backend plugável."""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import json
+import logging
+import os
+import threading
+import time
+
+from app.core.metrics import cache_lookups_total
+from app.services.engine_manager import chave_canonica_video
+
+cache_logger = logging.getLogger(__name__)
+
+# "memory" (padrão, por processo) ou "redis" (compartilhado entre API e workers)
+METADATA_CACHE_BACKEND = os.environ.get("METADATA_CACHE_BACKEND", "memory")
+METADATA_CACHE_TTL = int(os.environ.get("METADATA_CACHE_TTL", "300"))
+METADATA_CACHE_MAX_ENTRIES = int(os.environ.get("METADATA_CACHE_MAX_ENTRIES", "1024"))
+METADATA_CACHE_REDIS_URL = os.environ.get("METADATA_CACHE_REDIS_URL")
+
+
+class MetadataCacheBackend(ABC):
+    """Interface mínima de armazenamento usada pelo MetadataCache."""
+
+    @abstractmethod
+    def obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def salvar(self, chave: str, valor: Dict[str, Any], ttl: int) -> None:
+        ...
+
+    @abstractmethod
+    def remover(self, chave: str) -> None:
+        ...
+
+
+class MemoriaBackend(MetadataCacheBackend):
+    """
+    LRU limitado por número de entradas, com expiração por entrada. Guarda o JSON, como o
+    Redis: o yt-dlp altera o dict recebido (requested_downloads, filepath) e downloads
+    simultâneos do mesmo vídeo não podem compartilhar esse estado.
+    """
+
+    def __init__(self, max_entradas: int = METADATA_CACHE_MAX_ENTRIES):
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            expira_em, valor = entrada
+            if expira_em <= time.monotonic():
+                del self._entradas[chave]
+                return None
+            self._entradas.move_to_end(chave)
+        return json.loads(valor)
+
+    def salvar(self, chave: str, valor: Dict[str, Any], ttl: int) -> None:
+        serializado = json.dumps(valor)
+        with self._lock:
+            self._entradas[chave] = (time.monotonic() + ttl, serializado)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def remover(self, chave: str) -> None:
+        with self._lock:
+            self._entradas.pop(chave, None)
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+
+class RedisBackend(MetadataCacheBackend):
+    """Backend compartilhado no Redis do broker Celery.
+
+    O TTL é aplicado com SETEX; o limite de tamanho e o despejo LRU ficam a cargo
+    da política `maxmemory-policy allkeys-lru` do servidor Redis.
+    """
+
+    PREFIXO = "video-meta:"
+
+    def __init__(self, url: Optional[str] = None):
+        import redis
+
+        if url is None:
+            from app.tasks.celery_config import BROKER_URL
+            url = BROKER_URL
+        self._cliente = redis.Redis.from_url(url)
+
+    def obter(self, chave: str) -> Optional[Dict[str, Any]]:
+        bruto = self._cliente.get(self.PREFIXO + chave)
+        return json.loads(bruto) if bruto else None
+
+    def salvar(self, chave: str, valor: Dict[str, Any], ttl: int) -> None:
+        self._cliente.setex(self.PREFIXO + chave, ttl, json.dumps(valor))
+
+    def remover(self, chave: str) -> None:
+        self._cliente.delete(self.PREFIXO + chave)
+
+
+class MetadataCache:
+    """Cache de `info` do yt-dlp indexado pela chave canônica do vídeo."""
+
+    def __init__(self, backend: MetadataCacheBackend, ttl: int = METADATA_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def obter(self, video_url: str) -> Optional[Dict[str, Any]]:
+        chave = chave_canonica_video(video_url)
+        try:
+            valor = self.backend.obter(chave)
+        except Exception as exc:
+            # Falha no backend não pode derrubar a requisição; vira um miss
+            cache_logger.warning("Falha ao ler cache de metadados", extra={"error": str(exc)})
+            valor = None
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        cache_lookups_total.labels("metadata", "miss" if valor is None else "hit").inc()
+        return valor
+
+    def salvar(self, video_url: str, info: Dict[str, Any]) -> None:
+        try:
+            self.backend.salvar(chave_canonica_video(video_url), info, self.ttl)
+        except Exception as exc:
+            cache_logger.warning("Falha ao gravar cache de metadados", extra={"error": str(exc)})
+
+    def remover(self, video_url: str) -> None:
+        try:
+            self.backend.remover(chave_canonica_video(video_url))
+        except Exception as exc:
+            cache_logger.warning("Falha ao remover do cache de metadados", extra={"error": str(exc)})
+
+    def estatisticas(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+_metadata_cache: Optional[MetadataCache] = None
+
+
+def get_metadata_cache() -> MetadataCache:
+    """Retorna o cache do processo conforme METADATA_CACHE_BACKEND."""
+    global _metadata_cache
+    if _metadata_cache is None:
+        if METADATA_CACHE_BACKEND == "redis":
+            backend: MetadataCacheBackend = RedisBackend(METADATA_CACHE_REDIS_URL)
+        else:
+            backend = MemoriaBackend()
+        _metadata_cache = MetadataCache(backend)
+    return _metadata_cache
@@ -0,0 +1,217 @@
+"""Publicação e assinatura de eventos de progresso das tarefas de download."""
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Set
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from app.models.enums import TaskStatus
+from app.services.execution_backend import EXECUTION_BACKEND
+
+pubsub_logger = logging.getLogger(__name__)
+
+# "memory" atende API e workers no mesmo processo; "redis" permite que qualquer nó
+# da API sirva o stream de uma tarefa executada por um worker Celery remoto. Sem
+# configuração explícita, segue o backend de execução: com Celery os eventos nascem
+# em outro processo e só o Redis os entrega.
+PROGRESS_PUBSUB_BACKEND = os.environ.get("PROGRESS_PUBSUB_BACKEND") or (
+    "redis" if EXECUTION_BACKEND == "celery" else "memory"
+)
+PROGRESS_PUBSUB_REDIS_URL = os.environ.get("PROGRESS_PUBSUB_REDIS_URL")
+# Máximo de eventos de progresso por segundo e por tarefa
+PROGRESS_MAX_RATE = float(os.environ.get("PROGRESS_MAX_RATE", "2"))
+PROGRESS_QUEUE_SIZE = int(os.environ.get("PROGRESS_QUEUE_SIZE", "64"))
+
+ESTADOS_FINAIS = {TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value}
+
+
+def _canal(task_id: str) -> str:
+    return f"task-progress:{task_id}"
+
+
+class Assinatura(ABC):
+    """Assinatura de eventos de uma tarefa; deve ser fechada pelo consumidor."""
+
+    @abstractmethod
+    async def proximo(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Retorna o próximo evento ou None se nada chegar dentro de `timeout`."""
+
+    @abstractmethod
+    async def fechar(self) -> None:
+        ...
+
+
+class ProgressPubSub(ABC):
+    @abstractmethod
+    def publicar(self, task_id: str, evento: Dict[str, Any]) -> None:
+        """Publica um evento; seguro para chamar de threads de worker."""
+
+    @abstractmethod
+    async def assinar(self, task_id: str) -> Assinatura:
+        ...
+
+
+class _AssinaturaMemoria(Assinatura):
+    def __init__(self, pubsub: "MemoriaPubSub", task_id: str):
+        self._pubsub = pubsub
+        self._task_id = task_id
+        self.loop = asyncio.get_running_loop()
+        self.fila: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=PROGRESS_QUEUE_SIZE)
+
+    def entregar(self, evento: Dict[str, Any]) -> None:
+        # Executado no loop do assinante; consumidor lento perde eventos antigos, não novos
+        if self.fila.full():
+            self.fila.get_nowait()
+        self.fila.put_nowait(evento)
+
+    async def proximo(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def fechar(self) -> None:
+        self._pubsub._remover(self._task_id, self)
+
+
+class MemoriaPubSub(ProgressPubSub):
+    """Fan-out em memória para os assinantes do próprio processo."""
+
+    def __init__(self):
+        self._assinantes: Dict[str, Set[_AssinaturaMemoria]] = {}
+        self._lock = threading.Lock()
+
+    def publicar(self, task_id: str, evento: Dict[str, Any]) -> None:
+        with self._lock:
+            assinantes = list(self._assinantes.get(task_id, ()))
+        for assinatura in assinantes:
+            try:
+                assinatura.loop.call_soon_threadsafe(assinatura.entregar, evento)
+            except RuntimeError:
+                # Loop do assinante já encerrado
+                self._remover(task_id, assinatura)
+
+    async def assinar(self, task_id: str) -> Assinatura:
+        assinatura = _AssinaturaMemoria(self, task_id)
+        with self._lock:
+            self._assinantes.setdefault(task_id, set()).add(assinatura)
+        return assinatura
+
+    def _remover(self, task_id: str, assinatura: _AssinaturaMemoria) -> None:
+        with self._lock:
+            assinantes = self._assinantes.get(task_id)
+            if assinantes is not None:
+                assinantes.discard(assinatura)
+                if not assinantes:
+                    del self._assinantes[task_id]
+
+
+class _AssinaturaRedis(Assinatura):
+    def __init__(self, cliente: Any, pubsub: Any):
+        self._cliente = cliente
+        self._pubsub = pubsub
+
+    async def proximo(self, timeout: float) -> Optional[Dict[str, Any]]:
+        mensagem = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if mensagem is None:
+            return None
+        return json.loads(mensagem["data"])
+
+    async def fechar(self) -> None:
+        await self._pubsub.aclose()
+        await self._cliente.aclose()
+
+
+class RedisPubSub(ProgressPubSub):
+    """Pub/sub no Redis do broker Celery, compartilhado por todos os nós."""
+
+    def __init__(self, url: Optional[str] = None):
+        import redis
+
+        if url is None:
+            from app.tasks.celery_config import BROKER_URL
+            url = BROKER_URL
+        self._url = url
+        self._cliente = redis.Redis.from_url(url)
+
+    def publicar(self, task_id: str, evento: Dict[str, Any]) -> None:
+        self._cliente.publish(_canal(task_id), json.dumps(evento))
+
+    async def assinar(self, task_id: str) -> Assinatura:
+        import redis.asyncio as redis_async
+
+        cliente = redis_async.Redis.from_url(self._url)
+        pubsub = cliente.pubsub()
+        await pubsub.subscribe(_canal(task_id))
+        return _AssinaturaRedis(cliente, pubsub)
+
+
+_pubsub: Optional[ProgressPubSub] = None
+
+
+def get_progress_pubsub() -> ProgressPubSub:
+    global _pubsub
+    if _pubsub is None:
+        if PROGRESS_PUBSUB_BACKEND == "redis":
+            _pubsub = RedisPubSub(PROGRESS_PUBSUB_REDIS_URL)
+        else:
+            _pubsub = MemoriaPubSub()
+    return _pubsub
+
+
+class PublicadorProgresso:
+    """Publica o progresso de uma tarefa limitado a PROGRESS_MAX_RATE eventos/s.
+
+    Mudanças de status são sempre publicadas; eventos intermediários de bytes são
+    descartados enquanto o intervalo mínimo não tiver passado. Eventos de bytes que
+    passam pelo limite também são entregues a `ao_publicar` (ex.: gravar no TaskStore
+    para quem ainda consulta por polling).
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        pubsub: Optional[ProgressPubSub] = None,
+        taxa_maxima: float = PROGRESS_MAX_RATE,
+        ao_publicar: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.task_id = task_id
+        self._pubsub = pubsub or get_progress_pubsub()
+        self._intervalo = 1.0 / taxa_maxima if taxa_maxima > 0 else 0.0
+        self._ao_publicar = ao_publicar
+        self._ultimo_envio = 0.0
+        self._ultimo_status: Optional[str] = None
+
+    def publicar(self, status: str, forcar: bool = False, **campos: Any) -> bool:
+        agora = time.monotonic()
+        if not forcar and status == self._ultimo_status and agora - self._ultimo_envio < self._intervalo:
+            return False
+        self._ultimo_envio = agora
+        self._ultimo_status = status
+        evento = {"task_id": self.task_id, "status": status, **campos}
+        try:
+            self._pubsub.publicar(self.task_id, evento)
+        except Exception as exc:
+            pubsub_logger.warning("Falha ao publicar progresso", extra={"task_id": self.task_id, "error": str(exc)})
+        return True
+
+    def hook_ytdlp(self, d: Dict[str, Any]) -> None:
+        """Progress hook do yt-dlp (`progress_hooks`)."""
+        if d.get("status") != "downloading":
+            return
+        baixados = d.get("downloaded_bytes") or 0
+        total = d.get("total_bytes") or d.get("total_bytes_estimate")
+        # O arquivo só fica pronto após o pós-processamento; 99% no máximo até lá
+        progresso = min(int(baixados * 100 / total), 99) if total else None
+        campos = {
+            "progress": progresso,
+            "downloaded_bytes": baixados,
+            "total_bytes": total,
+            "speed": d.get("speed"),
+            "eta": d.get("eta"),
+        }
+        if self.publicar(TaskStatus.PROCESSING.value, **campos) and self._ao_publicar is not None:
+            self._ao_publicar(campos)
@@ -0,0 +1,230 @@
+"""Limites de taxa (token bucket) e de concorrência (semáforos) por domínio de origem e por cliente."""
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from app.services.execution_backend import EXECUTION_BACKEND
+
+limiter_logger = logging.getLogger(__name__)
+
+# "memory" (por processo) ou "redis" (compartilhado entre API e workers; necessário com Celery).
+# Sem configuração, segue o backend de execução.
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND")
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL")
+
+# Por cliente (X-API-Key ou IP), aplicados na submissão
+CLIENT_RATE = float(os.environ.get("CLIENT_RATE", "1"))  # requisições por segundo
+CLIENT_BURST = int(os.environ.get("CLIENT_BURST", "20"))
+CLIENT_MAX_ACTIVE = int(os.environ.get("CLIENT_MAX_ACTIVE", "10"))  # downloads em andamento
+
+# Por domínio de origem, aplicados no worker antes de tocar a origem
+DOMAIN_RATE = float(os.environ.get("DOMAIN_RATE", "2"))  # downloads iniciados por segundo
+DOMAIN_BURST = int(os.environ.get("DOMAIN_BURST", "10"))
+DOMAIN_MAX_CONCURRENCY = int(os.environ.get("DOMAIN_MAX_CONCURRENCY", "8"))
+# Sobrescritas por domínio, ex.: {"youtube.com": {"rate": 1, "burst": 5, "concurrency": 4}}
+DOMAIN_LIMITS = json.loads(os.environ.get("DOMAIN_LIMITS", "{}"))
+
+# Slots de processos que morreram expiram sozinhos
+SLOT_TTL = int(os.environ.get("RATE_LIMIT_SLOT_TTL", str(3 * 3600)))
+
+
+class LimiteAtingidoError(Exception):
+    """O limite foi atingido; tente de novo após `retry_after` segundos."""
+
+    def __init__(self, motivo: str, retry_after: float):
+        super().__init__(motivo)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class LimitadorBackend(ABC):
+    @abstractmethod
+    def consumir(self, chave: str, taxa: float, capacidade: int, quantidade: int = 1) -> float:
+        """Consome tokens do balde; retorna 0 se permitido ou os segundos até haver tokens."""
+
+    @abstractmethod
+    def adquirir_slot(self, chave: str, dono: str, limite: int, ttl: int = SLOT_TTL) -> bool:
+        ...
+
+    @abstractmethod
+    def liberar_slot(self, chave: str, dono: str) -> None:
+        ...
+
+    @abstractmethod
+    def slots_em_uso(self, chave: str) -> int:
+        ...
+
+
+class MemoriaLimitador(LimitadorBackend):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baldes: Dict[str, Tuple[float, float]] = {}  # chave -> (tokens, instante)
+        self._slots: Dict[str, Dict[str, float]] = {}  # chave -> {dono: expiração}
+
+    def consumir(self, chave: str, taxa: float, capacidade: int, quantidade: int = 1) -> float:
+        agora = time.monotonic()
+        with self._lock:
+            tokens, instante = self._baldes.get(chave, (float(capacidade), agora))
+            tokens = min(capacidade, tokens + (agora - instante) * taxa)
+            if tokens >= quantidade:
+                self._baldes[chave] = (tokens - quantidade, agora)
+                return 0.0
+            self._baldes[chave] = (tokens, agora)
+            return (quantidade - tokens) / taxa
+
+    def _vivos(self, chave: str) -> Dict[str, float]:
+        agora = time.monotonic()
+        donos = {dono: expira for dono, expira in self._slots.get(chave, {}).items() if expira > agora}
+        self._slots[chave] = donos
+        return donos
+
+    def adquirir_slot(self, chave: str, dono: str, limite: int, ttl: int = SLOT_TTL) -> bool:
+        with self._lock:
+            donos = self._vivos(chave)
+            if dono not in donos and len(donos) >= limite:
+                return False
+            donos[dono] = time.monotonic() + ttl
+            return True
+
+    def liberar_slot(self, chave: str, dono: str) -> None:
+        with self._lock:
+            self._slots.get(chave, {}).pop(dono, None)
+
+    def slots_em_uso(self, chave: str) -> int:
+        with self._lock:
+            return len(self._vivos(chave))
+
+
+# Balde atualizado atomicamente no Redis (KEYS[1] = hash do balde)
+_LUA_CONSUMIR = """
+local taxa, capacidade, quantidade, agora = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local estado = redis.call('HMGET', KEYS[1], 'tokens', 'instante')
+local tokens = tonumber(estado[1]) or capacidade
+local instante = tonumber(estado[2]) or agora
+tokens = math.min(capacidade, tokens + math.max(agora - instante, 0) * taxa)
+local espera = 0
+if tokens >= quantidade then
+    tokens = tokens - quantidade
+else
+    espera = (quantidade - tokens) / taxa
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'instante', agora)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidade / taxa) + 60)
+return tostring(espera)
+"""
+
+# Semáforo distribuído: conjunto ordenado dono -> expiração (KEYS[1])
+_LUA_ADQUIRIR = """
+local agora, limite, ttl, dono = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4]
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', agora)
+if not redis.call('ZSCORE', KEYS[1], dono) and redis.call('ZCARD', KEYS[1]) >= limite then
+    return 0
+end
+redis.call('ZADD', KEYS[1], agora + ttl, dono)
+redis.call('EXPIRE', KEYS[1], ttl)
+return 1
+"""
+
+
+class RedisLimitador(LimitadorBackend):
+    """Limites compartilhados por todos os processos (API e workers Celery)."""
+
+    PREFIXO = "rate-limit:"
+
+    def __init__(self, url: Optional[str] = None):
+        import redis
+
+        if url is None:
+            from app.tasks.celery_config import BROKER_URL
+            url = BROKER_URL
+        self._cliente = redis.Redis.from_url(url)
+        self._consumir = self._cliente.register_script(_LUA_CONSUMIR)
+        self._adquirir = self._cliente.register_script(_LUA_ADQUIRIR)
+
+    def consumir(self, chave: str, taxa: float, capacidade: int, quantidade: int = 1) -> float:
+        return float(self._consumir(keys=[self.PREFIXO + "bucket:" + chave], args=[taxa, capacidade, quantidade, time.time()]))
+
+    def adquirir_slot(self, chave: str, dono: str, limite: int, ttl: int = SLOT_TTL) -> bool:
+        return bool(self._adquirir(keys=[self.PREFIXO + "slots:" + chave], args=[time.time(), limite, ttl, dono]))
+
+    def liberar_slot(self, chave: str, dono: str) -> None:
+        self._cliente.zrem(self.PREFIXO + "slots:" + chave, dono)
+
+    def slots_em_uso(self, chave: str) -> int:
+        chave_redis = self.PREFIXO + "slots:" + chave
+        self._cliente.zremrangebyscore(chave_redis, "-inf", time.time())
+        return self._cliente.zcard(chave_redis)
+
+
+def limites_do_dominio(domain: str) -> Dict[str, Any]:
+    """Limites do domínio, aplicando sobrescritas também a subdomínios (m.youtube.com)."""
+    limites = {"rate": DOMAIN_RATE, "burst": DOMAIN_BURST, "concurrency": DOMAIN_MAX_CONCURRENCY}
+    for configurado, sobrescrita in DOMAIN_LIMITS.items():
+        if domain == configurado or domain.endswith("." + configurado):
+            limites.update(sobrescrita)
+            break
+    return limites
+
+
+class LimitadorDownloads:
+    """Regras de negócio sobre o backend: submissão por cliente e início de download por domínio."""
+
+    def __init__(self, backend: LimitadorBackend):
+        self.backend = backend
+
+    def admitir_cliente(self, cliente: str, task_ids: Tuple[str, ...] = ()) -> None:
+        """Consome um token do cliente e reserva um slot por tarefa; levanta LimiteAtingidoError."""
+        espera = self.backend.consumir(f"cliente:{cliente}", CLIENT_RATE, CLIENT_BURST)
+        if espera > 0:
+            raise LimiteAtingidoError("Limite de requisições do cliente atingido", espera)
+        reservados = []
+        for task_id in task_ids:
+            if not self.backend.adquirir_slot(f"cliente:{cliente}", task_id, CLIENT_MAX_ACTIVE):
+                for reservado in reservados:
+                    self.backend.liberar_slot(f"cliente:{cliente}", reservado)
+                raise LimiteAtingidoError(
+                    f"Cliente já tem {CLIENT_MAX_ACTIVE} downloads em andamento", 1 / max(CLIENT_RATE, 1e-6)
+                )
+            reservados.append(task_id)
+
+    def liberar_cliente(self, cliente: str, task_id: str) -> None:
+        self.backend.liberar_slot(f"cliente:{cliente}", task_id)
+
+    def iniciar_no_dominio(self, domain: str, task_id: str) -> None:
+        """Reserva um slot de download simultâneo na origem e respeita o ritmo de inícios."""
+        limites = limites_do_dominio(domain)
+        if not self.backend.adquirir_slot(f"dominio:{domain}", task_id, int(limites["concurrency"])):
+            raise LimiteAtingidoError(f"Downloads simultâneos em {domain} no limite", 5)
+        espera = self.backend.consumir(f"dominio:{domain}", float(limites["rate"]), int(limites["burst"]))
+        if espera > 0:
+            self.backend.liberar_slot(f"dominio:{domain}", task_id)
+            raise LimiteAtingidoError(f"Ritmo de downloads em {domain} no limite", espera)
+
+    def liberar_dominio(self, domain: str, task_id: str) -> None:
+        self.backend.liberar_slot(f"dominio:{domain}", task_id)
+
+
+_limitador: Optional[LimitadorDownloads] = None
+
+
+def nome_do_backend() -> str:
+    nome = RATE_LIMIT_BACKEND or ("redis" if EXECUTION_BACKEND == "celery" else "memory")
+    if nome == "memory" and EXECUTION_BACKEND == "celery":
+        # A API reservaria o slot do cliente e o worker o liberaria na memória dele:
+        # depois de CLIENT_MAX_ACTIVE downloads o cliente ficaria bloqueado até o SLOT_TTL
+        raise RuntimeError("RATE_LIMIT_BACKEND=memory não funciona com EXECUTION_BACKEND=celery; use redis")
+    return nome
+
+
+def get_limitador() -> LimitadorDownloads:
+    global _limitador
+    if _limitador is None:
+        nome = nome_do_backend()
+        backend = RedisLimitador(RATE_LIMIT_REDIS_URL) if nome == "redis" else MemoriaLimitador()
+        _limitador = LimitadorDownloads(backend)
+        limiter_logger.info(f"Limitador de downloads com backend {nome}")
+    return _limitador
@@ -0,0 +1,220 @@
+"""Cache endereçado por conteúdo de downloads concluídos, com contagem de referências."""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from app.core.database import DATABASE_PATH, conectar_sqlite
+from app.core.metrics import cache_lookups_total
+from app.services.engine_manager import chave_canonica_video
+from app.services.result_storage import ESQUEMA_S3, armazenamento_de, remover_resultado
+
+result_cache_logger = logging.getLogger(__name__)
+
+
+def gerar_chave_resultado(dados_requisicao: Dict[str, Any]) -> str:
+    """Chave do resultado: (vídeo canônico, formato, audio_only, janela de corte, motor, format_id)."""
+
+    def valor(campo: str) -> Any:
+        bruto = dados_requisicao.get(campo)
+        return getattr(bruto, "value", bruto)
+
+    componentes = [
+        chave_canonica_video(str(dados_requisicao.get("video_url", ""))),
+        valor("format"),
+        bool(dados_requisicao.get("audio_only")),
+        valor("start_time"),
+        valor("end_time"),
+        valor("engine") or "auto",
+    ]
+    # Só entra na chave quando presente, preservando as chaves dos pedidos sem format_id
+    if valor("format_id"):
+        componentes.append(valor("format_id"))
+    return hashlib.sha256(json.dumps(componentes).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Mapeia chaves de resultado para arquivos já armazenados.
+
+    Cada tarefa que usa um arquivo mantém uma referência. O gerenciador de armazenamento
+    despeja primeiro entradas sem referências e só toca nas referenciadas sob pressão de cota.
+    """
+
+    def __init__(self, caminho: str = DATABASE_PATH):
+        self._conexao = conectar_sqlite(caminho)
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            self._conexao.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    file_path TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    last_served_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS result_refs (
+                    task_id TEXT PRIMARY KEY,
+                    cache_key TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_result_refs_key ON result_refs (cache_key);
+                CREATE INDEX IF NOT EXISTS idx_result_cache_served ON result_cache (last_served_at);
+                CREATE INDEX IF NOT EXISTS idx_result_cache_file ON result_cache (file_path);
+                """
+            )
+
+    def buscar(self, chave: str) -> Optional[Dict[str, Any]]:
+        """Retorna a entrada se o resultado ainda existir; entradas órfãs são descartadas."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT cache_key, file_path, size_bytes, created_at, last_served_at "
+                "FROM result_cache WHERE cache_key = ?",
+                (chave,),
+            ).fetchone()
+            if linha is not None and not armazenamento_de(linha["file_path"]).existe(linha["file_path"]):
+                result_cache_logger.info("Arquivo em cache sumiu do disco", extra={"file_path": linha["file_path"]})
+                self._conexao.execute("DELETE FROM result_cache WHERE cache_key = ?", (chave,))
+                linha = None
+            if linha is None:
+                self.misses += 1
+                cache_lookups_total.labels("result", "miss").inc()
+                return None
+            self.hits += 1
+            cache_lookups_total.labels("result", "hit").inc()
+            # Reaproveitar conta como uso recente para o despejo LRU
+            self._conexao.execute(
+                "UPDATE result_cache SET last_served_at = ? WHERE cache_key = ?",
+                (datetime.now().isoformat(), chave),
+            )
+            return dict(linha)
+
+    def registrar(self, chave: str, file_path: str, task_id: str, tamanho: Optional[int] = None) -> None:
+        """`file_path` é o localizador do resultado; resultados remotos informam o `tamanho`."""
+        agora = datetime.now().isoformat()
+        if tamanho is None:
+            tamanho = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO result_cache (cache_key, file_path, size_bytes, created_at, last_served_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (chave, file_path, tamanho, agora, agora),
+            )
+            self.adicionar_referencia(chave, task_id)
+
+    def marcar_servido(self, chave: str) -> None:
+        with self._lock:
+            self._conexao.execute(
+                "UPDATE result_cache SET last_served_at = ? WHERE cache_key = ?",
+                (datetime.now().isoformat(), chave),
+            )
+
+    def listar_lru(self, limite: int = 100) -> List[Dict[str, Any]]:
+        """Entradas da menos para a mais recentemente servida, com a contagem de referências."""
+        with self._lock:
+            linhas = self._conexao.execute(
+                "SELECT c.cache_key, c.file_path, c.size_bytes, c.last_served_at, "
+                "(SELECT COUNT(*) FROM result_refs r WHERE r.cache_key = c.cache_key) AS refs "
+                "FROM result_cache c ORDER BY c.last_served_at LIMIT ?",
+                (limite,),
+            ).fetchall()
+        return [dict(linha) for linha in linhas]
+
+    def remover(self, chave: str) -> Optional[str]:
+        """Apaga a entrada, suas referências e o arquivo; devolve o caminho removido."""
+        caminho, _ = self.desindexar(chave)
+        if caminho is not None:
+            remover_resultado(caminho)
+        return caminho
+
+    def desindexar(self, chave: str) -> Tuple[Optional[str], List[str]]:
+        """Apaga a entrada e suas referências sem tocar no arquivo; devolve o caminho e as tarefas que o usavam."""
+        with self._lock:
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = self._conexao.execute(
+                    "SELECT file_path FROM result_cache WHERE cache_key = ?", (chave,)
+                ).fetchone()
+                tarefas = [
+                    ref["task_id"] for ref in self._conexao.execute(
+                        "SELECT task_id FROM result_refs WHERE cache_key = ?", (chave,)
+                    )
+                ]
+                self._conexao.execute("DELETE FROM result_cache WHERE cache_key = ?", (chave,))
+                self._conexao.execute("DELETE FROM result_refs WHERE cache_key = ?", (chave,))
+                self._conexao.execute("COMMIT")
+            except BaseException:
+                self._conexao.execute("ROLLBACK")
+                raise
+        return (linha["file_path"] if linha is not None else None), tarefas
+
+    def contem_arquivo(self, file_path: str) -> bool:
+        with self._lock:
+            return self._conexao.execute(
+                "SELECT 1 FROM result_cache WHERE file_path = ?", (file_path,)
+            ).fetchone() is not None
+
+    def adicionar_referencia(self, chave: str, task_id: str) -> None:
+        with self._lock:
+            self._conexao.execute(
+                "INSERT OR REPLACE INTO result_refs (task_id, cache_key) VALUES (?, ?)", (task_id, chave)
+            )
+
+    def liberar_referencia(self, task_id: str) -> Optional[str]:
+        """Remove a referência da tarefa e devolve a chave que ela usava, se houver."""
+        with self._lock:
+            linha = self._conexao.execute(
+                "SELECT cache_key FROM result_refs WHERE task_id = ?", (task_id,)
+            ).fetchone()
+            if linha is None:
+                return None
+            self._conexao.execute("DELETE FROM result_refs WHERE task_id = ?", (task_id,))
+            return linha["cache_key"]
+
+    def contar_referencias(self, chave: str) -> int:
+        with self._lock:
+            return self._conexao.execute(
+                "SELECT COUNT(*) FROM result_refs WHERE cache_key = ?", (chave,)
+            ).fetchone()[0]
+
+    def remover_se_sem_referencias(self, chave: str) -> bool:
+        """Apaga a entrada e o arquivo quando nenhuma tarefa o referencia mais."""
+        with self._lock:
+            if self.contar_referencias(chave) > 0:
+                return False
+            linha = self._conexao.execute(
+                "SELECT file_path FROM result_cache WHERE cache_key = ?", (chave,)
+            ).fetchone()
+            self._conexao.execute("DELETE FROM result_cache WHERE cache_key = ?", (chave,))
+        if linha is not None:
+            remover_resultado(linha["file_path"])
+        return True
+
+    def bytes_remotos(self) -> int:
+        """Bytes dos resultados em object storage (fora do diretório medido pelo zelador)."""
+        with self._lock:
+            return self._conexao.execute(
+                "SELECT COALESCE(SUM(size_bytes), 0) FROM result_cache WHERE file_path LIKE ?", (ESQUEMA_S3 + "%",)
+            ).fetchone()[0]
+
+    def estatisticas(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache()
+    return _result_cache
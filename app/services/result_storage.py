@@ -0,0 +1,363 @@
+"""Armazenamento dos arquivos prontos: disco local ou object storage compatível com S3 (AWS, MinIO)."""
+from abc import ABC, abstractmethod
+from typing import Any, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+
+from fastapi import Response, status
+from fastapi.responses import RedirectResponse
+
+from app.services.file_delivery import responder_arquivo, tipo_de_midia
+
+storage_logger = logging.getLogger(__name__)
+
+# "local" mantém os resultados em STORAGE_DIR; "s3" envia para o bucket e o disco fica só com downloads em curso
+RESULT_STORAGE_BACKEND = os.environ.get("RESULT_STORAGE_BACKEND", "local")
+# Validade dos links assinados entregues no redirect
+RESULT_URL_TTL = int(os.environ.get("RESULT_URL_TTL", "900"))
+# Chave HMAC dos links locais; precisa ser a mesma em todos os nós que servem /api/v1/files
+RESULT_SIGNING_KEY = os.environ.get("RESULT_SIGNING_KEY")
+# Com disco local compartilhado (ou um servidor de arquivos na frente), responde com redirect assinado
+RESULT_LOCAL_REDIRECT = os.environ.get("RESULT_LOCAL_REDIRECT", "false").lower() == "true"
+RESULT_PUBLIC_BASE_URL = os.environ.get("RESULT_PUBLIC_BASE_URL", "").rstrip("/")
+
+S3_BUCKET = os.environ.get("S3_BUCKET")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")  # ex.: http://minio:9000
+S3_REGION = os.environ.get("S3_REGION", "us-east-1")
+S3_PREFIX = os.environ.get("S3_PREFIX", "results/")
+# MinIO e afins costumam exigir "path"; na AWS o padrão "auto" resolve
+S3_ADDRESSING_STYLE = os.environ.get("S3_ADDRESSING_STYLE", "path" if S3_ENDPOINT_URL else "auto")
+# Partes do multipart (mínimo do S3: 5 MiB, exceto a última); também é o teto de memória por envio
+S3_PART_SIZE = max(int(os.environ.get("S3_PART_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+
+ESQUEMA_S3 = "s3://"
+
+
+class PublicacaoResultadoError(Exception):
+    """O arquivo foi baixado, mas não pôde ser gravado no armazenamento de resultados."""
+
+
+def e_remoto(localizador: str) -> bool:
+    return localizador.startswith(ESQUEMA_S3)
+
+
+class EscritaResultado(ABC):
+    """Gravação incremental de um resultado; `concluir` devolve o localizador a guardar no registro."""
+
+    @abstractmethod
+    def write(self, bloco: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def concluir(self) -> str:
+        ...
+
+    @abstractmethod
+    def abortar(self) -> None:
+        ...
+
+
+class ArmazenamentoResultados(ABC):
+    """
+    Backend dos resultados. O localizador (caminho local ou `s3://bucket/chave`) é o que
+    vai para `file_path` no registro da tarefa e no cache de resultados.
+    """
+
+    nome: str = ""
+    # Se o endpoint de download responde com redirect em vez de carregar os bytes
+    redireciona: bool = False
+
+    @abstractmethod
+    def abrir_escrita(self, destino: str) -> EscritaResultado:
+        """Gravação do resultado que teria `destino` como caminho local."""
+
+    def publicar(self, caminho_local: str) -> str:
+        """Move um arquivo pronto do disco do worker para o backend, em blocos."""
+        escrita = self.abrir_escrita(caminho_local)
+        try:
+            with open(caminho_local, "rb") as arquivo:
+                while True:
+                    bloco = arquivo.read(S3_PART_SIZE)
+                    if not bloco:
+                        break
+                    escrita.write(bloco)
+            localizador = escrita.concluir()
+        except Exception as exc:
+            escrita.abortar()
+            raise PublicacaoResultadoError(f"Falha ao publicar {os.path.basename(caminho_local)}: {exc}") from exc
+        os.remove(caminho_local)
+        return localizador
+
+    @abstractmethod
+    def existe(self, localizador: str) -> bool:
+        ...
+
+    @abstractmethod
+    def remover(self, localizador: str) -> None:
+        ...
+
+    @abstractmethod
+    def url_assinada(self, localizador: str, nome_download: str, ttl: int = RESULT_URL_TTL) -> str:
+        ...
+
+
+class _EscritaLocal(EscritaResultado):
+    def __init__(self, destino: str):
+        self.destino = destino
+        self._parcial = destino + ".part"
+        self._arquivo = open(self._parcial, "wb")
+
+    def write(self, bloco: bytes) -> None:
+        self._arquivo.write(bloco)
+
+    def concluir(self) -> str:
+        self._arquivo.close()
+        os.replace(self._parcial, self.destino)
+        return self.destino
+
+    def abortar(self) -> None:
+        self._arquivo.close()
+        if os.path.exists(self._parcial):
+            os.remove(self._parcial)
+
+
+_chave_efemera: Optional[bytes] = None
+_chave_lock = threading.Lock()
+
+
+def _chave_assinatura() -> bytes:
+    global _chave_efemera
+    if RESULT_SIGNING_KEY:
+        return RESULT_SIGNING_KEY.encode("utf-8")
+    with _chave_lock:
+        if _chave_efemera is None:
+            storage_logger.warning("RESULT_SIGNING_KEY ausente; links assinados só valem neste processo")
+            _chave_efemera = secrets.token_bytes(32)
+    return _chave_efemera
+
+
+def _assinar(nome_arquivo: str, expira: int, nome_download: str) -> str:
+    mensagem = f"{nome_arquivo}\n{expira}\n{nome_download}".encode("utf-8")
+    return hmac.new(_chave_assinatura(), mensagem, hashlib.sha256).hexdigest()
+
+
+def verificar_assinatura(nome_arquivo: str, expira: int, nome_download: str, assinatura: str) -> bool:
+    """Valida um link gerado por ArmazenamentoLocal.url_assinada (HMAC e validade)."""
+    if expira < time.time():
+        return False
+    return hmac.compare_digest(_assinar(nome_arquivo, expira, nome_download), assinatura)
+
+
+class ArmazenamentoLocal(ArmazenamentoResultados):
+    """Resultados no disco onde foram baixados; os links assinados apontam para /api/v1/files."""
+
+    nome = "local"
+
+    def __init__(self, redireciona: bool = RESULT_LOCAL_REDIRECT, url_base: str = RESULT_PUBLIC_BASE_URL):
+        if redireciona and not RESULT_SIGNING_KEY:
+            # Com chave efêmera, um link gerado num nó seria recusado (403) por todos os outros
+            raise ValueError("RESULT_LOCAL_REDIRECT=true exige RESULT_SIGNING_KEY")
+        self.redireciona = redireciona
+        self.url_base = url_base
+
+    def abrir_escrita(self, destino: str) -> EscritaResultado:
+        return _EscritaLocal(destino)
+
+    def publicar(self, caminho_local: str) -> str:
+        # O arquivo já está onde deve ficar
+        return caminho_local
+
+    def existe(self, localizador: str) -> bool:
+        return os.path.exists(localizador)
+
+    def remover(self, localizador: str) -> None:
+        if os.path.exists(localizador):
+            os.remove(localizador)
+
+    def url_assinada(self, localizador: str, nome_download: str, ttl: int = RESULT_URL_TTL) -> str:
+        nome_arquivo = os.path.basename(localizador)
+        expira = int(time.time()) + ttl
+        consulta = urlencode({
+            "expires": expira,
+            "name": nome_download,
+            "signature": _assinar(nome_arquivo, expira, nome_download),
+        })
+        return f"{self.url_base}/api/v1/files/{nome_arquivo}?{consulta}"
+
+
+class _EscritaMultipartS3(EscritaResultado):
+    """
+    Envia o resultado em partes conforme os bytes chegam, sem cópia local completa: no
+    máximo uma parte fica em memória. Resultados menores que uma parte viram um único PUT.
+    """
+
+    def __init__(self, cliente: Any, bucket: str, chave: str, tamanho_parte: int, tipo: str):
+        self._cliente = cliente
+        self.bucket = bucket
+        self.chave = chave
+        self._tamanho_parte = tamanho_parte
+        self._tipo = tipo
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._partes: list = []
+
+    def _enviar_parte(self, dados: bytes) -> None:
+        if self._upload_id is None:
+            self._upload_id = self._cliente.create_multipart_upload(
+                Bucket=self.bucket, Key=self.chave, ContentType=self._tipo
+            )["UploadId"]
+        numero = len(self._partes) + 1
+        resposta = self._cliente.upload_part(
+            Bucket=self.bucket, Key=self.chave, UploadId=self._upload_id, PartNumber=numero, Body=dados
+        )
+        self._partes.append({"ETag": resposta["ETag"], "PartNumber": numero})
+
+    def write(self, bloco: bytes) -> None:
+        self._buffer += bloco
+        while len(self._buffer) >= self._tamanho_parte:
+            self._enviar_parte(bytes(self._buffer[: self._tamanho_parte]))
+            del self._buffer[: self._tamanho_parte]
+
+    def concluir(self) -> str:
+        if self._upload_id is None:
+            self._cliente.put_object(Bucket=self.bucket, Key=self.chave, Body=bytes(self._buffer), ContentType=self._tipo)
+        else:
+            if self._buffer:
+                self._enviar_parte(bytes(self._buffer))
+            self._cliente.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.chave, UploadId=self._upload_id,
+                MultipartUpload={"Parts": self._partes},
+            )
+        self._buffer = bytearray()
+        return f"{ESQUEMA_S3}{self.bucket}/{self.chave}"
+
+    def abortar(self) -> None:
+        self._buffer = bytearray()
+        if self._upload_id is not None:
+            # Partes de uploads não concluídos continuam cobradas até o abort
+            self._cliente.abort_multipart_upload(Bucket=self.bucket, Key=self.chave, UploadId=self._upload_id)
+            self._upload_id = None
+
+
+class ArmazenamentoS3(ArmazenamentoResultados):
+    """
+    Resultados em um bucket S3 (ou MinIO/Ceph via S3_ENDPOINT_URL). Os nós da API não
+    precisam enxergar o disco dos workers nem repassar bytes: o download vira um redirect
+    para uma URL pré-assinada. O índice (cache de resultados) é a fonte de verdade sobre
+    quais objetos existem; regras de ciclo de vida do bucket devem durar mais que TASK_RECORD_TTL.
+    """
+
+    nome = "s3"
+    redireciona = True
+
+    def __init__(
+        self,
+        bucket: Optional[str] = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        prefixo: str = S3_PREFIX,
+        tamanho_parte: int = S3_PART_SIZE,
+        cliente: Any = None,
+    ):
+        if not bucket:
+            raise ValueError("RESULT_STORAGE_BACKEND=s3 exige S3_BUCKET")
+        if cliente is None:
+            import boto3
+            from botocore.config import Config
+
+            cliente = boto3.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                region_name=S3_REGION,
+                config=Config(signature_version="s3v4", s3={"addressing_style": S3_ADDRESSING_STYLE}),
+            )
+        self.bucket = bucket
+        self.prefixo = prefixo
+        self.tamanho_parte = tamanho_parte
+        self._cliente = cliente
+
+    def abrir_escrita(self, destino: str) -> EscritaResultado:
+        nome_arquivo = os.path.basename(destino)
+        return _EscritaMultipartS3(
+            self._cliente, self.bucket, self.prefixo + nome_arquivo, self.tamanho_parte, tipo_de_midia(nome_arquivo)
+        )
+
+    @staticmethod
+    def _dividir(localizador: str) -> Tuple[str, str]:
+        bucket, _, chave = localizador[len(ESQUEMA_S3):].partition("/")
+        return bucket, chave
+
+    def existe(self, localizador: str) -> bool:
+        # Sem HEAD por consulta: objetos só saem pelo despejo, que também limpa o índice
+        return True
+
+    def remover(self, localizador: str) -> None:
+        bucket, chave = self._dividir(localizador)
+        self._cliente.delete_object(Bucket=bucket, Key=chave)
+
+    def url_assinada(self, localizador: str, nome_download: str, ttl: int = RESULT_URL_TTL) -> str:
+        bucket, chave = self._dividir(localizador)
+        return self._cliente.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": bucket,
+                "Key": chave,
+                "ResponseContentDisposition": f'attachment; filename="{nome_download}"',
+                "ResponseContentType": tipo_de_midia(nome_download),
+            },
+            ExpiresIn=ttl,
+        )
+
+
+_armazenamento: Optional[ArmazenamentoResultados] = None
+_armazenamento_local: Optional[ArmazenamentoLocal] = None
+
+
+def get_armazenamento_resultados() -> ArmazenamentoResultados:
+    """Backend configurado em RESULT_STORAGE_BACKEND, usado para gravar novos resultados."""
+    global _armazenamento
+    if _armazenamento is None:
+        _armazenamento = ArmazenamentoS3() if RESULT_STORAGE_BACKEND == "s3" else get_armazenamento_local()
+        storage_logger.info(f"Armazenamento de resultados: {_armazenamento.nome}")
+    return _armazenamento
+
+
+def get_armazenamento_local() -> ArmazenamentoLocal:
+    global _armazenamento_local
+    if _armazenamento_local is None:
+        _armazenamento_local = ArmazenamentoLocal()
+    return _armazenamento_local
+
+
+def armazenamento_de(localizador: str) -> ArmazenamentoResultados:
+    """Backend que guarda `localizador`; resultados locais antigos continuam legíveis após a troca para S3."""
+    if e_remoto(localizador):
+        armazenamento = get_armazenamento_resultados()
+        if not isinstance(armazenamento, ArmazenamentoS3):
+            raise PublicacaoResultadoError(f"Resultado em object storage sem backend S3 configurado: {localizador}")
+        return armazenamento
+    return get_armazenamento_local()
+
+
+def remover_resultado(localizador: str) -> None:
+    armazenamento_de(localizador).remover(localizador)
+
+
+def entregar_resultado(
+    cabecalhos: Mapping[str, str], localizador: str, nome_download: str, metodo: str = "GET"
+) -> Response:
+    """Redirect assinado quando o backend redireciona; senão serve o arquivo local (com Range)."""
+    armazenamento = armazenamento_de(localizador)
+    if armazenamento.redireciona:
+        return RedirectResponse(
+            armazenamento.url_assinada(localizador, nome_download),
+            status_code=status.HTTP_307_TEMPORARY_REDIRECT,
+            # O link expira; proxies não devem reaproveitar o redirect
+            headers={"Cache-Control": "no-store"},
+        )
+    return responder_arquivo(cabecalhos, localizador, nome_download, metodo)
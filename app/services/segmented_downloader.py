@@ -0,0 +1,306 @@
+"""Motor nativo de download segmentado (várias conexões HTTP Range em paralelo)."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import re
+import threading
+import time
+import urllib.request
+
+segmented_logger = logging.getLogger(__name__)
+
+SEGMENTED_CONNECTIONS = int(os.environ.get("SEGMENTED_CONNECTIONS", "4"))
+SEGMENTED_MIN_SEGMENT_SIZE = int(os.environ.get("SEGMENTED_MIN_SEGMENT_SIZE", str(1024 * 1024)))
+SEGMENTED_MAX_RETRIES = int(os.environ.get("SEGMENTED_MAX_RETRIES", "3"))
+SEGMENTED_TIMEOUT = float(os.environ.get("SEGMENTED_TIMEOUT", "30"))
+# Intervalo mínimo entre gravações do checkpoint (cada uma faz fdatasync do .part)
+SEGMENTED_CHECKPOINT_INTERVAL = float(os.environ.get("SEGMENTED_CHECKPOINT_INTERVAL", "2"))
+CHUNK_SIZE = 256 * 1024
+
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+Segmento = Tuple[int, int]  # (início, fim) inclusivos
+
+
+class DownloadSegmentadoError(Exception):
+    """Falha definitiva do motor segmentado (após esgotar as tentativas)."""
+
+
+def sondar_recurso(url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[Optional[int], bool]:
+    """Descobre o tamanho do recurso e se o servidor aceita Range, pedindo só o primeiro byte."""
+    requisicao = urllib.request.Request(url, headers={**(headers or {}), "Range": "bytes=0-0"})
+    with urllib.request.urlopen(requisicao, timeout=SEGMENTED_TIMEOUT) as resposta:
+        if resposta.status == 206:
+            correspondencia = _CONTENT_RANGE.match(resposta.headers.get("Content-Range", ""))
+            if correspondencia and correspondencia.group(3) != "*":
+                return int(correspondencia.group(3)), True
+        tamanho = resposta.headers.get("Content-Length")
+        return (int(tamanho) if tamanho else None), False
+
+
+def dividir_em_segmentos(tamanho: int, conexoes: int, tamanho_minimo: int = SEGMENTED_MIN_SEGMENT_SIZE) -> List[Segmento]:
+    quantidade = max(1, min(conexoes, tamanho // max(tamanho_minimo, 1)))
+    passo = -(-tamanho // quantidade)
+    return [(inicio, min(inicio + passo, tamanho) - 1) for inicio in range(0, tamanho, passo)]
+
+
+def _preallocar(fd: int, tamanho: int) -> None:
+    try:
+        os.posix_fallocate(fd, 0, tamanho)
+    except (AttributeError, OSError):
+        # Plataformas/sistemas de arquivos sem fallocate: arquivo esparso do tamanho final
+        os.ftruncate(fd, tamanho)
+
+
+class _Checkpoint:
+    """
+    Estado dos segmentos em `<parcial>.json`, para retomar após queda do worker.
+
+    Só entram no checkpoint posições cujos bytes já estão no disco: o snapshot das
+    posições é tirado antes do fdatasync, e o JSON é trocado atomicamente depois dele.
+    """
+
+    def __init__(self, caminho: str, fd: int, tamanho: int, identidade: Optional[str], posicoes: Dict[Segmento, int]):
+        self.caminho = caminho
+        self._fd = fd
+        self._tamanho = tamanho
+        self._identidade = identidade
+        self._posicoes = dict(posicoes)
+        self._lock = threading.Lock()
+        # Serializa as gravações: todas passam pelo mesmo `<checkpoint>.tmp`
+        self._escrita = threading.Lock()
+        self._gravado_em = 0.0
+
+    @staticmethod
+    def carregar(caminho: str, parcial: str, tamanho: int, identidade: Optional[str]) -> Optional[Dict[Segmento, int]]:
+        """Posições verificadas de cada segmento, se o checkpoint for do mesmo recurso."""
+        try:
+            with open(caminho, encoding="utf-8") as arquivo:
+                estado = json.load(arquivo)
+            if estado["size"] != tamanho or estado.get("identity") != identidade or os.path.getsize(parcial) != tamanho:
+                return None
+            return {(inicio, fim): posicao for inicio, fim, posicao in estado["segments"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def avancar(self, segmento: Segmento, posicao: int) -> None:
+        with self._lock:
+            self._posicoes[segmento] = posicao
+            agora = time.monotonic()
+            devido = agora - self._gravado_em >= SEGMENTED_CHECKPOINT_INTERVAL
+            if devido:
+                # Reservado sob o lock: só uma das threads grava neste intervalo
+                self._gravado_em = agora
+        if devido:
+            self.gravar()
+
+    def gravar(self) -> None:
+        # O snapshot é tirado já com a escrita reservada, para um estado mais antigo
+        # nunca substituir um mais novo
+        with self._escrita:
+            with self._lock:
+                segmentos = [[inicio, fim, posicao] for (inicio, fim), posicao in self._posicoes.items()]
+                self._gravado_em = time.monotonic()
+            if hasattr(os, "fdatasync"):
+                os.fdatasync(self._fd)
+            else:
+                os.fsync(self._fd)
+            temporario = self.caminho + ".tmp"
+            with open(temporario, "w", encoding="utf-8") as arquivo:
+                json.dump({"size": self._tamanho, "identity": self._identidade, "segments": segmentos}, arquivo)
+            os.replace(temporario, self.caminho)
+
+
+class _Progresso:
+    def __init__(
+        self,
+        total: Optional[int],
+        ao_progredir: Optional[Callable[[Dict[str, Any]], None]],
+        ja_baixados: int = 0,
+    ):
+        self.total = total
+        self.baixados = ja_baixados
+        self._inicio = time.monotonic()
+        self._ao_progredir = ao_progredir
+        self._lock = threading.Lock()
+        # Exceção levantada pelo callback (ex.: cancelamento); interrompe todos os segmentos
+        self.abortado: Optional[BaseException] = None
+
+    def somar(self, quantidade: int) -> None:
+        with self._lock:
+            self.baixados += quantidade
+            baixados = self.baixados
+        if self._ao_progredir is not None:
+            decorrido = max(time.monotonic() - self._inicio, 1e-6)
+            try:
+                # Mesmo formato dos progress_hooks do yt-dlp
+                self._ao_progredir({
+                    "status": "downloading",
+                    "downloaded_bytes": baixados,
+                    "total_bytes": self.total,
+                    "speed": baixados / decorrido,
+                })
+            except Exception as exc:
+                self.abortado = exc
+                raise
+
+
+def _baixar_segmento(
+    url: str,
+    headers: Dict[str, str],
+    fd: int,
+    segmento: Segmento,
+    progresso: _Progresso,
+    tentativas: int,
+    posicao_inicial: Optional[int] = None,
+    checkpoint: Optional[_Checkpoint] = None,
+) -> None:
+    inicio, fim = segmento
+    posicao = inicio if posicao_inicial is None else posicao_inicial
+    if posicao > fim:
+        return
+    for tentativa in range(tentativas + 1):
+        try:
+            requisicao = urllib.request.Request(url, headers={**headers, "Range": f"bytes={posicao}-{fim}"})
+            with urllib.request.urlopen(requisicao, timeout=SEGMENTED_TIMEOUT) as resposta:
+                correspondencia = _CONTENT_RANGE.match(resposta.headers.get("Content-Range", ""))
+                if resposta.status != 206 or not correspondencia or int(correspondencia.group(1)) != posicao:
+                    raise DownloadSegmentadoError(f"Resposta inesperada para o segmento {posicao}-{fim}")
+                while posicao <= fim:
+                    if progresso.abortado is not None:
+                        raise progresso.abortado
+                    bloco = resposta.read(min(CHUNK_SIZE, fim - posicao + 1))
+                    if not bloco:
+                        break
+                    os.pwrite(fd, bloco, posicao)
+                    posicao += len(bloco)
+                    progresso.somar(len(bloco))
+                    if checkpoint is not None:
+                        checkpoint.avancar(segmento, posicao)
+            if posicao > fim:
+                return
+            raise DownloadSegmentadoError(f"Conexão encerrada no byte {posicao} do segmento {inicio}-{fim}")
+        except Exception as exc:
+            if progresso.abortado is not None:
+                raise
+            if tentativa >= tentativas:
+                raise DownloadSegmentadoError(f"Segmento {inicio}-{fim} falhou: {exc}") from exc
+            # Só o segmento é refeito, a partir do último byte gravado
+            segmented_logger.info(
+                "Repetindo segmento",
+                extra={"segment_start": inicio, "resume_at": posicao, "attempt": tentativa + 1, "error": str(exc)},
+            )
+            time.sleep(min(2 ** tentativa * 0.5, 5))
+
+
+def _baixar_conexao_unica(
+    url: str, headers: Dict[str, str], destino_parcial: str, progresso: _Progresso
+) -> None:
+    requisicao = urllib.request.Request(url, headers=headers)
+    with urllib.request.urlopen(requisicao, timeout=SEGMENTED_TIMEOUT) as resposta, open(destino_parcial, "wb") as arquivo:
+        while True:
+            bloco = resposta.read(CHUNK_SIZE)
+            if not bloco:
+                break
+            arquivo.write(bloco)
+            progresso.somar(len(bloco))
+
+
+def baixar_segmentado(
+    url: str,
+    destino: str,
+    conexoes: int = SEGMENTED_CONNECTIONS,
+    headers: Optional[Dict[str, str]] = None,
+    ao_progredir: Optional[Callable[[Dict[str, Any]], None]] = None,
+    tentativas: int = SEGMENTED_MAX_RETRIES,
+    tamanho_minimo_segmento: int = SEGMENTED_MIN_SEGMENT_SIZE,
+    identidade: Optional[str] = None,
+) -> int:
+    """
+    Baixa `url` em `destino` usando até `conexoes` conexões paralelas.
+
+    O arquivo é pré-alocado e cada segmento grava direto na sua posição (pwrite),
+    sem etapa de concatenação. Servidores sem suporte a Range caem para conexão única.
+    Uma exceção levantada por `ao_progredir` aborta todos os segmentos sem novas tentativas.
+    O `.part` e seu checkpoint sobrevivem a uma queda: uma nova chamada com o mesmo
+    destino e o mesmo recurso (tamanho e `identidade`, já que URLs assinadas mudam a cada
+    extração) retoma cada segmento a partir do último byte verificado.
+    Retorna o número de bytes do arquivo.
+    """
+    headers = dict(headers or {})
+    tamanho, aceita_ranges = sondar_recurso(url, headers)
+    destino_parcial = destino + ".part"
+    caminho_checkpoint = destino_parcial + ".json"
+
+    if not aceita_ranges or not tamanho:
+        segmented_logger.info("Servidor sem suporte a Range; usando conexão única", extra={"url": url})
+        progresso = _Progresso(tamanho, ao_progredir)
+        _baixar_conexao_unica(url, headers, destino_parcial, progresso)
+        os.replace(destino_parcial, destino)
+        return progresso.baixados
+
+    posicoes = _Checkpoint.carregar(caminho_checkpoint, destino_parcial, tamanho, identidade)
+    if posicoes:
+        ja_baixados = sum(posicao - inicio for (inicio, _), posicao in posicoes.items())
+        segmented_logger.info("Retomando download segmentado", extra={"bytes_resumed": ja_baixados, "bytes": tamanho})
+    else:
+        posicoes = {segmento: segmento[0] for segmento in dividir_em_segmentos(tamanho, conexoes, tamanho_minimo_segmento)}
+        ja_baixados = 0
+    progresso = _Progresso(tamanho, ao_progredir, ja_baixados)
+    fd = os.open(destino_parcial, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if not ja_baixados:
+            _preallocar(fd, tamanho)
+        checkpoint = _Checkpoint(caminho_checkpoint, fd, tamanho, identidade, posicoes)
+        checkpoint.gravar()
+        try:
+            with ThreadPoolExecutor(max_workers=len(posicoes), thread_name_prefix="segmento") as pool:
+                futuros = [
+                    pool.submit(
+                        _baixar_segmento, url, headers, fd, segmento, progresso, tentativas, posicao, checkpoint
+                    )
+                    for segmento, posicao in posicoes.items()
+                ]
+                for futuro in futuros:
+                    futuro.result()
+        finally:
+            # Falhas também deixam o progresso verificado para a próxima tentativa
+            checkpoint.gravar()
+    finally:
+        os.close(fd)
+    os.replace(destino_parcial, destino)
+    os.remove(caminho_checkpoint)
+    segmented_logger.info(
+        "Download segmentado concluído", extra={"bytes": tamanho, "segments": len(posicoes)}
+    )
+    return tamanho
+
+
+def selecionar_formato_progressivo(info: Dict[str, Any], dados_requisicao: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Escolhe o melhor formato servido por HTTP direto (arquivo único, sem manifest)."""
+    audio_only = bool(dados_requisicao.get("audio_only"))
+    formato_pedido = dados_requisicao.get("format")
+    format_id = dados_requisicao.get("format_id")
+    candidatos = []
+    for formato in info.get("formats") or [info]:
+        if formato.get("protocol") not in ("http", "https") or not formato.get("url"):
+            continue
+        # Com format_id escolhido pelo cliente, só ele serve; se não for progressivo, o yt-dlp assume
+        if format_id and formato.get("format_id") != format_id:
+            continue
+        # Codec ausente significa "desconhecido" (ex.: URL direta genérica), não "sem faixa"
+        tem_video = formato.get("vcodec") != "none"
+        tem_audio = formato.get("acodec") != "none"
+        if audio_only and not (tem_audio and not tem_video):
+            continue
+        if not audio_only and not (tem_video and tem_audio):
+            continue
+        candidatos.append(formato)
+    if not candidatos:
+        return None
+    return max(
+        candidatos,
+        key=lambda f: (f.get("ext") == formato_pedido, f.get("height") or 0, f.get("tbr") or 0),
+    )
@@ -0,0 +1,57 @@
+"""Coalescência de chamadas concorrentes para a mesma chave (single-flight)."""
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+
+single_flight_logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Garante no máximo uma execução em andamento por chave.
+
+    Chamadores que chegam enquanto a execução da chave está em andamento aguardam o
+    mesmo futuro e recebem o mesmo resultado ou a mesma exceção. O cancelamento de um
+    chamador não interrompe a execução compartilhada dos demais.
+    """
+
+    def __init__(self, contador_coalescidas: Optional[Any] = None):
+        # Contador Prometheus opcional, incrementado a cada chamada coalescida
+        self._contador_coalescidas = contador_coalescidas
+        self._em_andamento: Dict[str, "asyncio.Task[Any]"] = {}
+        self.execucoes = 0
+        self.coalescidas = 0
+
+    async def executar(self, chave: str, fabrica: Callable[[], Awaitable[Any]]) -> Any:
+        tarefa = self._em_andamento.get(chave)
+        if tarefa is not None:
+            self.coalescidas += 1
+            if self._contador_coalescidas is not None:
+                self._contador_coalescidas.inc()
+            single_flight_logger.debug("Chamada coalescida", extra={"key": chave})
+        else:
+            self.execucoes += 1
+            tarefa = asyncio.ensure_future(fabrica())
+            self._em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda concluida: self._concluir(chave, concluida))
+        return await asyncio.shield(tarefa)
+
+    def _concluir(self, chave: str, tarefa: "asyncio.Task[Any]") -> None:
+        if self._em_andamento.get(chave) is tarefa:
+            del self._em_andamento[chave]
+        # Se todos os chamadores foram cancelados, ninguém mais lê a exceção: ela é
+        # consumida aqui (sem o aviso "never retrieved" do asyncio) e vai para o log
+        if not tarefa.cancelled() and tarefa.exception() is not None:
+            single_flight_logger.warning(
+                "Execução compartilhada falhou", extra={"key": chave, "error": str(tarefa.exception())}
+            )
+
+    @property
+    def em_andamento(self) -> int:
+        return len(self._em_andamento)
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {
+            "executions": self.execucoes,
+            "coalesced": self.coalescidas,
+            "in_flight": self.em_andamento,
+        }
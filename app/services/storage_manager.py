@@ -0,0 +1,339 @@
+"""Gerenciamento do espaço de app/download: cota, despejo LRU, expiração de tarefas e admissão."""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from app.services.result_cache import ResultCache, get_result_cache
+from app.services.result_storage import PublicacaoResultadoError, e_remoto, remover_resultado
+from app.services.task_store import TaskStore, get_task_store
+
+storage_logger = logging.getLogger(__name__)
+
+STORAGE_DIR = os.environ.get("STORAGE_DIR", os.path.join("app", "download"))
+STORAGE_QUOTA_BYTES = int(os.environ.get("STORAGE_QUOTA_BYTES", str(20 * 1024 ** 3)))
+# Cota própria dos resultados enviados ao object storage; não divide espaço com o disco local
+STORAGE_REMOTE_QUOTA_BYTES = int(os.environ.get("STORAGE_REMOTE_QUOTA_BYTES", str(200 * 1024 ** 3)))
+# Acima da marca alta o zelador despeja até voltar à marca baixa (frações da cota)
+STORAGE_HIGH_WATERMARK = float(os.environ.get("STORAGE_HIGH_WATERMARK", "0.9"))
+STORAGE_LOW_WATERMARK = float(os.environ.get("STORAGE_LOW_WATERMARK", "0.75"))
+# Espaço livre mínimo no disco; abaixo disso novos downloads são recusados
+STORAGE_MIN_FREE_BYTES = int(os.environ.get("STORAGE_MIN_FREE_BYTES", str(2 * 1024 ** 3)))
+TASK_RECORD_TTL = int(os.environ.get("TASK_RECORD_TTL", str(7 * 24 * 3600)))
+STORAGE_JANITOR_INTERVAL = float(os.environ.get("STORAGE_JANITOR_INTERVAL", "300"))
+STORAGE_RETRY_AFTER = int(os.environ.get("STORAGE_RETRY_AFTER", "60"))
+# Parciais de tarefas ainda em andamento sem escrita há mais que isso são dados como abandonados
+STORAGE_PARTIAL_TTL = int(os.environ.get("STORAGE_PARTIAL_TTL", str(24 * 3600)))
+# Parciais sem registro de tarefa só são removidos após esta idade (o registro pode estar sendo criado)
+STORAGE_PARTIAL_GRACE = int(os.environ.get("STORAGE_PARTIAL_GRACE", "3600"))
+
+MOTIVO_DESPEJO = "Arquivo removido para liberar espaço; solicite o download novamente"
+
+_ESTADOS_TERMINAIS = ("completed", "failed", "cancelled")
+# Arquivos gerados pela API antiga ({task_id}.json e os .txt de exemplo de download_file)
+_LEGADO = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.(json|txt)$")
+_TAREFA = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})\.")
+# Intermediários de download: .part (yt-dlp e motor segmentado), checkpoint .part.json,
+# fragmentos .part-FragN, estado .ytdl e o .temp.<ext> do merge do yt-dlp
+_MARCAS_PARCIAL = (".part", ".ytdl", ".temp.")
+
+
+def _e_parcial(nome: str) -> bool:
+    return any(marca in nome for marca in _MARCAS_PARCIAL)
+
+
+def _remover_da_tarefa(task_id: str, diretorio: str, so_parciais: bool) -> int:
+    removidos = 0
+    if not os.path.isdir(diretorio):
+        return 0
+    with os.scandir(diretorio) as entradas:
+        for entrada in entradas:
+            if not entrada.is_file() or not entrada.name.startswith(task_id + "."):
+                continue
+            if so_parciais and not _e_parcial(entrada.name):
+                continue
+            try:
+                os.remove(entrada.path)
+                removidos += 1
+            except FileNotFoundError:
+                continue
+    return removidos
+
+
+def remover_parciais(task_id: str, diretorio: str = STORAGE_DIR) -> int:
+    """Remove os arquivos intermediários de uma tarefa que não será mais retomada."""
+    return _remover_da_tarefa(task_id, diretorio, so_parciais=True)
+
+
+def remover_arquivos_da_tarefa(task_id: str, diretorio: str = STORAGE_DIR) -> int:
+    """Remove parciais e saídas de uma tarefa cancelada (nada dela foi registrado no cache)."""
+    return _remover_da_tarefa(task_id, diretorio, so_parciais=False)
+
+
+class ArmazenamentoCheioError(Exception):
+    """Novos downloads recusados até o zelador liberar espaço."""
+
+    def __init__(self, motivo: str, retry_after: int = STORAGE_RETRY_AFTER):
+        super().__init__(motivo)
+        self.retry_after = retry_after
+
+
+class GerenciadorArmazenamento:
+    """
+    Mantém o diretório de downloads dentro da cota.
+
+    Cada ciclo remove tarefas expiradas (liberando suas referências no cache de resultados)
+    e arquivos legados; se o uso passar da marca alta, despeja resultados do menos para o
+    mais recentemente servido até a marca baixa. Saem primeiro os que nenhuma tarefa usa;
+    se não bastarem, os ainda referenciados também saem, e as tarefas que apontavam para
+    eles passam a responder 410 com o motivo, em vez de a admissão recusar tudo (503).
+    Só arquivos de tarefas contam no uso; o diretório também guarda arquivos do frontend.
+    Resultados no object storage têm cota própria e só são despejados para cumpri-la.
+    """
+
+    def __init__(
+        self,
+        diretorio: str = STORAGE_DIR,
+        cota: int = STORAGE_QUOTA_BYTES,
+        cota_remota: int = STORAGE_REMOTE_QUOTA_BYTES,
+        marca_alta: float = STORAGE_HIGH_WATERMARK,
+        marca_baixa: float = STORAGE_LOW_WATERMARK,
+        livre_minimo: int = STORAGE_MIN_FREE_BYTES,
+        ttl_tarefas: int = TASK_RECORD_TTL,
+        store: Optional[TaskStore] = None,
+        cache: Optional[ResultCache] = None,
+    ):
+        self.diretorio = diretorio
+        self.cota = cota
+        self.cota_remota = cota_remota
+        self.marca_alta = marca_alta
+        self.marca_baixa = marca_baixa
+        self.livre_minimo = livre_minimo
+        self.ttl_tarefas = ttl_tarefas
+        self._store = store
+        self._cache = cache
+        self._lock = threading.Lock()
+        self._uso: Optional[int] = None
+        self._uso_medido_em = 0.0
+        self._uso_remoto: Optional[int] = None
+        self._uso_remoto_medido_em = 0.0
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def store(self) -> TaskStore:
+        return self._store or get_task_store()
+
+    @property
+    def cache(self) -> ResultCache:
+        return self._cache or get_result_cache()
+
+    def medir_uso(self) -> int:
+        """Bytes dos arquivos de tarefas no diretório local."""
+        total = 0
+        for raiz, _, arquivos in os.walk(self.diretorio):
+            for nome in arquivos:
+                if not _TAREFA.match(nome):
+                    continue
+                try:
+                    total += os.stat(os.path.join(raiz, nome)).st_size
+                except FileNotFoundError:
+                    continue
+        self._uso, self._uso_medido_em = total, time.monotonic()
+        return total
+
+    def uso(self, idade_maxima: float = 10.0) -> int:
+        """Uso em bytes, reaproveitando a última medição recente (a admissão roda a cada requisição)."""
+        if self._uso is None or time.monotonic() - self._uso_medido_em > idade_maxima:
+            return self.medir_uso()
+        return self._uso
+
+    def medir_uso_remoto(self) -> int:
+        """Bytes dos resultados já enviados ao object storage."""
+        self._uso_remoto, self._uso_remoto_medido_em = self.cache.bytes_remotos(), time.monotonic()
+        return self._uso_remoto
+
+    def uso_remoto(self, idade_maxima: float = 10.0) -> int:
+        if self._uso_remoto is None or time.monotonic() - self._uso_remoto_medido_em > idade_maxima:
+            return self.medir_uso_remoto()
+        return self._uso_remoto
+
+    def verificar_admissao(self) -> None:
+        """Levanta ArmazenamentoCheioError se um novo download não deve começar agora."""
+        os.makedirs(self.diretorio, exist_ok=True)
+        livre = shutil.disk_usage(self.diretorio).free
+        if livre < self.livre_minimo:
+            self._acordar.set()
+            raise ArmazenamentoCheioError(f"Pouco espaço livre em disco ({livre} bytes)")
+        uso = self.uso()
+        if uso >= self.cota:
+            self._acordar.set()
+            raise ArmazenamentoCheioError(f"Cota de armazenamento atingida ({uso}/{self.cota} bytes)")
+        remoto = self.uso_remoto()
+        if remoto >= self.cota_remota:
+            self._acordar.set()
+            raise ArmazenamentoCheioError(f"Cota do object storage atingida ({remoto}/{self.cota_remota} bytes)")
+        if uso >= self.cota * self.marca_alta or remoto >= self.cota_remota * self.marca_alta:
+            # Ainda cabe, mas o zelador não precisa esperar o próximo intervalo
+            self._acordar.set()
+
+    def expirar_tarefas(self, lote: int = 500) -> int:
+        limite = (datetime.now() - timedelta(seconds=self.ttl_tarefas)).isoformat()
+        removidas = 0
+        for status in _ESTADOS_TERMINAIS:
+            for registro in self.store.listar(status=status, criado_antes=limite, limite=lote):
+                self.cache.liberar_referencia(registro["task_id"])
+                caminho = registro.get("file_path")
+                # Arquivos fora do cache de resultados pertencem só a esta tarefa
+                if caminho and not self.cache.contem_arquivo(caminho):
+                    try:
+                        remover_resultado(caminho)
+                    except PublicacaoResultadoError as e:
+                        # Objeto de quando o backend era S3: fica para o ciclo de vida do bucket
+                        storage_logger.warning(
+                            "Resultado da tarefa expirada não removido",
+                            extra={"task_id": registro["task_id"], "error": str(e)},
+                        )
+                self.store.remover(registro["task_id"])
+                removidas += 1
+        return removidas
+
+    def limpar_legado(self) -> int:
+        limite = time.time() - self.ttl_tarefas
+        removidos = 0
+        with os.scandir(self.diretorio) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and _LEGADO.match(entrada.name) and entrada.stat().st_mtime < limite:
+                    os.remove(entrada.path)
+                    removidos += 1
+        return removidos
+
+    def limpar_parciais(self) -> int:
+        """
+        Coleta parciais órfãos: de tarefas já terminadas, de tarefas sem registro (após a
+        carência) e de tarefas paradas há mais de STORAGE_PARTIAL_TTL. Parciais de tarefas
+        em andamento ficam para que uma reentrega retome o download.
+        """
+        por_tarefa: Dict[str, float] = {}
+        with os.scandir(self.diretorio) as entradas:
+            for entrada in entradas:
+                correspondencia = _TAREFA.match(entrada.name)
+                if entrada.is_file() and correspondencia and _e_parcial(entrada.name):
+                    task_id = correspondencia.group(1)
+                    por_tarefa[task_id] = max(por_tarefa.get(task_id, 0.0), entrada.stat().st_mtime)
+        agora = time.time()
+        removidos = 0
+        for task_id, modificado_em in por_tarefa.items():
+            registro = self.store.obter(task_id)
+            ocioso = agora - modificado_em
+            if registro is None:
+                orfao = ocioso > STORAGE_PARTIAL_GRACE
+            else:
+                orfao = registro.get("status") in _ESTADOS_TERMINAIS or ocioso > STORAGE_PARTIAL_TTL
+            if orfao:
+                removidos += remover_parciais(task_id, self.diretorio)
+                storage_logger.info("Parciais órfãos removidos", extra={"task_id": task_id})
+        return removidos
+
+    def liberar_espaco(self) -> int:
+        """Despeja resultados LRU até a marca baixa de cada cota; retorna os bytes liberados."""
+        liberados = self._despejar(remotos=False, uso=self.medir_uso(), cota=self.cota)
+        self._uso -= liberados
+        liberados_remotos = self._despejar(remotos=True, uso=self.medir_uso_remoto(), cota=self.cota_remota)
+        self._uso_remoto -= liberados_remotos
+        return liberados + liberados_remotos
+
+    def _despejar(self, remotos: bool, uso: int, cota: int) -> int:
+        if uso < cota * self.marca_alta:
+            return 0
+        alvo = cota * self.marca_baixa
+        liberados = 0
+        entradas = [e for e in self.cache.listar_lru(limite=10_000) if e_remoto(e["file_path"]) == remotos]
+        # Ordenação estável: os sem referência primeiro, cada grupo ainda em ordem LRU
+        for entrada in sorted(entradas, key=lambda e: e["refs"] > 0):
+            if uso - liberados <= alvo:
+                break
+            caminho = entrada["file_path"]
+            if remotos:
+                tamanho = entrada["size_bytes"]
+            else:
+                tamanho = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+            _, tarefas = self.cache.desindexar(entrada["cache_key"])
+            try:
+                remover_resultado(caminho)
+            except PublicacaoResultadoError as e:
+                # A entrada já saiu do cache; o objeto fica para o ciclo de vida do bucket
+                storage_logger.warning("Resultado despejado sem remover o objeto", extra={"error": str(e)})
+            for task_id in tarefas:
+                self.store.atualizar(
+                    task_id, file_path=None, download_url=None, result_cache_key=None, error=MOTIVO_DESPEJO
+                )
+            liberados += tamanho
+            storage_logger.info(
+                "Resultado despejado",
+                extra={"cache_key": entrada["cache_key"], "bytes": tamanho, "tasks": len(tarefas)},
+            )
+        if uso - liberados > alvo:
+            storage_logger.warning(
+                "Despejo não alcançou a marca baixa",
+                extra={"usage_bytes": uso - liberados, "target_bytes": alvo, "remote": remotos},
+            )
+        return liberados
+
+    def executar_ciclo(self) -> Dict[str, Any]:
+        with self._lock:
+            resultado = {
+                "expired_tasks": self.expirar_tarefas(),
+                "legacy_files": self.limpar_legado() if os.path.isdir(self.diretorio) else 0,
+                "orphaned_partials": self.limpar_parciais() if os.path.isdir(self.diretorio) else 0,
+                "evicted_bytes": self.liberar_espaco(),
+            }
+        storage_logger.info("Ciclo do zelador concluído", extra=resultado)
+        return resultado
+
+    def _laco(self) -> None:
+        while not self._parar.is_set():
+            try:
+                self.executar_ciclo()
+            except Exception:
+                storage_logger.exception("Falha no ciclo do zelador de armazenamento")
+            self._acordar.wait(STORAGE_JANITOR_INTERVAL)
+            self._acordar.clear()
+
+    def iniciar_zelador(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._laco, name="zelador-armazenamento", daemon=True)
+            self._thread.start()
+
+    def parar_zelador(self) -> None:
+        self._parar.set()
+        self._acordar.set()
+        self._thread = None
+
+    def estatisticas(self) -> Dict[str, Any]:
+        os.makedirs(self.diretorio, exist_ok=True)
+        return {
+            "usage_bytes": self.uso(),
+            "quota_bytes": self.cota,
+            "high_watermark_bytes": int(self.cota * self.marca_alta),
+            "low_watermark_bytes": int(self.cota * self.marca_baixa),
+            "disk_free_bytes": shutil.disk_usage(self.diretorio).free,
+            "min_free_bytes": self.livre_minimo,
+            "remote_usage_bytes": self.uso_remoto(),
+            "remote_quota_bytes": self.cota_remota,
+        }
+
+
+_gerenciador: Optional[GerenciadorArmazenamento] = None
+
+
+def get_gerenciador_armazenamento() -> GerenciadorArmazenamento:
+    global _gerenciador
+    if _gerenciador is None:
+        _gerenciador = GerenciadorArmazenamento()
+    return _gerenciador
@@ -0,0 +1,265 @@
+"""Modo de entrega em fluxo: bytes do motor (e do remux) vão direto para a resposta HTTP."""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import shutil
+import sys
+
+import anyio
+
+from app.services.audio_pipeline import NENHUMA, TRANSCODIFICAR, e_pedido_de_audio, planejar_conversao, seletor_audio
+from app.services.result_storage import get_armazenamento_resultados
+from app.services.trimming import argumento_secao, intervalo_recorte
+
+passthrough_logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", str(64 * 1024)))
+# Blocos mantidos em memória entre o motor e o cliente; cheio, o motor é pausado
+STREAM_BUFFER_CHUNKS = int(os.environ.get("STREAM_BUFFER_CHUNKS", "16"))
+# Se a cópia em disco (para o cache de resultados) é feita por padrão
+STREAM_TEE_DEFAULT = os.environ.get("STREAM_TEE_DEFAULT", "true").lower() == "true"
+STREAM_START_TIMEOUT = float(os.environ.get("STREAM_START_TIMEOUT", "60"))
+
+# Argumentos do ffmpeg para gerar cada formato em saída não pesquisável (pipe)
+_MUXERS_FFMPEG: Dict[str, List[str]] = {
+    "mp4": ["-c", "copy", "-movflags", "frag_keyframe+empty_moov", "-f", "mp4"],
+    "mkv": ["-c", "copy", "-f", "matroska"],
+    "webm": ["-c", "copy", "-f", "webm"],
+    "flv": ["-c:v", "copy", "-c:a", "aac", "-f", "flv"],
+    "mp3": ["-vn", "-c:a", "libmp3lame", "-q:a", "2", "-f", "mp3"],
+    "m4a": ["-vn", "-c:a", "aac", "-movflags", "frag_keyframe+empty_moov", "-f", "ipod"],
+    "aac": ["-vn", "-c:a", "aac", "-f", "adts"],
+    "ogg": ["-vn", "-c:a", "libopus", "-f", "ogg"],
+    "wav": ["-vn", "-c:a", "pcm_s16le", "-f", "wav"],
+}
+
+# Origem com o codec do formato pedido: só troca o contêiner, sem reencodar
+_COPIA_FFMPEG: Dict[str, List[str]] = {
+    "mp3": ["-vn", "-c:a", "copy", "-f", "mp3"],
+    "m4a": ["-vn", "-c:a", "copy", "-movflags", "frag_keyframe+empty_moov", "-f", "ipod"],
+    "aac": ["-vn", "-c:a", "copy", "-f", "adts"],
+    "ogg": ["-vn", "-c:a", "copy", "-f", "ogg"],
+}
+
+_FIM = object()
+
+
+class TransmissaoError(Exception):
+    """O motor terminou com erro (antes ou durante a transmissão)."""
+
+
+class RemuxIndisponivelError(Exception):
+    """O formato pedido precisa do ffmpeg para sair em pipe e ele não está instalado."""
+
+
+def _fonte_de_audio(info: Dict[str, Any], formato: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Melhor formato só de áudio, de arquivo único, que chega a `formato` sem transcodificar."""
+    candidatos = []
+    for fonte in info.get("formats") or []:
+        if fonte.get("vcodec") != "none" or fonte.get("protocol") not in ("http", "https") or not fonte.get("format_id"):
+            continue
+        plano = planejar_conversao(fonte.get("acodec"), fonte.get("ext"), formato)
+        if plano != TRANSCODIFICAR:
+            candidatos.append((fonte.get("abr") or 0, plano == NENHUMA, fonte, plano))
+    if not candidatos:
+        return None, None
+    _, _, fonte, plano = max(candidatos, key=lambda candidato: candidato[:2])
+    return fonte, plano
+
+
+def montar_comandos(dados_requisicao: Dict[str, Any], info: Optional[Dict[str, Any]] = None) -> List[List[str]]:
+    """
+    Monta o pipeline de processos: yt-dlp escrevendo em stdout e, quando o formato
+    pedido tem muxer para pipe, um ffmpeg que remuxa de stdin para stdout. Só formatos
+    de arquivo único são selecionados, já que o merge não funciona em pipe. Sem remux, o
+    seletor aceita apenas arquivos já no formato pedido: os bytes são servidos e gravados
+    com o nome, o tipo e a chave de cache desse formato. Com `info`, pedidos de áudio fixam
+    uma origem que já tem o codec pedido: o ffmpeg só copia o fluxo, ou nem roda quando o
+    contêiner também bate; transcodificação fica para quando nenhuma origem serve.
+    """
+    formato = dados_requisicao.get("format")
+    audio = e_pedido_de_audio(dados_requisicao)
+    fonte, plano = _fonte_de_audio(info, formato) if audio and info and formato in _COPIA_FFMPEG else (None, None)
+    if fonte is not None:
+        seletor = fonte["format_id"]
+        argumentos_ffmpeg = None if plano == NENHUMA else _COPIA_FFMPEG[formato]
+    else:
+        argumentos_ffmpeg = _MUXERS_FFMPEG.get(formato)
+        if audio:
+            seletor = seletor_audio(formato) if argumentos_ffmpeg else f"bestaudio[ext={formato}]"
+        elif argumentos_ffmpeg:
+            seletor = f"best[ext={formato}][vcodec!=none][acodec!=none]/best[vcodec!=none][acodec!=none]/best"
+        else:
+            seletor = f"best[ext={formato}][vcodec!=none][acodec!=none]"
+    if argumentos_ffmpeg and not shutil.which("ffmpeg"):
+        raise RemuxIndisponivelError(f"Transmissão em {formato} exige ffmpeg, que não está instalado")
+    intervalo = intervalo_recorte(dados_requisicao)
+    secao = argumento_secao(intervalo) if intervalo is not None else []
+    comandos = [[
+        sys.executable, "-m", "yt_dlp", "--quiet", "--no-warnings", "--no-part", *secao,
+        "-f", seletor, "-o", "-", dados_requisicao["video_url"],
+    ]]
+    if argumentos_ffmpeg:
+        comandos.append(["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0", *argumentos_ffmpeg, "pipe:1"])
+    return comandos
+
+
+class TransmissaoDownload:
+    """
+    Executa um pipeline de processos e entrega a saída do último como iterador assíncrono.
+
+    A leitura do stdout passa por uma fila limitada (STREAM_BUFFER_CHUNKS); com cliente
+    lento a fila enche, a leitura para, o pipe do SO enche e o próprio motor fica bloqueado
+    na escrita. Opcionalmente grava uma cópia em `destino` pelo armazenamento de resultados
+    (`.part` local ou upload multipart direto, sem cópia em disco), concluída só se o
+    pipeline terminar com sucesso e o cliente receber tudo.
+    """
+
+    def __init__(
+        self,
+        comandos: List[List[str]],
+        destino: Optional[str] = None,
+        ao_concluir: Optional[Callable[[Optional[str], int], None]] = None,
+        ao_falhar: Optional[Callable[[str], None]] = None,
+        tamanho_fila: int = STREAM_BUFFER_CHUNKS,
+    ):
+        self.comandos = comandos
+        self.destino = destino
+        self.ao_concluir = ao_concluir
+        self.ao_falhar = ao_falhar
+        self.bytes_enviados = 0
+        self._fila: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=tamanho_fila)
+        self._processos: List[asyncio.subprocess.Process] = []
+        self._drenos: List[asyncio.Task] = []
+        self._leitor: Optional[asyncio.Task] = None
+        self._erros: List[bytes] = []
+        self._copia = None
+        self._primeiro: Optional[bytes] = None
+        self._concluida = False
+        self._encerrada = False
+
+    async def _iniciar_processos(self) -> None:
+        entrada_anterior: Optional[int] = None
+        for indice, comando in enumerate(self.comandos):
+            ultimo = indice == len(self.comandos) - 1
+            leitura, escrita = (None, None) if ultimo else os.pipe()
+            processo = await asyncio.create_subprocess_exec(
+                *comando,
+                stdin=entrada_anterior if entrada_anterior is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE if ultimo else escrita,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            # As pontas dos pipes ficam só com os processos filhos
+            if entrada_anterior is not None:
+                os.close(entrada_anterior)
+            if escrita is not None:
+                os.close(escrita)
+            entrada_anterior = leitura
+            self._processos.append(processo)
+            self._drenos.append(asyncio.ensure_future(self._drenar_stderr(processo)))
+
+    async def _drenar_stderr(self, processo: asyncio.subprocess.Process) -> None:
+        # Sem drenar, um motor verboso bloquearia com o pipe de stderr cheio
+        while True:
+            linha = await processo.stderr.readline()
+            if not linha:
+                return
+            self._erros = (self._erros + [linha])[-20:]
+
+    async def _ler_saida(self) -> None:
+        saida = self._processos[-1].stdout
+        try:
+            while True:
+                bloco = await saida.read(STREAM_CHUNK_SIZE)
+                if not bloco:
+                    break
+                if self._copia is not None:
+                    await anyio.to_thread.run_sync(self._copia.write, bloco)
+                await self._fila.put(bloco)
+            codigos = [await processo.wait() for processo in self._processos]
+            if any(codigos):
+                detalhe = b"".join(self._erros).decode("utf-8", "replace").strip()
+                raise TransmissaoError(detalhe or f"Pipeline terminou com códigos {codigos}")
+            self._concluida = True
+            await self._fila.put(_FIM)
+        except Exception as exc:
+            await self._fila.put(exc)
+
+    async def _proximo(self) -> Optional[bytes]:
+        item = await self._fila.get()
+        if item is _FIM:
+            return None
+        if isinstance(item, Exception):
+            raise item
+        self.bytes_enviados += len(item)
+        return item
+
+    async def iniciar(self, timeout: float = STREAM_START_TIMEOUT) -> None:
+        """Inicia o pipeline e aguarda o primeiro bloco, para que falhas de extração virem erro HTTP."""
+        if self.destino is not None:
+            self._copia = get_armazenamento_resultados().abrir_escrita(self.destino)
+        try:
+            await self._iniciar_processos()
+            self._leitor = asyncio.ensure_future(self._ler_saida())
+            self._primeiro = await asyncio.wait_for(self._proximo(), timeout)
+        except BaseException as exc:
+            await self.encerrar()
+            if isinstance(exc, asyncio.TimeoutError):
+                raise TransmissaoError("O motor não produziu dados a tempo") from exc
+            raise
+
+    async def corpo(self):
+        """Iterador do corpo da resposta; encerra o pipeline se o cliente desconectar."""
+        try:
+            if self._primeiro is not None:
+                yield self._primeiro
+                while True:
+                    bloco = await self._proximo()
+                    if bloco is None:
+                        break
+                    yield bloco
+        finally:
+            # Na desconexão o escopo já está cancelado; a limpeza precisa terminar mesmo assim
+            with anyio.CancelScope(shield=True):
+                await self.encerrar()
+
+    async def encerrar(self) -> None:
+        if self._encerrada:
+            return
+        self._encerrada = True
+        if self._leitor is not None and not self._leitor.done():
+            self._leitor.cancel()
+        for processo in self._processos:
+            if processo.returncode is None:
+                processo.kill()
+            # wait() só retorna após o EOF dos pipes; o que sobrou no stdout é descartado
+            if processo.stdout is not None:
+                while await processo.stdout.read(STREAM_CHUNK_SIZE):
+                    pass
+            await processo.wait()
+        # Com os processos encerrados, o stderr chega ao EOF e os drenos terminam sozinhos
+        await asyncio.gather(*self._drenos, return_exceptions=True)
+
+        sucesso = self._concluida and self._fila.empty()
+        localizador = None
+        if self._copia is not None:
+            try:
+                if sucesso:
+                    localizador = await anyio.to_thread.run_sync(self._copia.concluir)
+                else:
+                    await anyio.to_thread.run_sync(self._copia.abortar)
+            except Exception as exc:
+                # O cliente já recebeu tudo; só a cópia para o cache se perde
+                passthrough_logger.warning(f"Cópia da transmissão descartada: {exc}")
+                await anyio.to_thread.run_sync(self._copia.abortar)
+
+        if sucesso:
+            passthrough_logger.info("Transmissão concluída", extra={"bytes": self.bytes_enviados})
+            if self.ao_concluir is not None:
+                self.ao_concluir(localizador, self.bytes_enviados)
+        else:
+            motivo = b"".join(self._erros).decode("utf-8", "replace").strip() or "transmissão interrompida"
+            passthrough_logger.info("Transmissão interrompida", extra={"bytes": self.bytes_enviados, "error": motivo})
+            if self.ao_falhar is not None:
+                self.ao_falhar(motivo)
@@ -0,0 +1,297 @@
+"""Armazenamento indexado de tarefas de download (substitui os arquivos JSON por tarefa)."""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+import json
+import logging
+import os
+import threading
+
+from app.core.database import DATABASE_PATH, conectar_sqlite
+from app.models.enums import TaskStatus
+
+store_logger = logging.getLogger(__name__)
+
+TASK_STORE_CACHE_SIZE = int(os.environ.get("TASK_STORE_CACHE_SIZE", "4096"))
+# Margem para gravações de outros processos confirmadas logo após a última validação do cache
+_FOLGA_VALIDACAO = timedelta(seconds=5)
+
+# Colunas próprias da tabela; os demais campos do registro vão para a coluna JSON `data`
+_COLUNAS = ("task_id", "status", "created_at", "updated_at")
+
+
+class TaskStore(ABC):
+    """Interface de persistência dos registros de tarefas."""
+
+    @abstractmethod
+    def criar(self, task_id: str, download_data: Dict[str, Any], **campos: Any) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def criar_varios(self, registros: List[Dict[str, Any]]) -> None:
+        """Cria vários registros de uma vez; cada item tem `task_id` e `download_data`."""
+
+    @abstractmethod
+    def obter(self, task_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def obter_varios(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def atualizar(self, task_id: str, **campos: Any) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def adicionar_filhos(self, task_id: str, filhos: List[str]) -> Optional[Dict[str, Any]]:
+        """Acrescenta IDs a `children` de um lote sem perder os acrescentados em paralelo."""
+
+    @abstractmethod
+    def listar(
+        self,
+        status: Optional[str] = None,
+        criado_antes: Optional[str] = None,
+        limite: int = 100,
+    ) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def remover(self, task_id: str) -> None:
+        ...
+
+
+class SQLiteTaskStore(TaskStore):
+    """TaskStore em SQLite (WAL) com cache LRU de leitura dos registros quentes.
+
+    Consultas de status são atendidas pelo cache sem tocar o disco. Gravações de outros
+    processos (workers Celery) são detectadas via `PRAGMA data_version`, que muda
+    sempre que outra conexão confirma uma transação no banco; aí só saem do cache os
+    registros cujo `updated_at` mudou desde a última validação. Remoções feitas por outro
+    processo (zelador) não são detectadas e saem pelo LRU.
+    """
+
+    def __init__(self, caminho: str = DATABASE_PATH, tamanho_cache: int = TASK_STORE_CACHE_SIZE):
+        self._conexao = conectar_sqlite(caminho)
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._tamanho_cache = tamanho_cache
+        self._versao_dados: Optional[int] = None
+        self._validado_em: Optional[datetime] = None
+        self._criar_tabela()
+
+    def _criar_tabela(self) -> None:
+        with self._lock:
+            self._conexao.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    task_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status);
+                CREATE INDEX IF NOT EXISTS idx_tasks_created_at ON tasks (created_at);
+                CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks (updated_at);
+                """
+            )
+
+    @staticmethod
+    def _para_registro(linha: Any) -> Dict[str, Any]:
+        registro = json.loads(linha["data"])
+        for coluna in _COLUNAS:
+            registro[coluna] = linha[coluna]
+        return registro
+
+    def _validar_cache(self) -> None:
+        versao = self._conexao.execute("PRAGMA data_version").fetchone()[0]
+        if versao == self._versao_dados:
+            return
+        agora = datetime.now()
+        if self._validado_em is None:
+            self._cache.clear()
+        else:
+            # Progresso de workers grava o tempo todo; invalidar tudo a cada gravação anularia o cache
+            desde = (self._validado_em - _FOLGA_VALIDACAO).isoformat()
+            for linha in self._conexao.execute(
+                "SELECT task_id, updated_at FROM tasks WHERE updated_at >= ?", (desde,)
+            ):
+                em_cache = self._cache.get(linha["task_id"])
+                if em_cache is not None and em_cache["updated_at"] != linha["updated_at"]:
+                    del self._cache[linha["task_id"]]
+        self._versao_dados = versao
+        self._validado_em = agora
+
+    def _guardar_no_cache(self, registro: Dict[str, Any]) -> None:
+        self._cache[registro["task_id"]] = registro
+        self._cache.move_to_end(registro["task_id"])
+        while len(self._cache) > self._tamanho_cache:
+            self._cache.popitem(last=False)
+
+    def _gravar(self, registro: Dict[str, Any]) -> None:
+        dados = {k: v for k, v in registro.items() if k not in _COLUNAS}
+        self._conexao.execute(
+            "INSERT OR REPLACE INTO tasks (task_id, status, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?)",
+            (
+                registro["task_id"],
+                registro["status"],
+                registro["created_at"],
+                registro["updated_at"],
+                json.dumps(dados, default=str),
+            ),
+        )
+
+    @staticmethod
+    def _novo_registro(task_id: str, download_data: Dict[str, Any], **campos: Any) -> Dict[str, Any]:
+        agora = datetime.now().isoformat()
+        registro: Dict[str, Any] = {
+            "task_id": task_id,
+            "download_data": download_data,
+            "status": TaskStatus.PENDING.value,
+            "progress": 0,
+            "download_url": None,
+            "error": None,
+            "created_at": agora,
+            "updated_at": agora,
+        }
+        registro.update(campos)
+        return registro
+
+    def criar(self, task_id: str, download_data: Dict[str, Any], **campos: Any) -> Dict[str, Any]:
+        registro = self._novo_registro(task_id, download_data, **campos)
+        with self._lock:
+            self._gravar(registro)
+            self._guardar_no_cache(registro)
+        return dict(registro)
+
+    def criar_varios(self, registros: List[Dict[str, Any]]) -> None:
+        novos = [
+            self._novo_registro(
+                item["task_id"],
+                item["download_data"],
+                **{k: v for k, v in item.items() if k not in ("task_id", "download_data")},
+            )
+            for item in registros
+        ]
+        with self._lock:
+            # Uma única transação (e um único fsync) para o lote inteiro
+            self._conexao.execute("BEGIN")
+            try:
+                for registro in novos:
+                    self._gravar(registro)
+                self._conexao.execute("COMMIT")
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+            for registro in novos:
+                self._guardar_no_cache(registro)
+
+    def obter(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._validar_cache()
+            registro = self._cache.get(task_id)
+            if registro is None:
+                linha = self._conexao.execute(
+                    "SELECT task_id, status, created_at, updated_at, data FROM tasks WHERE task_id = ?",
+                    (task_id,),
+                ).fetchone()
+                if linha is None:
+                    return None
+                registro = self._para_registro(linha)
+            self._guardar_no_cache(registro)
+            return dict(registro)
+
+    def obter_varios(self, task_ids: List[str]) -> List[Dict[str, Any]]:
+        """Busca vários registros, consultando o SQLite só para os que não estão no cache."""
+        with self._lock:
+            self._validar_cache()
+            encontrados = {tid: self._cache[tid] for tid in task_ids if tid in self._cache}
+            faltando = [tid for tid in task_ids if tid not in encontrados]
+            # Limite de parâmetros por consulta do SQLite
+            for inicio in range(0, len(faltando), 500):
+                parte = faltando[inicio:inicio + 500]
+                marcadores = ",".join("?" * len(parte))
+                for linha in self._conexao.execute(
+                    f"SELECT task_id, status, created_at, updated_at, data FROM tasks WHERE task_id IN ({marcadores})",
+                    parte,
+                ):
+                    registro = self._para_registro(linha)
+                    self._guardar_no_cache(registro)
+                    encontrados[registro["task_id"]] = registro
+            return [dict(encontrados[tid]) for tid in task_ids if tid in encontrados]
+
+    def atualizar(self, task_id: str, **campos: Any) -> Optional[Dict[str, Any]]:
+        return self._alterar(task_id, lambda registro: registro.update(campos))
+
+    def adicionar_filhos(self, task_id: str, filhos: List[str]) -> Optional[Dict[str, Any]]:
+        def acrescentar(registro: Dict[str, Any]) -> None:
+            registro["children"] = (registro.get("children") or []) + list(filhos)
+
+        return self._alterar(task_id, acrescentar)
+
+    def _alterar(self, task_id: str, alteracao: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            # Lê e grava na mesma transação de escrita: API e workers atualizam o mesmo
+            # registro (cancelamento, filhas do lote, progresso) e nenhum pode desfazer o outro
+            self._conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = self._conexao.execute(
+                    "SELECT task_id, status, created_at, updated_at, data FROM tasks WHERE task_id = ?",
+                    (task_id,),
+                ).fetchone()
+                if linha is None:
+                    self._conexao.execute("ROLLBACK")
+                    return None
+                registro = self._para_registro(linha)
+                alteracao(registro)
+                if isinstance(registro.get("status"), TaskStatus):
+                    registro["status"] = registro["status"].value
+                registro["updated_at"] = datetime.now().isoformat()
+                self._gravar(registro)
+                self._conexao.execute("COMMIT")
+            except Exception:
+                self._conexao.execute("ROLLBACK")
+                raise
+            self._guardar_no_cache(registro)
+            return dict(registro)
+
+    def listar(
+        self,
+        status: Optional[str] = None,
+        criado_antes: Optional[str] = None,
+        limite: int = 100,
+    ) -> List[Dict[str, Any]]:
+        filtros, parametros = [], []
+        if status is not None:
+            filtros.append("status = ?")
+            parametros.append(status)
+        if criado_antes is not None:
+            filtros.append("created_at < ?")
+            parametros.append(criado_antes)
+        where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+        parametros.append(limite)
+        with self._lock:
+            linhas = self._conexao.execute(
+                f"SELECT task_id, status, created_at, updated_at, data FROM tasks {where} "
+                "ORDER BY created_at LIMIT ?",
+                parametros,
+            ).fetchall()
+        return [self._para_registro(linha) for linha in linhas]
+
+    def remover(self, task_id: str) -> None:
+        with self._lock:
+            self._conexao.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,))
+            self._cache.pop(task_id, None)
+
+
+_task_store: Optional[TaskStore] = None
+
+
+def get_task_store() -> TaskStore:
+    """Retorna o TaskStore do processo (API ou worker)."""
+    global _task_store
+    if _task_store is None:
+        _task_store = SQLiteTaskStore()
+    return _task_store
@@ -0,0 +1,115 @@
+"""Recorte por start_time/end_time baixando apenas o trecho pedido, com métricas de economia."""
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import math
+import threading
+
+from app.core.database import DATABASE_PATH, conectar_sqlite
+from yt_dlp.utils import download_range_func
+
+trim_logger = logging.getLogger(__name__)
+
+Intervalo = Tuple[float, float]  # (início, fim) em segundos; fim pode ser infinito
+
+
+def converter_tempo(valor: str) -> int:
+    """Converte HH:MM:SS (formato validado em DownloadRequest) em segundos."""
+    horas, minutos, segundos = map(int, valor.split(":"))
+    return horas * 3600 + minutos * 60 + segundos
+
+
+def intervalo_recorte(dados_requisicao: Dict[str, Any]) -> Optional[Intervalo]:
+    """Retorna o trecho pedido, ou None quando o vídeo deve ser baixado inteiro."""
+    inicio = dados_requisicao.get("start_time")
+    fim = dados_requisicao.get("end_time")
+    if not inicio and not fim:
+        return None
+    return (
+        float(converter_tempo(inicio)) if inicio else 0.0,
+        float(converter_tempo(fim)) if fim else math.inf,
+    )
+
+
+def opcoes_recorte_ytdlp(intervalo: Intervalo) -> Dict[str, Any]:
+    """
+    Opções do yt-dlp para baixar só o trecho. O yt-dlp delega ao ffmpeg com seek na
+    entrada: em HLS/DASH apenas os fragmentos que cobrem a janela são buscados e, em
+    arquivos progressivos, o seek vira requisições Range a partir do índice do contêiner.
+    """
+    return {
+        "download_ranges": download_range_func(None, [intervalo]),
+        # Cortes em keyframe evitam reencodar o trecho inteiro
+        "force_keyframes_at_cuts": False,
+    }
+
+
+def argumento_secao(intervalo: Intervalo) -> List[str]:
+    """Equivalente em linha de comando (--download-sections) para o modo em fluxo."""
+    inicio, fim = intervalo
+    fim_txt = "inf" if math.isinf(fim) else f"{fim:g}"
+    return ["--download-sections", f"*{inicio:g}-{fim_txt}"]
+
+
+def estimar_tamanho_completo(info: Dict[str, Any]) -> Optional[int]:
+    """Estima quantos bytes o download completo teria, a partir dos formatos escolhidos."""
+    formatos = info.get("requested_formats") or [info]
+    total = 0
+    for formato in formatos:
+        tamanho = formato.get("filesize") or formato.get("filesize_approx")
+        if not tamanho and formato.get("tbr") and info.get("duration"):
+            # tbr em kbit/s
+            tamanho = formato["tbr"] * 125 * info["duration"]
+        if not tamanho:
+            return None
+        total += tamanho
+    return int(total)
+
+
+class MetricasRecorte:
+    """Totais acumulados de downloads recortados, persistidos no SQLite (API e workers)."""
+
+    def __init__(self, caminho: str = DATABASE_PATH):
+        self._conexao = conectar_sqlite(caminho)
+        self._lock = threading.Lock()
+        self._conexao.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS trim_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                trimmed_downloads INTEGER NOT NULL,
+                bytes_fetched INTEGER NOT NULL,
+                bytes_full_estimate INTEGER NOT NULL,
+                bytes_saved INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO trim_stats VALUES (1, 0, 0, 0, 0);
+            """
+        )
+
+    def registrar(self, bytes_baixados: int, bytes_completo: Optional[int]) -> Optional[int]:
+        """Soma um download recortado; retorna a economia estimada (None sem estimativa)."""
+        economia = max(bytes_completo - bytes_baixados, 0) if bytes_completo else None
+        with self._lock:
+            self._conexao.execute(
+                "UPDATE trim_stats SET trimmed_downloads = trimmed_downloads + 1, "
+                "bytes_fetched = bytes_fetched + ?, bytes_full_estimate = bytes_full_estimate + ?, "
+                "bytes_saved = bytes_saved + ? WHERE id = 1",
+                (bytes_baixados, bytes_completo or 0, economia or 0),
+            )
+        return economia
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            linha = self._conexao.execute("SELECT * FROM trim_stats WHERE id = 1").fetchone()
+        dados = {chave: linha[chave] for chave in linha.keys() if chave != "id"}
+        completo = dados["bytes_full_estimate"]
+        dados["saved_ratio"] = dados["bytes_saved"] / completo if completo else 0.0
+        return dados
+
+
+_metricas_recorte: Optional[MetricasRecorte] = None
+
+
+def get_metricas_recorte() -> MetricasRecorte:
+    global _metricas_recorte
+    if _metricas_recorte is None:
+        _metricas_recorte = MetricasRecorte()
+    return _metricas_recorte
@@ -1,9 +1,26 @@
 from celery import Celery
+from celery.signals import setup_logging, task_postrun, task_prerun, worker_process_shutdown
+from kombu import Queue
 import os
 
 BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
 BACKEND_URL = os.environ.get("CELERY_RESULT_BACKEND", BROKER_URL)
 
+# Filas separadas para que downloads longos não bloqueiem clipes curtos e áudio
+FILA_CURTA = "short"
+FILA_LONGA = "long"
+FILA_POS_PROCESSAMENTO = "postprocess"
+FILAS = (FILA_CURTA, FILA_LONGA, FILA_POS_PROCESSAMENTO)
+
+# Concorrência de cada pool de workers (ver app/tasks/worker.py)
+CONCORRENCIA_POR_FILA = {
+    FILA_CURTA: int(os.environ.get("CELERY_SHORT_CONCURRENCY", "4")),
+    FILA_LONGA: int(os.environ.get("CELERY_LONG_CONCURRENCY", "2")),
+    FILA_POS_PROCESSAMENTO: int(os.environ.get("CELERY_POSTPROCESS_CONCURRENCY", str(os.cpu_count() or 2))),
+}
+
+PRIORIDADE_MAXIMA = 9
+
 celery_app_instance = Celery(
     'video_downloader_tasks',
     broker=BROKER_URL,
@@ -18,6 +35,65 @@ celery_app_instance.conf.update(
     timezone='UTC',
     enable_utc=True,
     task_acks_late=True,
+    # Sem isto, um worker morto (OOM, SIGKILL) tem a tarefa confirmada como falha em vez de
+    # reentregue; com a reentrega, o download retoma dos parciais da mesma tarefa
+    task_reject_on_worker_lost=True,
     worker_prefetch_multiplier=1,
     task_track_started=True,
+    task_queues=[Queue(fila, queue_arguments={'x-max-priority': PRIORIDADE_MAXIMA + 1}) for fila in FILAS],
+    task_default_queue=FILA_LONGA,
+    task_routes={'tasks.pos_processar_audio': {'queue': FILA_POS_PROCESSAMENTO}},
+    task_queue_max_priority=PRIORIDADE_MAXIMA + 1,
+    task_default_priority=5,
+    # No Redis a prioridade é emulada com sub-filas; sem isso ela seria ignorada
+    broker_transport_options={
+        'priority_steps': list(range(PRIORIDADE_MAXIMA + 1)),
+        'sep': ':',
+        'queue_order_strategy': 'priority',
+    },
 )
+
+
+def prioridade_no_broker(prioridade: int) -> int:
+    """Converte a prioridade da aplicação (maior = mais urgente) para a escala do broker.
+
+    O AMQP entrega primeiro as mensagens de maior prioridade; o transporte Redis, as de menor.
+    """
+    prioridade = max(0, min(prioridade, PRIORIDADE_MAXIMA))
+    if BROKER_URL.startswith(("redis://", "rediss://")):
+        return PRIORIDADE_MAXIMA - prioridade
+    return prioridade
+
+
+@worker_process_shutdown.connect
+def _descartar_metricas_do_processo(pid=None, **kwargs):
+    # Com PROMETHEUS_MULTIPROC_DIR, os gauges "live" do processo filho saem da agregação
+    from app.core.metrics import marcar_processo_encerrado
+
+    marcar_processo_encerrado(pid or os.getpid())
+
+
+@setup_logging.connect
+def _configurar_logging(**kwargs):
+    # Conectar este sinal impede o Celery de reconfigurar o logger raiz
+    from app.core.logging_config import setup_logging as configurar
+
+    configurar()
+
+
+@task_prerun.connect
+def _definir_correlation_id(task_id=None, task=None, args=None, **kwargs):
+    from app.core.logging_config import correlation_id_var
+
+    # O ID da requisição HTTP viaja no payload; tarefas sem ele usam o próprio task_id
+    payload = args[0] if args and isinstance(args[0], dict) else {}
+    task.request.correlation_token = correlation_id_var.set(payload.get("correlation_id") or task_id)
+
+
+@task_postrun.connect
+def _limpar_correlation_id(task=None, **kwargs):
+    from app.core.logging_config import correlation_id_var
+
+    token = getattr(task.request, "correlation_token", None)
+    if token is not None:
+        correlation_id_var.reset(token)
@@ -1,39 +1,21 @@
-from .celery_config import celery_app_instance as app
-from app.services.engine_manager import selecionar_motores_para_url
-import logging
-import os
-from yt_dlp import YoutubeDL
-
-logger = logging.getLogger(__name__)
+from .celery_config import FILA_POS_PROCESSAMENTO, celery_app_instance as app
+from app.services.download_runner import concluir_pos_processamento, executar_download
+from app.services.rate_limiter import LimiteAtingidoError
 
 @app.task(bind=True, name='tasks.processar_download_video')
 def processar_download_video(self, dados_requisicao_dict: dict):
-    task_id = self.request.id
-    video_url = dados_requisicao_dict.get('video_url')
-    engine_client = dados_requisicao_dict.get('engine')
+    # Transcodificações (CPU) saem do pool de downloads (rede) para a fila própria
+    def agendar_pos_processamento(*argumentos):
+        pos_processar_audio.apply_async(args=list(argumentos), queue=FILA_POS_PROCESSAMENTO)
 
-    engines = selecionar_motores_para_url(video_url, engine_client)
-    output_dir = os.path.join('app', 'download')
-    os.makedirs(output_dir, exist_ok=True)
+    try:
+        fila = (self.request.delivery_info or {}).get('routing_key') or 'celery'
+        return executar_download(self.request.id, dados_requisicao_dict, agendar_pos_processamento, fila)
+    except LimiteAtingidoError as e:
+        # Origem no limite: a tarefa volta para a fila em vez de falhar
+        raise self.retry(countdown=e.retry_after, max_retries=None)
 
-    for engine in engines:
-        try:
-            ydl_opts = {'outtmpl': os.path.join(output_dir, f"{task_id}.%(ext)s")}
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_url, download=True)
-            file_path = ydl.prepare_filename(info)
-            logger.info(f"Download concluído com {engine} para {video_url}")
-            return {
-                'task_id': task_id,
-                'status': 'completed',
-                'file_path': file_path,
-                'engine_used': engine
-            }
-        except Exception as e:
-            logger.warning(f"Motor {engine} falhou para {video_url}: {e}")
-            continue
-    return {
-        'task_id': task_id,
-        'status': 'failed',
-        'error': 'all engines failed'
-    }
+@app.task(bind=True, name='tasks.pos_processar_audio')
+def pos_processar_audio(self, task_id: str, file_path: str, acodec: str, formato_audio: str,
+                        chave_resultado: str, engine: str):
+    return concluir_pos_processamento(task_id, file_path, acodec, formato_audio, chave_resultado, engine)
@@ -0,0 +1,63 @@
+"""Escolha de fila e prioridade Celery a partir das estimativas de tamanho e duração."""
+from typing import Any, Dict, Optional, Tuple
+import logging
+import os
+
+from app.services.audio_pipeline import e_pedido_de_audio
+from app.services.metadata_cache import get_metadata_cache
+from app.services.trimming import estimar_tamanho_completo, intervalo_recorte
+from app.tasks.celery_config import FILA_CURTA, FILA_LONGA
+
+routing_logger = logging.getLogger(__name__)
+
+# Limites para um job ser considerado curto (interativo)
+SHORT_JOB_MAX_SECONDS = float(os.environ.get("SHORT_JOB_MAX_SECONDS", "900"))
+SHORT_JOB_MAX_BYTES = int(os.environ.get("SHORT_JOB_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def estimar_job(dados_requisicao: Dict[str, Any], info: Optional[Dict[str, Any]]) -> Tuple[Optional[float], Optional[int]]:
+    """Duração (s) e bytes esperados do job, considerando o recorte pedido."""
+    duracao = info.get("duration") if info else None
+    tamanho = estimar_tamanho_completo(info) if info else None
+    intervalo = intervalo_recorte(dados_requisicao)
+    if intervalo is not None:
+        inicio, fim = intervalo
+        fim = min(fim, duracao) if duracao else fim
+        janela = fim - inicio
+        if duracao and tamanho:
+            tamanho = int(tamanho * max(janela, 0) / duracao)
+        duracao = janela if janela != float("inf") else duracao
+    if tamanho and e_pedido_de_audio(dados_requisicao) and info and info.get("tbr") and info.get("abr"):
+        # Só a faixa de áudio é baixada
+        tamanho = int(tamanho * info["abr"] / info["tbr"])
+    return duracao, tamanho
+
+
+def escolher_fila(dados_requisicao: Dict[str, Any], info: Optional[Dict[str, Any]] = None) -> Tuple[str, int]:
+    """
+    Retorna (fila, prioridade 0-9, maior = mais urgente).
+
+    Os metadados vêm do cache de extração (preenchido por /video/info e /video/options);
+    sem eles, pedidos de áudio vão para a fila curta e os demais para a longa.
+    Itens de lote recebem prioridade menor que pedidos individuais da mesma fila.
+    """
+    if info is None:
+        info = get_metadata_cache().obter(str(dados_requisicao.get("video_url", "")))
+    duracao, tamanho = estimar_job(dados_requisicao, info)
+
+    if duracao is None and tamanho is None:
+        curto = e_pedido_de_audio(dados_requisicao) or intervalo_recorte(dados_requisicao) is not None
+    else:
+        curto = (duracao is None or duracao <= SHORT_JOB_MAX_SECONDS) and (
+            tamanho is None or tamanho <= SHORT_JOB_MAX_BYTES
+        )
+    fila = FILA_CURTA if curto else FILA_LONGA
+    prioridade = 7 if curto else 4
+    if e_pedido_de_audio(dados_requisicao):
+        prioridade += 1
+    if dados_requisicao.get("parent_id"):
+        prioridade -= 2
+    routing_logger.debug(
+        "Fila escolhida", extra={"queue": fila, "priority": prioridade, "duration": duracao, "bytes": tamanho}
+    )
+    return fila, prioridade
@@ -0,0 +1,26 @@
+# app/tasks/worker.py - Inicia um pool de workers Celery dedicado a uma fila
+#
+# Uso: python -m app.tasks.worker short|long|postprocess
+# Cada fila roda em seu próprio processo, com a concorrência de CONCORRENCIA_POR_FILA,
+# para que a fila curta seja dimensionada para latência sem disputar slots com a longa.
+
+import sys
+
+from app.tasks.celery_config import CONCORRENCIA_POR_FILA, FILAS, celery_app_instance
+
+
+def iniciar_worker(fila: str) -> None:
+    if fila not in FILAS:
+        raise SystemExit(f"Fila desconhecida: {fila}. Use uma de: {', '.join(FILAS)}")
+    celery_app_instance.worker_main([
+        "worker",
+        "--queues", fila,
+        "--concurrency", str(CONCORRENCIA_POR_FILA[fila]),
+        "--hostname", f"{fila}@%h",
+        "--prefetch-multiplier", "1",
+        "--loglevel", "INFO",
+    ])
+
+
+if __name__ == "__main__":
+    iniciar_worker(sys.argv[1] if len(sys.argv) > 1 else "long")
@@ -0,0 +1 @@
+"""Benchmarks reproduzíveis da API (ver benchmarks/bench_api.py)."""
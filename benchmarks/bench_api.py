@@ -0,0 +1,287 @@
+"""
+Benchmark dos endpoints da API com o motor yt-dlp falso (sem rede).
+
+Uso:
+    python -m benchmarks.bench_api --requests 500 --concurrency 32 --output resultado.json
+    python -m benchmarks.bench_api --compare resultado_anterior.json
+
+As requisições vão direto para o app ASGI (httpx.ASGITransport), então o resultado mede
+a API, o executor de extração, o backend em processo e o SQLite, sem servidor nem rede.
+Tudo roda em um diretório temporário; a saída é JSON para comparar execuções entre commits.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+RAIZ_REPOSITORIO = Path(__file__).resolve().parents[1]
+
+CENARIOS = ("health", "video_info", "video_info_cached", "video_options", "submit", "status", "file")
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil pelo método do posto mais próximo (valores já ordenados)."""
+    if not valores:
+        return 0.0
+    posto = max(1, math.ceil(p / 100 * len(valores)))
+    return valores[min(posto, len(valores)) - 1]
+
+
+def resumir(latencias: List[float], erros: int, duracao: float) -> Dict[str, Any]:
+    ordenadas = sorted(latencias)
+    total = len(latencias) + erros
+    return {
+        "requests": total,
+        "errors": erros,
+        "duration_s": round(duracao, 4),
+        "throughput_rps": round(total / duracao, 2) if duracao > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(ordenadas) * 1000, 3) if ordenadas else 0.0,
+            "p50": round(percentil(ordenadas, 50) * 1000, 3),
+            "p95": round(percentil(ordenadas, 95) * 1000, 3),
+            "p99": round(percentil(ordenadas, 99) * 1000, 3),
+            "max": round(ordenadas[-1] * 1000, 3) if ordenadas else 0.0,
+        },
+    }
+
+
+async def medir(
+    total: int, concorrencia: int, requisicao: Callable[[int], Awaitable[Any]]
+) -> Dict[str, Any]:
+    """Executa `total` chamadas com no máximo `concorrencia` simultâneas; status >= 400 conta como erro."""
+    latencias: List[float] = []
+    erros = 0
+    proximo = iter(range(total))
+
+    async def trabalhador() -> None:
+        nonlocal erros
+        for indice in proximo:
+            inicio = time.perf_counter()
+            try:
+                resposta = await requisicao(indice)
+                falhou = resposta.status_code >= 400
+            except Exception:
+                falhou = True
+            if falhou:
+                erros += 1
+            else:
+                latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(max(1, min(concorrencia, total)))))
+    return resumir(latencias, erros, time.perf_counter() - inicio)
+
+
+async def executar_cenarios(app: Any, args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    resultados: Dict[str, Any] = {}
+    cenarios = set(args.scenarios)
+    n, c = args.requests, args.concurrency
+    url_base = "https://www.youtube.com/watch?v="
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=None) as cliente:
+        if "health" in cenarios:
+            resultados["health"] = await medir(n, c, lambda i: cliente.get("/api/v1/health"))
+        if "video_info" in cenarios:
+            # URLs distintas: cada chamada passa pelo executor de extração
+            resultados["video_info"] = await medir(
+                n, c, lambda i: cliente.get("/api/v1/video/info", params={"url": f"{url_base}frio{i}"})
+            )
+        await cliente.get("/api/v1/video/info", params={"url": f"{url_base}quente"})
+        if "video_info_cached" in cenarios:
+            resultados["video_info_cached"] = await medir(
+                n, c, lambda i: cliente.get("/api/v1/video/info", params={"url": f"{url_base}quente"})
+            )
+        if "video_options" in cenarios:
+            resultados["video_options"] = await medir(
+                n, c, lambda i: cliente.get("/api/v1/video/options", params={"url": f"{url_base}quente"})
+            )
+
+        task_ids: List[str] = []
+        enviados_em: Dict[str, float] = {}
+        concluidas_em: Dict[str, float] = {}
+        if cenarios & {"submit", "status", "file"}:
+            async def submeter(i: int) -> Any:
+                resposta = await cliente.post(
+                    "/api/v1/video/download",
+                    json={"video_url": f"{url_base}job{i}", "format": "mp4", "engine": "yt-dlp"},
+                )
+                if resposta.status_code < 400:
+                    task_id = resposta.json()["data"]["task_id"]
+                    task_ids.append(task_id)
+                    enviados_em[task_id] = time.perf_counter()
+                return resposta
+
+            resultados["submit"] = await medir(args.jobs, c, submeter)
+
+            pendentes = list(task_ids)
+
+            async def consultar(i: int) -> Any:
+                task_id = pendentes[i % len(pendentes)]
+                resposta = await cliente.get(f"/api/v1/video/task/{task_id}")
+                if resposta.status_code < 400 and resposta.json()["data"]["status"] in ("completed", "failed"):
+                    concluidas_em.setdefault(task_id, time.perf_counter())
+                return resposta
+
+            # Polling como um cliente faria, até todas as tarefas terminarem (ou o prazo acabar)
+            sondagens: List[Dict[str, Any]] = []
+            prazo = time.perf_counter() + args.job_timeout
+            while pendentes and time.perf_counter() < prazo:
+                sondagens.append(await medir(len(pendentes), c, consultar))
+                pendentes = [task_id for task_id in pendentes if task_id not in concluidas_em]
+                if pendentes:
+                    await asyncio.sleep(args.poll_interval)
+            if "status" in cenarios and sondagens:
+                resultados["status"] = await medir(
+                    n, c, lambda i: cliente.get(f"/api/v1/video/task/{task_ids[i % len(task_ids)]}")
+                )
+            conclusao = sorted(concluidas_em[t] - enviados_em[t] for t in concluidas_em)
+            resultados["job_completion"] = {
+                "jobs": len(task_ids),
+                "completed": len(conclusao),
+                "timed_out": len(pendentes),
+                "latency_ms": {
+                    "p50": round(percentil(conclusao, 50) * 1000, 3),
+                    "p95": round(percentil(conclusao, 95) * 1000, 3),
+                    "p99": round(percentil(conclusao, 99) * 1000, 3),
+                },
+            }
+
+        if "file" in cenarios and concluidas_em:
+            concluidas = list(concluidas_em)
+            resultados["file"] = await medir(
+                n, c, lambda i: cliente.get(f"/api/v1/download/{concluidas[i % len(concluidas)]}")
+            )
+            resultados["file"]["payload_bytes"] = args.payload_bytes
+    return resultados
+
+
+def comparar(base: Dict[str, Any], atual: Dict[str, Any]) -> Dict[str, Any]:
+    """Variação relativa (fração) de vazão e p95 por cenário presente nas duas execuções."""
+    comparacao: Dict[str, Any] = {}
+    for nome, dados in atual["results"].items():
+        anterior = base.get("results", {}).get(nome)
+        if not anterior or "throughput_rps" not in dados or "throughput_rps" not in anterior:
+            continue
+        comparacao[nome] = {
+            "throughput_change": round(dados["throughput_rps"] / anterior["throughput_rps"] - 1, 4)
+            if anterior["throughput_rps"] else None,
+            "p95_change": round(dados["latency_ms"]["p95"] / anterior["latency_ms"]["p95"] - 1, 4)
+            if anterior["latency_ms"]["p95"] else None,
+        }
+    return comparacao
+
+
+def _commit_atual() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=RAIZ_REPOSITORIO, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def preparar_ambiente(diretorio: str, args: argparse.Namespace) -> None:
+    """Isola banco, downloads e limites antes de importar a API (que lê o ambiente no import)."""
+    os.chdir(diretorio)
+    ambiente = {
+        "DATABASE_PATH": os.path.join(diretorio, "app.db"),
+        "STORAGE_DIR": os.path.join(diretorio, "app", "download"),
+        "EXECUTION_BACKEND": "inprocess",
+        "INPROCESS_CONCURRENCY": str(args.workers),
+        "EXTRACTION_POOL_SIZE": str(args.extraction_workers),
+        "EXTRACTION_QUEUE_SIZE": str(max(args.concurrency, 16)),
+        "STORAGE_JANITOR_ENABLED": "false",
+        "LOG_LEVEL": args.log_level,
+        # Os limites por cliente/domínio mediriam o limitador, não a API
+        "CLIENT_RATE": "1000000",
+        "CLIENT_BURST": "1000000",
+        "CLIENT_MAX_ACTIVE": "1000000",
+        "DOMAIN_RATE": "1000000",
+        "DOMAIN_BURST": "1000000",
+        "DOMAIN_MAX_CONCURRENCY": "1000000",
+    }
+    for chave, valor in ambiente.items():
+        os.environ.setdefault(chave, valor)
+    sys.path.insert(0, str(RAIZ_REPOSITORIO))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requisições por cenário")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--jobs", type=int, default=20, help="downloads submetidos no cenário submit")
+    parser.add_argument("--workers", type=int, default=4, help="INPROCESS_CONCURRENCY")
+    parser.add_argument("--extraction-workers", type=int, default=4, help="EXTRACTION_POOL_SIZE")
+    parser.add_argument("--extraction-latency", type=float, default=0.05, help="segundos por extração falsa")
+    parser.add_argument("--download-latency", type=float, default=0.1, help="segundos por download falso")
+    parser.add_argument("--payload-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--job-timeout", type=float, default=120.0)
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--scenarios", nargs="+", choices=CENARIOS, default=list(CENARIOS))
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para calcular a variação")
+    args = parser.parse_args(argv)
+
+    base = json.loads(Path(args.compare).read_text()) if args.compare else None
+    saida = Path(args.output).resolve() if args.output else None
+
+    with tempfile.TemporaryDirectory(prefix="bench-api-") as diretorio:
+        cwd = os.getcwd()
+        preparar_ambiente(diretorio, args)
+        try:
+            from benchmarks.fake_engine import ConfigMotorFalso, instalar_motor_falso
+
+            # Alguns módulos imprimem avisos no import; stdout fica reservado para o JSON
+            with contextlib.redirect_stdout(sys.stderr):
+                from app.main import app_fastapi
+                from app.services.execution_backend import encerrar_execution_backend
+
+            instalar_motor_falso(
+                ConfigMotorFalso(
+                    latencia_extracao=args.extraction_latency,
+                    latencia_download=args.download_latency,
+                    tamanho_payload=args.payload_bytes,
+                )
+            )
+            resultados = asyncio.run(executar_cenarios(app_fastapi, args))
+            encerrar_execution_backend()
+        finally:
+            os.chdir(cwd)
+
+    relatorio: Dict[str, Any] = {
+        "meta": {
+            "commit": _commit_atual(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {chave: valor for chave, valor in vars(args).items() if chave not in ("output", "compare")},
+        },
+        "results": resultados,
+    }
+    if base is not None:
+        relatorio["comparison"] = comparar(base, relatorio)
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if saida:
+        saida.write_text(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
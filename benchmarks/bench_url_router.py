@@ -0,0 +1,96 @@
+"""
+Microbenchmark do roteador de URLs (app.services.engine_manager.rotear_url).
+
+Uso:
+    python -m benchmarks.bench_url_router --lookups 2000000 --distinct 1000
+    python -m benchmarks.bench_url_router --output resultado.json
+
+Mede consultas por segundo em dois cenários: "cached", URLs repetidas atendidas pela
+memorização (o caso de status, cache e dedup consultando a mesma URL), e "cold", a análise
+completa (urlsplit, árvore de sufixos e canonicalizador) sem memorização.
+"""
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+RAIZ_REPOSITORIO = Path(__file__).resolve().parents[1]
+
+# Variações reais do mesmo vídeo e de sites sem canonicalizador
+MODELOS = (
+    "https://www.youtube.com/watch?v={id}&t={n}",
+    "https://m.youtube.com/watch?v={id}",
+    "https://music.youtube.com/watch?v={id}&list=RD{id}",
+    "https://youtu.be/{id}?si=x{n}",
+    "https://www.youtube.com/shorts/{id}",
+    "https://player.vimeo.com/video/{n}?h=abc",
+    "https://vimeo.com/channels/staffpicks/{n}",
+    "https://cdn.example.com/media/{id}.mp4?token={n}",
+)
+
+
+def gerar_urls(distintas: int) -> List[str]:
+    return [MODELOS[i % len(MODELOS)].format(id=f"vid{i:08d}", n=i) for i in range(distintas)]
+
+
+def medir(funcao: Callable[[str], Any], urls: List[str], consultas: int) -> Dict[str, Any]:
+    total = len(urls)
+    inicio = time.perf_counter()
+    for i in range(consultas):
+        funcao(urls[i % total])
+    duracao = time.perf_counter() - inicio
+    return {
+        "lookups": consultas,
+        "duration_s": round(duracao, 4),
+        "lookups_per_s": round(consultas / duracao) if duracao > 0 else 0,
+        "ns_per_lookup": round(duracao / consultas * 1e9, 1) if consultas else 0.0,
+    }
+
+
+def executar(consultas: int, distintas: int) -> Dict[str, Any]:
+    sys.path.insert(0, str(RAIZ_REPOSITORIO))
+    from app.services.engine_manager import rotear_url
+
+    urls = gerar_urls(distintas)
+    rotear_url.cache_clear()
+    for url in urls:
+        rotear_url(url)
+    resultados = {"cached": medir(rotear_url, urls, consultas)}
+    # A análise completa é ordens de grandeza mais lenta; uma fração das consultas basta
+    resultados["cold"] = medir(rotear_url.__wrapped__, urls, max(1, consultas // 20))
+    resultados["cached"]["hit_ratio"] = round(rotear_url.cache_info().hits / max(1, consultas), 4)
+    return resultados
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lookups", type=int, default=2_000_000, help="consultas no cenário memorizado")
+    parser.add_argument("--distinct", type=int, default=1000, help="URLs distintas no conjunto de teste")
+    parser.add_argument("--output", help="arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    relatorio = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {"lookups": args.lookups, "distinct": args.distinct},
+        },
+        "results": executar(args.lookups, args.distinct),
+    }
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Motor yt-dlp falso para benchmarks: latência e tamanho de payload configuráveis, sem rede."""
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List
+import time
+
+
+@dataclass
+class ConfigMotorFalso:
+    latencia_extracao: float = 0.05  # segundos por extract_info
+    latencia_download: float = 0.1  # segundos por download (além da escrita do arquivo)
+    tamanho_payload: int = 1024 * 1024  # bytes gravados por download
+    formatos: int = 12  # formatos listados em /video/options
+
+
+def info_falsa(video_url: str, config: ConfigMotorFalso) -> Dict[str, Any]:
+    formatos = [
+        {
+            "format_id": str(100 + indice),
+            "ext": "mp4" if indice % 2 else "webm",
+            "filesize": config.tamanho_payload * (indice + 1),
+            "format_note": f"{144 * (indice + 1)}p",
+            "vcodec": "avc1.64001F" if indice % 2 else "vp9",
+            "acodec": "mp4a.40.2",
+            "protocol": "https",
+            "url": f"{video_url}/formato/{indice}",
+        }
+        for indice in range(config.formatos)
+    ]
+    return {
+        "id": video_url.rsplit("=", 1)[-1],
+        "title": "Vídeo de benchmark",
+        "thumbnail": "https://example.com/thumb.jpg",
+        "duration": 300,
+        "uploader": "bench",
+        "view_count": 1,
+        "webpage_url": video_url,
+        "ext": "mp4",
+        "acodec": "mp4a.40.2",
+        "formats": formatos,
+    }
+
+
+class YoutubeDLFalso:
+    """Implementa só o que download_runner usa de yt_dlp.YoutubeDL."""
+
+    config = ConfigMotorFalso()
+
+    def __init__(self, opcoes: Dict[str, Any] = None):
+        self.opcoes = opcoes or {}
+
+    def __enter__(self) -> "YoutubeDLFalso":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+    def prepare_filename(self, info: Dict[str, Any]) -> str:
+        return self.opcoes.get("outtmpl", "%(id)s.%(ext)s") % {"id": info.get("id"), "ext": info.get("ext", "mp4")}
+
+    def sanitize_info(self, info: Dict[str, Any]) -> Dict[str, Any]:
+        return info
+
+    def extract_info(self, video_url: str, download: bool = True, **kwargs: Any) -> Dict[str, Any]:
+        time.sleep(self.config.latencia_extracao)
+        info = info_falsa(video_url, self.config)
+        return self.process_ie_result(info, download=True) if download else info
+
+    def process_ie_result(self, info: Dict[str, Any], download: bool = True) -> Dict[str, Any]:
+        if not download:
+            return info
+        caminho = self.prepare_filename(info)
+        hooks: List[Callable[[Dict[str, Any]], None]] = self.opcoes.get("progress_hooks", [])
+        time.sleep(self.config.latencia_download)
+        bloco = b"\0" * min(self.config.tamanho_payload, 1024 * 1024)
+        escritos = 0
+        with open(caminho, "wb") as arquivo:
+            while escritos < self.config.tamanho_payload:
+                parte = bloco[: self.config.tamanho_payload - escritos]
+                arquivo.write(parte)
+                escritos += len(parte)
+                for hook in hooks:
+                    hook({"status": "downloading", "downloaded_bytes": escritos, "total_bytes": self.config.tamanho_payload})
+        for hook in hooks:
+            hook({"status": "finished", "downloaded_bytes": escritos, "total_bytes": escritos, "filename": caminho})
+        return {**info, "requested_downloads": [{"filepath": caminho, "ext": info.get("ext"), "acodec": info.get("acodec")}]}
+
+
+def instalar_motor_falso(config: ConfigMotorFalso) -> Callable[[], None]:
+    """Substitui o yt-dlp nos módulos da API; retorna a função que desfaz a troca."""
+    from app.services import download_runner, extraction_service
+
+    YoutubeDLFalso.config = config
+    originais = (download_runner.YoutubeDL, extraction_service.extrair_info_video)
+
+    def extrair_info_falsa(video_url: str) -> Dict[str, Any]:
+        time.sleep(config.latencia_extracao)
+        return info_falsa(video_url, config)
+
+    download_runner.YoutubeDL = YoutubeDLFalso
+    extraction_service.extrair_info_video = extrair_info_falsa
+
+    def desinstalar() -> None:
+        download_runner.YoutubeDL, extraction_service.extrair_info_video = originais
+
+    return desinstalar
@@ -21,7 +21,8 @@ def install_dependencies():
         "uvicorn>=0.22.0",
         "python-multipart",
         "aiofiles",
-        "yt-dlp"
+        "yt-dlp",
+        "prometheus-client"
     ]
     
     print("Instalando dependências...")
@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+import app.services.progress_pubsub as progress_pubsub
+import app.services.rate_limiter as rate_limiter
+from app.services.progress_pubsub import MemoriaPubSub
+from app.services.rate_limiter import LimitadorDownloads, MemoriaLimitador
+
+
+@pytest.fixture(autouse=True)
+def backends_em_processo(monkeypatch):
+    # Com o Celery como padrão, limitador e pub/sub iriam para o Redis; os testes rodam num só processo
+    monkeypatch.setattr(rate_limiter, "_limitador", LimitadorDownloads(MemoriaLimitador()))
+    monkeypatch.setattr(progress_pubsub, "_pubsub", MemoriaPubSub())
@@ -0,0 +1,130 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+import app.services.audio_pipeline as audio_pipeline
+import app.services.download_runner as download_runner
+import app.services.engine_stats as engine_stats
+import app.services.result_cache as result_cache
+import app.services.task_store as task_store
+from app.services.audio_pipeline import NENHUMA, REMUX, TRANSCODIFICAR, planejar_conversao
+from app.services.engine_stats import EngineStats
+from app.services.result_cache import ResultCache
+from app.services.task_store import SQLiteTaskStore
+
+
+def test_planejar_conversao():
+    assert planejar_conversao("mp4a.40.2", "m4a", "m4a") == NENHUMA
+    assert planejar_conversao("mp4a.40.2", "m4a", "aac") == REMUX
+    assert planejar_conversao("opus", "webm", "ogg") == REMUX
+    assert planejar_conversao("opus", "webm", "mp3") == TRANSCODIFICAR
+    assert planejar_conversao(None, "mp4", "wav") == TRANSCODIFICAR
+
+
+class YoutubeDLAudio:
+    formato_pedido = None
+    acodec = "opus"
+
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+        YoutubeDLAudio.formato_pedido = opcoes.get("format")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def process_ie_result(self, info, download=True):
+        ext = "webm" if self.acodec == "opus" else "m4a"
+        caminho = self.opcoes["outtmpl"].replace("%(ext)s", ext)
+        Path(caminho).write_bytes(b"audio")
+        return {**info, "requested_downloads": [{"filepath": caminho, "acodec": self.acodec, "ext": ext}]}
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    monkeypatch.setattr(engine_stats, "_engine_stats", EngineStats(str(tmp_path / "app.db")))
+    monkeypatch.setattr(download_runner, "YoutubeDL", YoutubeDLAudio)
+    monkeypatch.setattr(download_runner, "obter_info_video_sincrono", lambda url: {"id": "1"})
+    chamadas = []
+
+    def ffmpeg_falso(argumentos, cancelado=None):
+        chamadas.append(argumentos)
+        Path(argumentos[-1]).write_bytes(b"convertido")
+
+    monkeypatch.setattr(audio_pipeline, "_executar_ffmpeg", ffmpeg_falso)
+    monkeypatch.chdir(tmp_path)
+    return store, chamadas
+
+
+def test_audio_nativo_nao_passa_pelo_ffmpeg(runner, monkeypatch):
+    store, chamadas = runner
+    monkeypatch.setattr(YoutubeDLAudio, "acodec", "mp4a.40.2")
+    resultado = download_runner.executar_download(
+        "a1", {"video_url": "https://www.youtube.com/watch?v=x", "format": "m4a", "audio_only": True}
+    )
+    assert resultado["status"] == "completed"
+    assert YoutubeDLAudio.formato_pedido.startswith("bestaudio[ext=m4a]")
+    assert chamadas == []
+    assert resultado["file_path"].endswith("a1.m4a")
+
+
+def test_transcodificacao_usa_pool_limitado(runner):
+    store, chamadas = runner
+    resultado = download_runner.executar_download(
+        "a2", {"video_url": "https://www.youtube.com/watch?v=y", "format": "mp3", "audio_only": False}
+    )
+    assert resultado["status"] == "completed"
+    assert YoutubeDLAudio.formato_pedido.startswith("bestaudio")
+    assert len(chamadas) == 1 and "libmp3lame" in chamadas[0] and "-threads" in chamadas[0]
+    assert Path(resultado["file_path"]).name == "a2.mp3"
+    assert not Path("app/download/a2.webm").exists()
+
+
+def test_pool_de_transcodificacao_unico_entre_threads(monkeypatch):
+    criados = []
+
+    class PoolLento:
+        def __init__(self, **opcoes):
+            time.sleep(0.01)
+            criados.append(self)
+
+    monkeypatch.setattr(audio_pipeline, "_pool_transcodificacao", None)
+    monkeypatch.setattr(audio_pipeline, "ThreadPoolExecutor", PoolLento)
+    largada = threading.Barrier(8)
+    pools = []
+
+    def obter():
+        largada.wait()
+        pools.append(audio_pipeline._get_pool_transcodificacao())
+
+    threads = [threading.Thread(target=obter) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(criados) == 1
+    assert all(pool is criados[0] for pool in pools)
+
+def test_transcodificacao_adiada_para_pos_processamento(runner):
+    store, chamadas = runner
+    agendados = []
+    resultado = download_runner.executar_download(
+        "a3", {"video_url": "https://www.youtube.com/watch?v=z", "format": "mp3", "audio_only": True},
+        agendar_pos_processamento=lambda *argumentos: agendados.append(argumentos),
+    )
+    assert resultado["status"] == "processing"
+    assert chamadas == [] and len(agendados) == 1
+
+    resultado = download_runner.concluir_pos_processamento(*agendados[0])
+    assert resultado["status"] == "completed"
+    assert store.obter("a3")["file_path"].endswith("a3.mp3")
@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.routes.download_endpoint as download_endpoint
+import app.services.execution_backend as execution_backend
+import app.services.result_cache as result_cache
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.execution_backend import ExecutionBackend
+from app.services.result_cache import ResultCache
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+
+class BackendGravador(ExecutionBackend):
+    nome = "gravador"
+
+    def __init__(self):
+        self.lotes = []
+
+    async def submeter(self, task_id, dados_requisicao):
+        self.lotes.append([(task_id, dados_requisicao)])
+
+    async def submeter_lote(self, itens):
+        self.lotes.append(list(itens))
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    backend = BackendGravador()
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    monkeypatch.setattr(execution_backend, "_backend", backend)
+    return store, backend
+
+
+def test_lote_explicito_e_status_agregado(ambiente):
+    store, backend = ambiente
+    itens = [{"video_url": f"https://vimeo.com/{i}", "format": "mp4"} for i in range(3)]
+    res = client.post("/api/v1/video/download/batch", json={"requests": itens})
+    assert res.status_code == 202
+    parent_id = res.json()["data"]["task_id"]
+
+    # Todas as filhas vão para o backend em um único envio
+    assert len(backend.lotes) == 1 and len(backend.lotes[0]) == 3
+    filhos = store.obter(parent_id)["children"]
+    assert all(store.obter(f)["download_data"]["parent_id"] == parent_id for f in filhos)
+
+    store.atualizar(filhos[0], status="completed", progress=100)
+    store.atualizar(filhos[1], status="processing", progress=50)
+    dados = client.get(f"/api/v1/video/task/{parent_id}").json()["data"]
+    assert dados["status"] == "processing"
+    assert dados["progress"] == 50
+    assert dados["summary"]["completed"] == 1 and dados["summary"]["total"] == 3
+    assert [c["task_id"] for c in dados["children"]] == filhos
+
+    store.atualizar(filhos[1], status="failed")
+    store.atualizar(filhos[2], status="completed")
+    dados = client.get(f"/api/v1/video/task/{parent_id}").json()["data"]
+    assert dados["status"] == "completed"
+    assert dados["progress"] == 100
+
+
+def test_playlist_expandida_em_segundo_plano(ambiente, monkeypatch):
+    store, backend = ambiente
+    urls = [f"https://www.youtube.com/watch?v={i}" for i in range(5)]
+    monkeypatch.setattr(download_endpoint, "extrair_entradas_playlist", lambda url, limite: urls[:limite])
+    monkeypatch.setattr(download_endpoint, "BATCH_ENQUEUE_CHUNK", 2)
+
+    res = client.post(
+        "/api/v1/video/download/batch",
+        json={"playlist_url": "https://www.youtube.com/playlist?list=PL1", "format": "mp3", "audio_only": True},
+    )
+    assert res.status_code == 202
+    parent_id = res.json()["data"]["task_id"]
+
+    pai = store.obter(parent_id)
+    assert pai["expanding"] is False
+    assert len(pai["children"]) == 5
+    assert [len(lote) for lote in backend.lotes] == [2, 2, 1]
+    assert backend.lotes[0][0][1]["audio_only"] is True
+
+    dados = client.get(f"/api/v1/video/task/{parent_id}").json()["data"]
+    assert dados["status"] == "pending"
+    assert dados["summary"]["pending"] == 5
+
+
+def test_lote_exige_uma_unica_origem(ambiente):
+    res = client.post("/api/v1/video/download/batch", json={"format": "mp4"})
+    assert res.status_code == 422
@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from benchmarks.bench_api import comparar, percentil, resumir
+from benchmarks.bench_url_router import executar
+from benchmarks.fake_engine import ConfigMotorFalso, YoutubeDLFalso
+
+
+def test_percentis_pelo_posto_mais_proximo():
+    valores = [i / 1000 for i in range(1, 101)]
+    assert percentil(valores, 50) == 0.05
+    assert percentil(valores, 99) == 0.099
+    resumo = resumir(valores, erros=2, duracao=1.0)
+    assert resumo["requests"] == 102
+    assert resumo["latency_ms"]["p95"] == 95.0
+
+
+def test_comparacao_entre_execucoes():
+    base = {"results": {"health": {"throughput_rps": 100.0, "latency_ms": {"p95": 10.0}}}}
+    atual = {"results": {"health": {"throughput_rps": 120.0, "latency_ms": {"p95": 8.0}}, "file": {}}}
+    assert comparar(base, atual) == {"health": {"throughput_change": 0.2, "p95_change": -0.2}}
+
+
+def test_motor_falso_grava_payload_e_chama_hooks(tmp_path):
+    YoutubeDLFalso.config = ConfigMotorFalso(latencia_extracao=0, latencia_download=0, tamanho_payload=3000)
+    eventos = []
+    opcoes = {"outtmpl": str(tmp_path / "t.%(ext)s"), "progress_hooks": [eventos.append]}
+    with YoutubeDLFalso(opcoes) as ydl:
+        info = ydl.extract_info("https://example.com/watch?v=abc")
+    caminho = info["requested_downloads"][0]["filepath"]
+    assert Path(caminho).stat().st_size == 3000
+    assert eventos[-1]["status"] == "finished"
+
+
+def test_benchmark_do_roteador_de_urls():
+    resultados = executar(consultas=2000, distintas=50)
+    assert resultados["cached"]["hit_ratio"] == 1.0
+    assert resultados["cold"]["lookups"] == 100
@@ -0,0 +1,156 @@
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.cancellation as cancellation
+import app.services.download_runner as download_runner
+import app.services.engine_stats as engine_stats
+import app.services.execution_backend as execution_backend
+import app.services.progress_pubsub as progress_pubsub
+import app.services.result_cache as result_cache
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.cancellation import CancelamentoStore, VerificadorCancelamento
+from app.services.engine_stats import EngineStats
+from app.services.execution_backend import InProcessBackend
+from app.services.progress_pubsub import MemoriaPubSub
+from app.services.result_cache import ResultCache
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+
+class YoutubeDLLento:
+    """Baixa em blocos até ser liberado; cada bloco passa pelos progress hooks."""
+
+    liberar = threading.Event()
+    iniciados = []
+
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def process_ie_result(self, info, download=True):
+        caminho = Path(self.opcoes["outtmpl"].replace("%(ext)s", "mp4"))
+        YoutubeDLLento.iniciados.append(caminho.name.split(".")[0])
+        parcial = caminho.with_name(caminho.name + ".part")
+        baixados = 0
+        while not YoutubeDLLento.liberar.is_set():
+            baixados += 1
+            parcial.write_bytes(b"x" * baixados)
+            for hook in self.opcoes["progress_hooks"]:
+                hook({"status": "downloading", "downloaded_bytes": baixados, "total_bytes": 1000})
+            time.sleep(0.01)
+        parcial.rename(caminho)
+        return {**info, "requested_downloads": [{"filepath": str(caminho)}]}
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    backend = InProcessBackend(concorrencia=1)
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    monkeypatch.setattr(engine_stats, "_engine_stats", EngineStats(str(tmp_path / "app.db")))
+    monkeypatch.setattr(cancellation, "_cancelamentos", CancelamentoStore(str(tmp_path / "app.db")))
+    monkeypatch.setattr(cancellation, "CANCEL_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(execution_backend, "_backend", backend)
+    monkeypatch.setattr(progress_pubsub, "_pubsub", MemoriaPubSub())
+    monkeypatch.setattr(download_runner, "YoutubeDL", YoutubeDLLento)
+    monkeypatch.setattr(download_runner, "obter_info_video_sincrono", lambda url: {"id": "1"})
+    monkeypatch.chdir(tmp_path)
+    YoutubeDLLento.liberar.clear()
+    YoutubeDLLento.iniciados = []
+    yield store, backend
+    YoutubeDLLento.liberar.set()
+    backend.encerrar()
+
+
+def _submeter(video_id):
+    resposta = client.post(
+        "/api/v1/video/download",
+        json={"video_url": f"https://vimeo.com/{video_id}", "format": "mp4", "engine": "yt-dlp"},
+    )
+    return resposta.json()["data"]["task_id"]
+
+
+def _aguardar(condicao, prazo=5.0):
+    limite = time.monotonic() + prazo
+    while not condicao():
+        assert time.monotonic() < limite, "condição não atingida a tempo"
+        time.sleep(0.01)
+
+
+def test_cancelar_aborta_download_em_andamento_e_remove_parciais(ambiente):
+    store, backend = ambiente
+    em_andamento = _submeter(1)
+    _aguardar(lambda: em_andamento in YoutubeDLLento.iniciados)
+    _aguardar(lambda: list(Path("app/download").glob(f"{em_andamento}.*")))
+
+    resposta = client.post(f"/api/v1/video/task/{em_andamento}/cancel")
+    assert resposta.status_code == 200
+    assert resposta.json()["data"]["status"] == "cancelled"
+
+    # O hook de progresso encontra o sinal e o worker para sem tentar outros motores
+    assert backend.aguardar(em_andamento, timeout=5)["status"] == "cancelled"
+    assert store.obter(em_andamento)["status"] == "cancelled"
+    assert not list(Path("app/download").glob(f"{em_andamento}.*"))
+    # Repetir o cancelamento é idempotente
+    assert client.post(f"/api/v1/video/task/{em_andamento}/cancel").status_code == 200
+
+
+def test_cancelar_tarefa_na_fila_libera_o_slot_sem_executar(ambiente):
+    store, backend = ambiente
+    primeira = _submeter(1)
+    _aguardar(lambda: primeira in YoutubeDLLento.iniciados)
+    na_fila = _submeter(2)
+    Path("app/download", f"{na_fila}.mp4.part").write_bytes(b"de uma tentativa anterior")
+
+    assert client.post(f"/api/v1/video/task/{na_fila}/cancel").status_code == 200
+    assert not Path("app/download", f"{na_fila}.mp4.part").exists()
+
+    YoutubeDLLento.liberar.set()
+    backend.aguardar(primeira, timeout=5)
+    _aguardar(lambda: backend.em_andamento == 0)
+    assert YoutubeDLLento.iniciados == [primeira]
+    assert store.obter(na_fila)["status"] == "cancelled"
+    assert client.post(f"/api/v1/video/task/{primeira}/cancel").status_code == 409
+
+
+def test_tarefa_sem_cliente_acompanhando_se_cancela(tmp_path, monkeypatch):
+    monkeypatch.setattr(cancellation, "_cancelamentos", CancelamentoStore(str(tmp_path / "app.db")))
+    monkeypatch.setattr(cancellation, "TASK_IDLE_CANCEL_AFTER", 60)
+    monkeypatch.setattr(cancellation, "TASK_IDLE_TOUCH_INTERVAL", 0)
+    criada_ha_muito = (datetime.now() - timedelta(minutes=5)).timestamp()
+
+    cancellation.get_cancelamentos().registrar_interesse("acompanhada")
+    assert not VerificadorCancelamento("acompanhada", criada_ha_muito).cancelado()
+    assert not VerificadorCancelamento("recente").cancelado()
+
+    abandonada = VerificadorCancelamento("abandonada", criada_ha_muito)
+    with pytest.raises(cancellation.TarefaCanceladaError):
+        abandonada.verificar()
+    assert abandonada.motivo == cancellation.MOTIVO_INATIVIDADE
+    assert cancellation.get_cancelamentos().motivo("abandonada") == cancellation.MOTIVO_INATIVIDADE
+
+
+def test_lote_com_filhas_terminadas_nao_e_cancelado(ambiente):
+    store, _ = ambiente
+    store.criar("filha", {"video_url": "https://vimeo.com/1"}, status="completed")
+    store.criar("lote", {}, kind="batch", children=["filha"], expanding=False)
+
+    resposta = client.post("/api/v1/video/task/lote/cancel")
+    assert resposta.status_code == 409
+    assert client.get("/api/v1/video/task/lote").json()["data"]["status"] == "completed"
@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+import app.services.engine_manager as engine_manager
+from app.services.engine_manager import chave_canonica_video, extrair_dominio, rotear_url, selecionar_motores_para_url
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.youtube.com/watch?v=abc123",
+        "https://m.youtube.com/watch?v=abc123&t=1",
+        "https://music.youtube.com/watch?v=abc123&list=RDabc123",
+        "https://youtu.be/abc123?t=30",
+        "youtube.com/shorts/abc123/",
+        "https://www.youtube-nocookie.com/embed/abc123",
+    ],
+)
+def test_variacoes_do_youtube_tem_a_mesma_chave(url):
+    rota = rotear_url(url)
+    assert (rota.site, rota.video_id, rota.chave) == ("youtube", "abc123", "youtube:abc123")
+
+
+def test_subdominios_usam_o_dominio_registrado():
+    assert extrair_dominio("https://m.youtube.com/watch?v=abc123") == "youtube.com"
+    assert extrair_dominio("https://player.vimeo.com/video/76979871") == "vimeo.com"
+    assert chave_canonica_video("https://vimeo.com/channels/staffpicks/76979871") == "vimeo:76979871"
+    assert chave_canonica_video("https://vimeo.com/showcase/7366591/video/123456") == "vimeo:123456"
+    assert chave_canonica_video("https://vimeo.com/album/5/video/42") == "vimeo:42"
+    # Sufixo parecido não casa, e só o prefixo 'www.' sai de domínios desconhecidos
+    assert extrair_dominio("https://notyoutube.com/watch?v=abc123") == "notyoutube.com"
+    assert extrair_dominio("https://awww.example.com/v") == "awww.example.com"
+    assert chave_canonica_video("https://youtube.com/feed") == "youtube.com/feed"
+    assert chave_canonica_video("https://www.example.com/v/1/?a=1#trecho") == "example.com/v/1?a=1"
+
+
+def test_selecao_de_motores_pelo_roteador(monkeypatch):
+    assert selecionar_motores_para_url("https://music.youtube.com/watch?v=abc123") == ["yt-dlp"]
+    assert selecionar_motores_para_url("http://[::1") == ["yt-dlp", "segmented"]
+
+    monkeypatch.setitem(engine_manager.REGISTRY_DE_MOTORES, "example.org", ["segmented"])
+    engine_manager.recompilar_rotas()
+    try:
+        assert selecionar_motores_para_url("https://cdn.media.example.org/v.mp4") == ["segmented"]
+    finally:
+        monkeypatch.undo()
+        engine_manager.recompilar_rotas()
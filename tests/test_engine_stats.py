@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.engine_stats as engine_stats
+from app.main import app_fastapi
+from app.services.engine_manager import selecionar_motores_para_url
+from app.services.engine_stats import EngineStats
+
+client = TestClient(app_fastapi)
+
+
+def test_motor_com_falhas_vai_para_o_fim(tmp_path):
+    stats = EngineStats(str(tmp_path / "app.db"))
+    assert stats.ordenar_motores("vimeo.com", ["yt-dlp", "segmented"]) == ["yt-dlp", "segmented"]
+    for _ in range(3):
+        stats.registrar("vimeo.com", "yt-dlp", False)
+    stats.registrar("vimeo.com", "segmented", True, ttfb=0.2, vazao=5e6)
+    assert stats.ordenar_motores("vimeo.com", ["yt-dlp", "segmented"]) == ["segmented", "yt-dlp"]
+    # Outros domínios não são afetados
+    assert stats.ordenar_motores("example.com", ["yt-dlp", "segmented"]) == ["yt-dlp", "segmented"]
+
+
+def test_estatisticas_sobrevivem_a_reinicio(tmp_path):
+    caminho = str(tmp_path / "app.db")
+    EngineStats(caminho).registrar("vimeo.com", "yt-dlp", True, ttfb=0.5, vazao=1e6)
+    recarregado = EngineStats(caminho).listar()
+    assert recarregado[0]["samples"] == 1
+    assert recarregado[0]["throughput_bps"] == 1e6
+
+
+def test_selecao_e_endpoint_admin_usam_estatisticas(tmp_path, monkeypatch):
+    stats = EngineStats(str(tmp_path / "app.db"))
+    monkeypatch.setattr(engine_stats, "_engine_stats", stats)
+    for _ in range(3):
+        stats.registrar("example.com", "yt-dlp", False)
+
+    assert selecionar_motores_para_url("https://www.example.com/v/1") == ["segmented", "yt-dlp"]
+    dados = client.get("/api/v1/admin/engines/stats").json()["data"]
+    assert dados[0]["domain"] == "example.com" and dados[0]["success_rate"] < 0.01
+
+
+def test_processos_somam_amostras_sem_sobrescrever(tmp_path):
+    caminho = str(tmp_path / "app.db")
+    api, worker_a, worker_b = (EngineStats(caminho) for _ in range(3))
+    api.listar()
+    worker_a.registrar("vimeo.com", "yt-dlp", True)
+    worker_b.registrar("vimeo.com", "yt-dlp", False)
+    worker_a.registrar("vimeo.com", "yt-dlp", False)
+
+    # O endpoint de admin (outro processo) enxerga as três amostras
+    registro = api.listar()[0]
+    assert registro["samples"] == 3
+    assert registro["success_rate"] == pytest.approx(0.49)
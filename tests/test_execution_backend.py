@@ -0,0 +1,96 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.download_runner as download_runner
+import app.services.engine_stats as engine_stats
+import app.services.execution_backend as execution_backend
+import app.services.result_cache as result_cache
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.engine_stats import EngineStats
+from app.services.execution_backend import InProcessBackend
+from app.services.result_cache import ResultCache
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+
+class YoutubeDLFalso:
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def process_ie_result(self, info, download=True):
+        caminho = self.opcoes["outtmpl"].replace("%(ext)s", "mp4")
+        for hook in self.opcoes.get("progress_hooks", []):
+            hook({"status": "downloading", "downloaded_bytes": 5, "total_bytes": 10})
+        Path(caminho).write_bytes(b"video")
+        return {**info, "requested_downloads": [{"filepath": caminho}]}
+
+
+@pytest.fixture
+def backend_em_processo(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    backend = InProcessBackend(concorrencia=2)
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    monkeypatch.setattr(execution_backend, "_backend", backend)
+    monkeypatch.setattr(engine_stats, "_engine_stats", EngineStats(str(tmp_path / "app.db")))
+    monkeypatch.setattr(download_runner, "YoutubeDL", YoutubeDLFalso)
+    monkeypatch.setattr(download_runner, "obter_info_video_sincrono", lambda url: {"id": "1"})
+    monkeypatch.chdir(tmp_path)
+    yield store, backend
+    backend.encerrar()
+
+
+def test_endpoint_executa_download_no_backend_em_processo(backend_em_processo):
+    store, backend = backend_em_processo
+    res = client.post("/api/v1/video/download", json={"video_url": "https://vimeo.com/9", "format": "mp4"})
+    assert res.status_code == 202
+    task_id = res.json()["data"]["task_id"]
+
+    # Retorna imediatamente se a tarefa já tiver terminado
+    backend.aguardar(task_id, timeout=5)
+    registro = store.obter(task_id)
+    assert registro["status"] == "completed"
+    assert Path(registro["file_path"]).read_bytes() == b"video"
+    assert client.get(f"/api/v1/download/{task_id}").content == b"video"
+
+
+def test_payload_leva_o_correlation_id_da_requisicao(backend_em_processo):
+    store, backend = backend_em_processo
+    res = client.post(
+        "/api/v1/video/download",
+        json={"video_url": "https://vimeo.com/9", "format": "mp4"},
+        headers={"X-Request-ID": "req-42"},
+    )
+    assert res.headers["X-Correlation-ID"] == "req-42"
+    task_id = res.json()["data"]["task_id"]
+    backend.aguardar(task_id, timeout=5)
+    assert store.obter(task_id)["download_data"]["correlation_id"] == "req-42"
+
+
+def test_worker_celery_usa_o_correlation_id_do_payload():
+    from types import SimpleNamespace
+
+    from app.core.logging_config import correlation_id_var
+    from app.tasks.celery_config import _definir_correlation_id, _limpar_correlation_id
+
+    tarefa = SimpleNamespace(request=SimpleNamespace())
+    _definir_correlation_id(task_id="t1", task=tarefa, args=[{"correlation_id": "req-7"}])
+    assert correlation_id_var.get() == "req-7"
+    _limpar_correlation_id(task=tarefa)
+    _definir_correlation_id(task_id="t2", task=tarefa, args=["t2", "arquivo.mp3"])
+    assert correlation_id_var.get() == "t2"
+    _limpar_correlation_id(task=tarefa)
+    assert correlation_id_var.get() is None
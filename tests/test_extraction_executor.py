@@ -0,0 +1,62 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.services.extraction_executor import (
+    ExecutorExtracao,
+    ExecutorSaturadoError,
+    ExtracaoTimeoutError,
+)
+
+client = TestClient(main.app_fastapi)
+
+
+def test_executor_recusa_quando_saturado():
+    liberar = threading.Event()
+
+    async def cenario():
+        executor = ExecutorExtracao(tamanho=1, tamanho_fila=0, timeout=5, retry_after=7)
+        primeira = asyncio.ensure_future(executor.executar(liberar.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturadoError) as exc:
+            await executor.executar(lambda: None)
+        assert exc.value.retry_after == 7
+        liberar.set()
+        assert await primeira is True
+        # A vaga volta a ficar disponível após a conclusão
+        assert await executor.executar(lambda: "ok") == "ok"
+        executor.encerrar()
+
+    asyncio.run(cenario())
+
+
+def test_executor_timeout_por_chamada():
+    liberar = threading.Event()
+
+    async def cenario():
+        executor = ExecutorExtracao(tamanho=1, tamanho_fila=0, timeout=0.05)
+        with pytest.raises(ExtracaoTimeoutError):
+            await executor.executar(liberar.wait)
+        # A thread presa continua ocupando a vaga até terminar
+        assert executor.ocupacao == 1
+        liberar.set()
+        executor.encerrar()
+
+    asyncio.run(cenario())
+
+
+def test_video_info_retorna_503_quando_saturado(monkeypatch):
+    async def saturado(url):
+        raise ExecutorSaturadoError(retry_after=3)
+
+    monkeypatch.setattr(main, "obter_info_video", saturado)
+    res = client.get('/api/v1/video/info', params={"url": "https://youtube.com/watch?v=abc"})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "3"
@@ -0,0 +1,98 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import anyio
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.file_delivery import interpretar_range, responder_arquivo
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+CONTEUDO = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def tarefa_concluida(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    arquivo = tmp_path / "t1.mp4"
+    arquivo.write_bytes(CONTEUDO)
+    store.criar("t1", {}, status="completed", file_path=str(arquivo))
+    return "/api/v1/download/t1"
+
+
+def test_interpretar_range_mescla_e_descarta():
+    assert interpretar_range("bytes=0-9,5-19,-10", 100) == [(0, 19), (90, 99)]
+    assert interpretar_range("bytes=200-", 100) == []
+    assert interpretar_range("items=0-1", 100) is None
+
+
+def test_arquivo_completo_com_validadores(tarefa_concluida):
+    res = client.get(tarefa_concluida)
+    assert res.status_code == 200
+    assert res.content == CONTEUDO
+    assert res.headers["content-type"] == "video/mp4"
+    assert res.headers["accept-ranges"] == "bytes"
+    assert "download-t1.mp4" in res.headers["content-disposition"]
+
+    res_304 = client.get(tarefa_concluida, headers={"If-None-Match": res.headers["etag"]})
+    assert res_304.status_code == 304
+
+
+def test_range_simples_e_if_range(tarefa_concluida):
+    etag = client.head(tarefa_concluida).headers["etag"]
+    res = client.get(tarefa_concluida, headers={"Range": "bytes=10-19", "If-Range": etag})
+    assert res.status_code == 206
+    assert res.headers["content-range"] == f"bytes 10-19/{len(CONTEUDO)}"
+    assert res.content == CONTEUDO[10:20]
+
+    # Validador desatualizado: o Range é ignorado e o arquivo inteiro é enviado
+    res = client.get(tarefa_concluida, headers={"Range": "bytes=10-19", "If-Range": '"antigo"'})
+    assert res.status_code == 200
+    assert len(res.content) == len(CONTEUDO)
+
+
+def test_multiplos_ranges_e_416(tarefa_concluida):
+    res = client.get(tarefa_concluida, headers={"Range": "bytes=0-3,100-103"})
+    assert res.status_code == 206
+    assert res.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert int(res.headers["content-length"]) == len(res.content)
+    assert CONTEUDO[0:4] in res.content and CONTEUDO[100:104] in res.content
+
+    res = client.get(tarefa_concluida, headers={"Range": f"bytes={len(CONTEUDO)}-"})
+    assert res.status_code == 416
+    assert res.headers["content-range"] == f"bytes */{len(CONTEUDO)}"
+
+
+def _mensagens_asgi(resposta, extensoes):
+    mensagens = []
+
+    async def send(mensagem):
+        mensagens.append(mensagem)
+
+    escopo = {"type": "http", "method": "GET", "extensions": extensoes}
+    anyio.run(resposta, escopo, None, send)
+    return [m for m in mensagens if m["type"] != "http.response.start"]
+
+
+def test_extensoes_sem_copia_quando_o_servidor_oferece(tmp_path):
+    arquivo = tmp_path / "t1.mp4"
+    arquivo.write_bytes(CONTEUDO)
+    extensoes = {"http.response.pathsend": {}, "http.response.zerocopysend": {}}
+
+    inteiro = _mensagens_asgi(responder_arquivo({}, str(arquivo)), extensoes)
+    assert inteiro == [{"type": "http.response.pathsend", "path": str(arquivo)}]
+
+    # Trechos não cabem no pathsend; vão pelo zerocopysend com offset
+    trecho = _mensagens_asgi(responder_arquivo({"range": "bytes=10-19"}, str(arquivo)), extensoes)
+    assert trecho[0]["type"] == "http.response.zerocopysend"
+    assert (trecho[0]["offset"], trecho[0]["count"]) == (10, 10)
+
+    # Sem extensões (uvicorn): blocos lidos do arquivo
+    comum = _mensagens_asgi(responder_arquivo({}, str(arquivo)), {})
+    assert b"".join(m["body"] for m in comum) == CONTEUDO
@@ -0,0 +1,164 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+import app.services.download_runner as download_runner
+import app.services.engine_stats as engine_stats
+import app.services.info_handles as info_handles
+import app.services.result_cache as result_cache
+import app.services.task_store as task_store
+from app.models.request_schemas import DownloadRequest
+from app.services.audio_pipeline import seletor_audio
+from app.services.engine_stats import EngineStats
+from app.services.info_handles import InfoHandleStore
+from app.services.result_cache import ResultCache
+from app.services.task_store import SQLiteTaskStore
+
+URL = "https://www.youtube.com/watch?v=abc123"
+INFO = {
+    "id": "abc123",
+    "formats": [
+        {"format_id": "137", "ext": "mp4", "vcodec": "avc1", "acodec": "none", "filesize": 10, "url": "https://v/137"},
+        {"format_id": "18", "ext": "mp4", "vcodec": "avc1", "acodec": "mp4a", "filesize": 5, "url": "https://v/18"},
+    ],
+}
+
+
+@pytest.fixture
+def handles(tmp_path, monkeypatch):
+    store = InfoHandleStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(info_handles, "_info_handles", store)
+    return store
+
+
+def test_handle_vale_so_para_o_mesmo_video_e_dentro_do_ttl(handles):
+    handle = handles.criar(URL, INFO)
+    assert handles.obter(handle, "https://youtu.be/abc123") == INFO
+    assert handles.obter(handle, "https://www.youtube.com/watch?v=outro") is None
+    assert handles.obter("inexistente", URL) is None
+
+    handles.ttl = -1
+    assert handles.obter(handles.criar(URL, INFO), URL) is None
+
+
+def test_handle_expira_com_as_urls_assinadas(handles):
+    expira = int(time.time()) + 60  # menos que a margem de segurança
+    info = {"id": "abc123", "formats": [{"format_id": "18", "url": f"https://v/18?expire={expira}&sig=x"}]}
+    assert handles.obter(handles.criar(URL, info), URL) is None
+
+
+def test_options_devolve_handle(handles, monkeypatch):
+    async def extracao(url):
+        return INFO
+
+    monkeypatch.setattr(main, "obter_info_video", extracao)
+    resposta = TestClient(main.app_fastapi).get("/api/v1/video/options", params={"url": URL}).json()
+    assert [f["format_id"] for f in resposta["data"]] == ["137", "18"]
+    assert handles.obter(resposta["info_handle"], URL) == INFO
+
+
+def test_format_id_rejeita_operadores_de_seletor():
+    with pytest.raises(ValueError):
+        DownloadRequest(video_url=URL, format="mp4", format_id="137+bestaudio/best")
+    assert DownloadRequest(video_url=URL, format="mp4", format_id="hls-1080p").format_id == "hls-1080p"
+
+
+class YoutubeDLRegistrador:
+    chamadas = []
+
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def process_ie_result(self, info, download=True):
+        YoutubeDLRegistrador.chamadas.append(("process", self.opcoes.get("format"), info))
+        if info.get("expirado"):
+            raise RuntimeError("HTTP Error 403: Forbidden")
+        return self._gravar(info)
+
+    def extract_info(self, url, download=True):
+        YoutubeDLRegistrador.chamadas.append(("extract", self.opcoes.get("format"), url))
+        return self._gravar({"id": "abc123"})
+
+    def _gravar(self, info):
+        caminho = self.opcoes["outtmpl"].replace("%(ext)s", "mp4")
+        Path(caminho).write_bytes(b"video")
+        return {**info, "requested_downloads": [{"filepath": caminho, "ext": "mp4"}]}
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch, handles):
+    monkeypatch.setattr(task_store, "_task_store", SQLiteTaskStore(str(tmp_path / "app.db")))
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    monkeypatch.setattr(engine_stats, "_engine_stats", EngineStats(str(tmp_path / "app.db")))
+    monkeypatch.setattr(download_runner, "YoutubeDL", YoutubeDLRegistrador)
+    YoutubeDLRegistrador.chamadas = []
+
+    def extracao_proibida(url):
+        raise AssertionError("o worker não deveria extrair de novo")
+
+    monkeypatch.setattr(download_runner, "obter_info_video_sincrono", extracao_proibida)
+    monkeypatch.chdir(tmp_path)
+    return handles
+
+
+def test_worker_reaproveita_a_extracao_do_handle(runner):
+    handle = runner.criar(URL, INFO)
+    resultado = download_runner.executar_download(
+        "t1", {"video_url": URL, "format": "mp4", "engine": "yt-dlp", "format_id": "137", "info_handle": handle}
+    )
+    assert resultado["status"] == "completed"
+    # Formato só de vídeo recebe o melhor áudio; a info veio do handle, sem extract_info
+    assert YoutubeDLRegistrador.chamadas == [("process", "137+bestaudio/137", INFO)]
+
+
+def test_worker_reextrai_quando_as_urls_do_handle_venceram(runner):
+    handle = runner.criar(URL, {**INFO, "expirado": True})
+    resultado = download_runner.executar_download(
+        "t2", {"video_url": URL, "format": "mp4", "engine": "yt-dlp", "format_id": "18", "info_handle": handle}
+    )
+    assert resultado["status"] == "completed"
+    assert [chamada[0] for chamada in YoutubeDLRegistrador.chamadas] == ["process", "extract"]
+    assert YoutubeDLRegistrador.chamadas[-1][1] == "18"
+
+
+def test_falha_com_o_handle_descarta_as_urls_para_os_proximos_motores(runner, monkeypatch):
+    handle = runner.criar(URL, INFO)
+    nova = {**INFO, "id": "reextraido"}
+
+    def segmentado_com_url_vencida(url, *args, **kwargs):
+        raise RuntimeError("HTTP Error 403: Forbidden")
+
+    monkeypatch.setattr(download_runner, "selecionar_motores_para_url", lambda url, engine: ["segmented", "yt-dlp"])
+    monkeypatch.setattr(download_runner, "baixar_segmentado", segmentado_com_url_vencida)
+    monkeypatch.setattr(download_runner, "obter_info_video_sincrono", lambda url: nova)
+    resultado = download_runner.executar_download(
+        "t3", {"video_url": URL, "format": "mp4", "format_id": "18", "info_handle": handle}
+    )
+    assert resultado["status"] == "completed"
+    assert YoutubeDLRegistrador.chamadas == [("process", "18", nova)]
+    assert runner.obter(handle, URL) is None
+
+
+def test_format_id_de_video_nao_vale_para_pedido_de_audio(runner):
+    info = {**INFO, "formats": INFO["formats"] + [
+        {"format_id": "140", "ext": "m4a", "vcodec": "none", "acodec": "mp4a", "url": "https://v/140"},
+    ]}
+    for task_id, format_id, seletor in (("t4", "137", seletor_audio("m4a")), ("t5", "140", "140")):
+        handle = runner.criar(URL, info)
+        download_runner.executar_download(task_id, {
+            "video_url": URL, "format": "mp4", "engine": "yt-dlp", "audio_only": True,
+            "format_id": format_id, "info_handle": handle,
+        })
+        assert YoutubeDLRegistrador.chamadas[-1][1] == seletor
@@ -0,0 +1,96 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import json
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.logging_config import (
+    AmostragemFilter,
+    CorrelacaoMiddleware,
+    CorrelationIdFilter,
+    JsonFormatter,
+    correlation_id_var,
+)
+
+
+class _Coletor(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.registros = []
+        self.addFilter(CorrelationIdFilter())
+        self.addFilter(AmostragemFilter())
+
+    def emit(self, record):
+        self.registros.append(record)
+
+
+def _app_com_coletor(regras):
+    app = FastAPI()
+    logger = logging.getLogger("teste.rotas")
+    coletor = _Coletor()
+    logger.addHandler(coletor)
+    logger.setLevel(logging.INFO)
+
+    @app.get("/ping")
+    async def ping():
+        logger.info("ping")
+        logger.warning("ping grave")
+        return {"correlation_id": correlation_id_var.get()}
+
+    @app.get("/pesado")
+    async def pesado():
+        logger.info("pesado")
+        return {}
+
+    app.add_middleware(CorrelacaoMiddleware, regras_amostragem=regras)
+    return app, logger, coletor
+
+
+def test_correlation_id_vem_do_cabecalho_e_volta_na_resposta():
+    app, logger, coletor = _app_com_coletor({})
+    try:
+        res = TestClient(app).get("/pesado", headers={"X-Request-ID": "req-123"})
+        assert res.headers["X-Correlation-ID"] == "req-123"
+        assert coletor.registros[0].correlation_id == "req-123"
+
+        gerado = TestClient(app).get("/pesado").headers["X-Correlation-ID"]
+        assert len(gerado) == 32
+    finally:
+        logger.removeHandler(coletor)
+
+
+def test_amostragem_descarta_info_mas_nunca_warning():
+    app, logger, coletor = _app_com_coletor({"/ping": 0})
+    try:
+        client = TestClient(app)
+        for _ in range(5):
+            client.get("/ping")
+        client.get("/pesado")
+        mensagens = [registro.getMessage() for registro in coletor.registros]
+        assert mensagens.count("ping") == 0
+        assert mensagens.count("ping grave") == 5
+        assert mensagens.count("pesado") == 1
+    finally:
+        logger.removeHandler(coletor)
+
+
+def test_json_formatter_inclui_extra_e_stack_trace():
+    logger = logging.getLogger("teste.json")
+    try:
+        raise ValueError("falhou")
+    except ValueError:
+        registro = logger.makeRecord(
+            "teste.json", logging.ERROR, __file__, 1, "Falha em %s", ("tarefa",), sys.exc_info(),
+            extra={"task_id": "abc", "correlation_id": "req-9"},
+        )
+    dados = json.loads(JsonFormatter().format(registro))
+    assert dados["message"] == "Falha em tarefa"
+    assert dados["level"] == "ERROR"
+    assert dados["task_id"] == "abc"
+    assert dados["correlation_id"] == "req-9"
+    assert "ValueError: falhou" in dados["stack_trace"]
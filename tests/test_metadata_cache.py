@@ -0,0 +1,65 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient
+
+import app.services.extraction_service as extraction_service
+import app.services.metadata_cache as metadata_cache
+from app.main import app_fastapi
+from app.services.metadata_cache import MemoriaBackend, MetadataCache
+
+client = TestClient(app_fastapi)
+
+
+def test_lru_despeja_entrada_menos_usada():
+    backend = MemoriaBackend(max_entradas=2)
+    backend.salvar("a", {"id": "a"}, ttl=60)
+    backend.salvar("b", {"id": "b"}, ttl=60)
+    backend.obter("a")
+    backend.salvar("c", {"id": "c"}, ttl=60)
+    assert backend.obter("b") is None
+    assert backend.obter("a") == {"id": "a"}
+    assert len(backend) == 2
+
+
+def test_ttl_expira_entrada():
+    cache = MetadataCache(MemoriaBackend(), ttl=0)
+    cache.salvar("https://vimeo.com/1", {"id": "1"})
+    time.sleep(0.01)
+    assert cache.obter("https://vimeo.com/1") is None
+    assert cache.estatisticas()["misses"] == 1
+
+
+def test_variantes_de_url_compartilham_entrada():
+    cache = MetadataCache(MemoriaBackend(), ttl=60)
+    cache.salvar("https://www.youtube.com/watch?v=abc123", {"id": "abc123"})
+    assert cache.obter("https://youtu.be/abc123") == {"id": "abc123"}
+    assert cache.obter("https://m.youtube.com/watch?v=abc123") == {"id": "abc123"}
+    assert cache.estatisticas()["hits"] == 2
+
+
+def test_info_e_options_extraem_uma_unica_vez(monkeypatch):
+    chamadas = []
+
+    def extracao_falsa(url):
+        chamadas.append(url)
+        return {"title": "Video", "formats": [{"format_id": "18", "ext": "mp4", "filesize": 10}]}
+
+    monkeypatch.setattr(metadata_cache, "_metadata_cache", MetadataCache(MemoriaBackend(), ttl=60))
+    monkeypatch.setattr(extraction_service, "extrair_info_video", extracao_falsa)
+
+    url = "https://www.youtube.com/watch?v=cache1"
+    assert client.get("/api/v1/video/info", params={"url": url}).json()["data"]["title"] == "Video"
+    assert client.get("/api/v1/video/options", params={"url": url}).json()["data"][0]["format_id"] == "18"
+    assert len(chamadas) == 1
+
+
+def test_leituras_nao_compartilham_o_dict():
+    backend = MemoriaBackend()
+    backend.salvar("a", {"id": "a", "formats": []}, ttl=60)
+    # O yt-dlp anota o dict recebido; a próxima leitura não pode ver isso
+    backend.obter("a")["requested_downloads"] = [{"filepath": "t1.mp4"}]
+    assert backend.obter("a") == {"id": "a", "formats": []}
@@ -0,0 +1,91 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import asyncio
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+import app.services.storage_manager as storage_manager
+from app.main import app_fastapi
+from app.services.result_cache import ResultCache
+from app.services.single_flight import SingleFlight
+from app.services.storage_manager import GerenciadorArmazenamento
+from app.core.metrics import extraction_coalesced_total
+from app.services.engine_manager import dominio_para_metricas
+
+client = TestClient(app_fastapi)
+
+
+def _amostra(nome, **rotulos):
+    return REGISTRY.get_sample_value(nome, rotulos) or 0.0
+
+
+def test_metrics_expoe_formato_prometheus(tmp_path, monkeypatch):
+    gerenciador = GerenciadorArmazenamento(diretorio=str(tmp_path), cota=1234)
+    (tmp_path / "0b4a6f2e-1c2d-4e5f-8a9b-0c1d2e3f4a5b.mp4").write_bytes(b"x" * 100)
+    monkeypatch.setattr(storage_manager, "_gerenciador", gerenciador)
+
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    assert "download_dir_quota_bytes 1234.0" in res.text
+    assert "download_dir_usage_bytes 100.0" in res.text
+
+
+def test_latencia_http_usa_template_da_rota():
+    antes = _amostra(
+        "http_request_duration_seconds_count", method="GET", route="/api/v1/video/task/{task_id}", status="404"
+    )
+    client.get("/api/v1/video/task/nao-existe-123")
+    depois = _amostra(
+        "http_request_duration_seconds_count", method="GET", route="/api/v1/video/task/{task_id}", status="404"
+    )
+    assert depois == antes + 1
+    # Nenhuma série com o ID concreto
+    assert "nao-existe-123" not in client.get("/metrics").text
+
+
+def test_cache_de_resultados_conta_hits_e_misses(tmp_path):
+    cache = ResultCache(str(tmp_path / "app.db"))
+    arquivo = tmp_path / "video.mp4"
+    arquivo.write_bytes(b"x")
+    misses = _amostra("cache_lookups_total", cache="result", outcome="miss")
+    hits = _amostra("cache_lookups_total", cache="result", outcome="hit")
+
+    cache.buscar("chave")
+    cache.registrar("chave", str(arquivo), "tarefa")
+    cache.buscar("chave")
+
+    assert _amostra("cache_lookups_total", cache="result", outcome="miss") == misses + 1
+    assert _amostra("cache_lookups_total", cache="result", outcome="hit") == hits + 1
+
+
+def test_single_flight_conta_chamadas_coalescidas():
+    grupo = SingleFlight(extraction_coalesced_total)
+    antes = _amostra("extraction_coalesced_total")
+
+    async def cenario():
+        async def lenta():
+            await asyncio.sleep(0.05)
+            return 1
+
+        return await asyncio.gather(*(grupo.executar("url", lenta) for _ in range(3)))
+
+    assert asyncio.run(cenario()) == [1, 1, 1]
+    assert _amostra("extraction_coalesced_total") == antes + 2
+
+
+def test_template_da_rota_nao_depende_do_valor_do_parametro():
+    rota = "/api/v1/download/{task_id}"
+    antes = _amostra("http_request_duration_seconds_count", method="GET", route=rota, status="404")
+    # O ID coincide com um segmento fixo do caminho
+    client.get("/api/v1/download/download")
+    assert _amostra("http_request_duration_seconds_count", method="GET", route=rota, status="404") == antes + 1
+
+
+def test_dominio_das_metricas_de_extracao_e_limitado():
+    assert dominio_para_metricas("https://music.youtube.com/watch?v=abc123") == "youtube.com"
+    assert dominio_para_metricas("https://qualquer-host-123.example/v/1") == "other"
@@ -0,0 +1,98 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient
+
+import app.services.progress_pubsub as progress_pubsub
+import app.routes.stream_endpoint as stream_endpoint
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.progress_pubsub import MemoriaPubSub, PublicadorProgresso
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+
+class _PubSubGravador:
+    def __init__(self):
+        self.eventos = []
+
+    def publicar(self, task_id, evento):
+        self.eventos.append(evento)
+
+
+def test_publicador_limita_taxa_de_eventos():
+    pubsub = _PubSubGravador()
+    publicador = PublicadorProgresso("t", pubsub=pubsub, taxa_maxima=1)
+    for baixados in range(0, 100, 10):
+        publicador.hook_ytdlp({"status": "downloading", "downloaded_bytes": baixados, "total_bytes": 100})
+    publicador.publicar("completed", forcar=True, progress=100)
+    assert [e["status"] for e in pubsub.eventos] == ["processing", "completed"]
+
+
+def test_websocket_recebe_progresso_ate_conclusao(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    pubsub = MemoriaPubSub()
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(progress_pubsub, "_pubsub", pubsub)
+    store.criar("t-ws", {"video_url": "https://vimeo.com/1"})
+
+    def worker():
+        while not pubsub._assinantes.get("t-ws"):
+            time.sleep(0.01)
+        publicador = PublicadorProgresso("t-ws", pubsub=pubsub)
+        publicador.hook_ytdlp({"status": "downloading", "downloaded_bytes": 50, "total_bytes": 100})
+        store.atualizar("t-ws", status="completed", progress=100)
+        publicador.publicar("completed", forcar=True, progress=100)
+
+    threading.Thread(target=worker).start()
+    with client.websocket_connect("/api/v1/video/task/t-ws/ws") as ws:
+        assert ws.receive_json()["status"] == "pending"
+        assert ws.receive_json()["progress"] == 50
+        assert ws.receive_json()["status"] == "completed"
+
+
+def test_sse_de_tarefa_concluida_envia_snapshot(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(progress_pubsub, "_pubsub", MemoriaPubSub())
+    store.criar("t-sse", {}, status="completed", progress=100)
+
+    res = client.get("/api/v1/video/task/t-sse/events")
+    assert res.headers["content-type"].startswith("text/event-stream")
+    assert '"status": "completed"' in res.text
+
+
+def test_stream_termina_pelo_store_sem_evento_publicado(tmp_path, monkeypatch):
+    # Worker em outro processo sem pub/sub compartilhado: só o TaskStore muda
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(progress_pubsub, "_pubsub", MemoriaPubSub())
+    monkeypatch.setattr(stream_endpoint, "STREAM_POLL_SECONDS", 0.05)
+    store.criar("t-poll", {})
+    worker = SQLiteTaskStore(str(tmp_path / "app.db"))
+    threading.Timer(0.2, lambda: worker.atualizar("t-poll", status="completed", progress=100)).start()
+
+    with client.websocket_connect("/api/v1/video/task/t-poll/ws") as ws:
+        assert ws.receive_json()["status"] == "pending"
+        assert ws.receive_json()["status"] == "completed"
+
+
+def test_websocket_detecta_desconexao_sem_eventos(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    pubsub = MemoriaPubSub()
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(progress_pubsub, "_pubsub", pubsub)
+    store.criar("t-parada", {})
+
+    with client.websocket_connect("/api/v1/video/task/t-parada/ws") as ws:
+        assert ws.receive_json()["status"] == "pending"
+    # A assinatura é liberada sem esperar por um evento que nunca chega
+    limite = time.monotonic() + 5
+    while pubsub._assinantes.get("t-parada"):
+        assert time.monotonic() < limite
+        time.sleep(0.01)
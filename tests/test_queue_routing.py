@@ -0,0 +1,51 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import app.services.metadata_cache as metadata_cache
+import app.tasks.download_tasks as download_tasks
+from app.services.execution_backend import CeleryBackend
+from app.services.metadata_cache import MemoriaBackend, MetadataCache
+from app.tasks.celery_config import FILA_CURTA, FILA_LONGA, prioridade_no_broker
+from app.tasks.routing import escolher_fila
+
+VIDEO_LONGO = {"duration": 3 * 3600, "filesize": 4 * 1024 ** 3, "tbr": 3000, "abr": 128}
+VIDEO_CURTO = {"duration": 120, "filesize": 30 * 1024 ** 2}
+
+
+def test_fila_pela_estimativa_de_metadados():
+    assert escolher_fila({"format": "mp4"}, VIDEO_CURTO) == (FILA_CURTA, 7)
+    assert escolher_fila({"format": "mp4"}, VIDEO_LONGO) == (FILA_LONGA, 4)
+    # 30 segundos de uma live de 3 horas é um job curto
+    recorte = {"format": "mp4", "start_time": "01:00:00", "end_time": "01:00:30"}
+    assert escolher_fila(recorte, VIDEO_LONGO)[0] == FILA_CURTA
+    # Item de lote perde prioridade para pedidos individuais
+    assert escolher_fila({"format": "mp4", "parent_id": "p"}, VIDEO_CURTO) == (FILA_CURTA, 5)
+
+
+def test_sem_metadados_audio_vai_para_fila_curta(monkeypatch):
+    monkeypatch.setattr(metadata_cache, "_metadata_cache", MetadataCache(MemoriaBackend(), ttl=60))
+    assert escolher_fila({"video_url": "https://vimeo.com/1", "format": "mp3"}) == (FILA_CURTA, 8)
+    assert escolher_fila({"video_url": "https://vimeo.com/1", "format": "mp4"})[0] == FILA_LONGA
+
+
+def test_prioridade_invertida_no_redis():
+    assert prioridade_no_broker(9) == 0
+    assert prioridade_no_broker(20) == 0
+
+
+def test_celery_backend_publica_na_fila_escolhida(monkeypatch):
+    cache = MetadataCache(MemoriaBackend(), ttl=60)
+    cache.salvar("https://vimeo.com/2", VIDEO_LONGO)
+    monkeypatch.setattr(metadata_cache, "_metadata_cache", cache)
+    publicadas = []
+    monkeypatch.setattr(
+        download_tasks.processar_download_video, "apply_async", lambda **kwargs: publicadas.append(kwargs)
+    )
+
+    asyncio.run(CeleryBackend().submeter("t1", {"video_url": "https://vimeo.com/2", "format": "mp4"}))
+    assert publicadas[0]["queue"] == FILA_LONGA
+    assert publicadas[0]["priority"] == prioridade_no_broker(4)
+    assert publicadas[0]["task_id"] == "t1"
@@ -0,0 +1,134 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.download_runner as download_runner
+import app.services.execution_backend as execution_backend
+import app.services.rate_limiter as rate_limiter
+import app.services.result_cache as result_cache
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.execution_backend import ExecutionBackend
+from app.services.rate_limiter import LimitadorDownloads, LimiteAtingidoError, MemoriaLimitador
+from app.services.result_cache import ResultCache
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+
+class BackendGravador(ExecutionBackend):
+    nome = "gravador"
+
+    def __init__(self):
+        self.submetidas = []
+
+    async def submeter(self, task_id, dados_requisicao):
+        self.submetidas.append((task_id, dados_requisicao))
+
+
+@pytest.fixture
+def limitador(monkeypatch):
+    limitador = LimitadorDownloads(MemoriaLimitador())
+    monkeypatch.setattr(rate_limiter, "_limitador", limitador)
+    return limitador
+
+
+def test_token_bucket_e_slots():
+    backend = MemoriaLimitador()
+    assert backend.consumir("k", taxa=1, capacidade=2) == 0
+    assert backend.consumir("k", taxa=1, capacidade=2) == 0
+    assert 0.9 < backend.consumir("k", taxa=1, capacidade=2) <= 1
+
+    assert backend.adquirir_slot("s", "a", limite=1)
+    assert backend.adquirir_slot("s", "a", limite=1)  # reentrante para o mesmo dono
+    assert not backend.adquirir_slot("s", "b", limite=1)
+    backend.liberar_slot("s", "a")
+    assert backend.adquirir_slot("s", "b", limite=1)
+    assert backend.adquirir_slot("t", "x", limite=1, ttl=0) and backend.slots_em_uso("t") == 0
+
+
+def test_limites_por_dominio_com_sobrescrita(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "DOMAIN_LIMITS", {"youtube.com": {"concurrency": 1}})
+    assert rate_limiter.limites_do_dominio("m.youtube.com")["concurrency"] == 1
+    assert rate_limiter.limites_do_dominio("vimeo.com")["concurrency"] == rate_limiter.DOMAIN_MAX_CONCURRENCY
+
+
+def test_cliente_recebe_429_com_retry_after(tmp_path, monkeypatch, limitador):
+    monkeypatch.setattr(task_store, "_task_store", SQLiteTaskStore(str(tmp_path / "app.db")))
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    backend = BackendGravador()
+    monkeypatch.setattr(execution_backend, "_backend", backend)
+    monkeypatch.setattr(rate_limiter, "CLIENT_MAX_ACTIVE", 1)
+    corpo = {"video_url": "https://vimeo.com/11", "format": "mp4"}
+
+    assert client.post("/api/v1/video/download", json=corpo, headers={"X-API-Key": "a"}).status_code == 202
+    res = client.post("/api/v1/video/download", json=corpo, headers={"X-API-Key": "a"})
+    assert res.status_code == 429
+    assert int(res.headers["retry-after"]) >= 1
+    # Outro cliente não é afetado, e a chave não é gravada em claro
+    assert client.post("/api/v1/video/download", json=corpo, headers={"X-API-Key": "b"}).status_code == 202
+    assert all("a" != dados["client_id"].split(":")[1] for _, dados in backend.submetidas)
+
+    # Terminado o download do primeiro cliente, o slot volta
+    task_id, dados = backend.submetidas[0]
+    limitador.liberar_cliente(dados["client_id"], task_id)
+    assert client.post("/api/v1/video/download", json=corpo, headers={"X-API-Key": "a"}).status_code == 202
+
+
+def test_worker_espera_slot_do_dominio(tmp_path, monkeypatch, limitador):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(rate_limiter, "DOMAIN_LIMITS", {"vimeo.com": {"concurrency": 1}})
+    limitador.iniciar_no_dominio("vimeo.com", "outra-tarefa")
+
+    with pytest.raises(LimiteAtingidoError) as erro:
+        download_runner.executar_download("t1", {"video_url": "https://vimeo.com/1", "format": "mp4"})
+    assert erro.value.retry_after >= 1
+    # Nada foi tocado: a tarefa continua na fila
+    assert store.obter("t1") is None
+
+
+class RedisFalso(MemoriaLimitador):
+    """Estado compartilhado entre instâncias, como o Redis entre a API e os workers."""
+
+    _estado = None
+
+    def __init__(self, url=None):
+        if RedisFalso._estado is None:
+            super().__init__()
+            RedisFalso._estado = self.__dict__
+        self.__dict__ = RedisFalso._estado
+
+
+class BackendWorkerSeparado(ExecutionBackend):
+    """Executa e libera o slot num limitador próprio, como um worker Celery em outro processo."""
+
+    nome = "worker-separado"
+
+    async def submeter(self, task_id, dados_requisicao):
+        worker = rate_limiter.LimitadorDownloads(rate_limiter.RedisLimitador())
+        worker.liberar_cliente(dados_requisicao["client_id"], task_id)
+
+
+def test_slots_liberados_pelo_worker_de_outro_processo(tmp_path, monkeypatch):
+    monkeypatch.setattr(task_store, "_task_store", SQLiteTaskStore(str(tmp_path / "app.db")))
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    monkeypatch.setattr(execution_backend, "_backend", BackendWorkerSeparado())
+    monkeypatch.setattr(rate_limiter, "RedisLimitador", RedisFalso)
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_BACKEND", None)
+    monkeypatch.setattr(rate_limiter, "EXECUTION_BACKEND", "celery")
+    monkeypatch.setattr(rate_limiter, "_limitador", None)
+    monkeypatch.setattr(RedisFalso, "_estado", None)
+
+    for i in range(rate_limiter.CLIENT_MAX_ACTIVE + 5):
+        corpo = {"video_url": f"https://vimeo.com/{i}", "format": "mp4"}
+        assert client.post("/api/v1/video/download", json=corpo, headers={"X-API-Key": "c"}).status_code == 202
+
+    # Memória por processo com Celery deixaria os slots presos: a configuração é recusada
+    monkeypatch.setattr(rate_limiter, "RATE_LIMIT_BACKEND", "memory")
+    with pytest.raises(RuntimeError):
+        rate_limiter.nome_do_backend()
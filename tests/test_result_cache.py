@@ -0,0 +1,56 @@
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient
+
+import app.services.result_cache as result_cache
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.result_cache import ResultCache, gerar_chave_resultado
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+
+def test_chave_ignora_variacao_de_url_mas_nao_de_formato():
+    base = {"video_url": "https://www.youtube.com/watch?v=abc", "format": "mp4"}
+    assert gerar_chave_resultado(base) == gerar_chave_resultado({**base, "video_url": "https://youtu.be/abc"})
+    assert gerar_chave_resultado(base) != gerar_chave_resultado({**base, "format": "mp3"})
+    assert gerar_chave_resultado(base) != gerar_chave_resultado({**base, "start_time": "00:00:10"})
+
+
+def test_arquivo_so_e_removido_sem_referencias(tmp_path):
+    cache = ResultCache(str(tmp_path / "app.db"))
+    arquivo = tmp_path / "video.mp4"
+    arquivo.write_bytes(b"x" * 10)
+    cache.registrar("k", str(arquivo), "t1")
+    cache.adicionar_referencia("k", "t2")
+
+    assert cache.liberar_referencia("t1") == "k"
+    assert not cache.remover_se_sem_referencias("k")
+    cache.liberar_referencia("t2")
+    assert cache.remover_se_sem_referencias("k")
+    assert not arquivo.exists()
+    assert cache.buscar("k") is None
+
+
+def test_requisicao_identica_conclui_instantaneamente(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "app.db"))
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(result_cache, "_result_cache", cache)
+    monkeypatch.setattr(task_store, "_task_store", store)
+
+    payload = {"video_url": "https://vimeo.com/123", "format": "mp4"}
+    arquivo = tmp_path / "pronto.mp4"
+    arquivo.write_bytes(b"video")
+    chave = gerar_chave_resultado({**payload, "audio_only": False})
+    cache.registrar(chave, str(arquivo), "tarefa-original")
+
+    res = client.post("/api/v1/video/download", json=payload)
+    assert res.status_code == 202
+    dados = res.json()["data"]
+    assert dados["status"] == "completed"
+    assert store.obter(dados["task_id"])["file_path"] == str(arquivo)
+    assert cache.contar_referencias(chave) == 2
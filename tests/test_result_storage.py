@@ -0,0 +1,143 @@
+import sys
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.download_runner as download_runner
+import app.services.engine_stats as engine_stats
+import app.services.result_cache as result_cache
+import app.services.result_storage as result_storage
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.engine_stats import EngineStats
+from app.services.result_cache import ResultCache
+from app.services.result_storage import ArmazenamentoLocal, ArmazenamentoS3
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+PARTE = 5 * 1024 * 1024
+
+
+@pytest.fixture
+def tarefa_local(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(result_storage, "RESULT_SIGNING_KEY", "chave-compartilhada")
+    monkeypatch.setattr(result_storage, "_armazenamento_local", ArmazenamentoLocal(redireciona=True, url_base=""))
+    monkeypatch.chdir(tmp_path)
+    Path("app/download").mkdir(parents=True)
+    Path("app/download/t1.mp4").write_bytes(b"video pronto")
+    store.criar("t1", {"video_url": "https://vimeo.com/1"}, status="completed")
+    store.atualizar("t1", file_path="app/download/t1.mp4")
+    return store
+
+
+def test_redirect_local_assinado(tarefa_local):
+    resposta = client.get("/api/v1/download/t1", follow_redirects=False)
+    assert resposta.status_code == 307
+    assert resposta.headers["cache-control"] == "no-store"
+    link = resposta.headers["location"]
+    assert client.get(link).content == b"video pronto"
+
+    consulta = {chave: valor[0] for chave, valor in parse_qs(urlparse(link).query).items()}
+    adulterado = {**consulta, "name": "outro.mp4"}
+    assert client.get("/api/v1/files/t1.mp4", params=adulterado).status_code == 403
+    vencido = {**consulta, "expires": int(time.time()) - 1}
+    assert client.get("/api/v1/files/t1.mp4", params=vencido).status_code == 403
+
+
+def test_redirect_local_exige_chave_de_assinatura(monkeypatch):
+    monkeypatch.setattr(result_storage, "RESULT_SIGNING_KEY", None)
+    with pytest.raises(ValueError):
+        ArmazenamentoLocal(redireciona=True)
+    assert not ArmazenamentoLocal(redireciona=False).redireciona
+
+
+@pytest.fixture(scope="module")
+def servidor_s3():
+    pytest.importorskip("boto3")
+    moto_server = pytest.importorskip("moto.server")
+    servidor = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=0)
+    servidor.start()
+    host, porta = servidor.get_host_and_port()
+    yield f"http://{host}:{porta}"
+    servidor.stop()
+
+
+@pytest.fixture
+def s3(servidor_s3, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "teste")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "teste")
+    armazenamento = ArmazenamentoS3(bucket="resultados", endpoint_url=servidor_s3, tamanho_parte=PARTE)
+    armazenamento._cliente.create_bucket(Bucket="resultados")
+    return armazenamento
+
+
+def test_publicar_envia_em_partes_e_libera_o_disco(s3, tmp_path):
+    conteudo = bytes(range(256)) * (11 * 1024 * 1024 // 256)
+    arquivo = tmp_path / "t2.mp4"
+    arquivo.write_bytes(conteudo)
+
+    localizador = s3.publicar(str(arquivo))
+    assert localizador == "s3://resultados/results/t2.mp4"
+    assert not arquivo.exists()
+    objeto = s3._cliente.head_object(Bucket="resultados", Key="results/t2.mp4")
+    # 11 MiB em partes de 5 MiB: três partes
+    assert objeto["ContentLength"] == len(conteudo)
+    assert objeto["ETag"].strip('"').endswith("-3")
+    with urlopen(s3.url_assinada(localizador, "download-t2.mp4")) as resposta:
+        assert resposta.headers["Content-Disposition"] == 'attachment; filename="download-t2.mp4"'
+        assert resposta.read() == conteudo
+
+
+def test_abortar_descarta_o_upload(s3):
+    escrita = s3.abrir_escrita("app/download/t3.mp4")
+    escrita.write(b"x" * (PARTE + 1))
+    escrita.abortar()
+    assert not s3._cliente.list_multipart_uploads(Bucket="resultados").get("Uploads")
+    assert "Contents" not in s3._cliente.list_objects_v2(Bucket="resultados", Prefix="results/t3")
+
+
+class YoutubeDLSimples:
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def process_ie_result(self, info, download=True):
+        caminho = self.opcoes["outtmpl"].replace("%(ext)s", "mp4")
+        Path(caminho).write_bytes(b"video do worker")
+        return {**info, "requested_downloads": [{"filepath": caminho, "ext": "mp4"}]}
+
+
+def test_worker_publica_no_s3_e_download_redireciona(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(task_store, "_task_store", SQLiteTaskStore(str(tmp_path / "app.db")))
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    monkeypatch.setattr(engine_stats, "_engine_stats", EngineStats(str(tmp_path / "app.db")))
+    monkeypatch.setattr(result_storage, "_armazenamento", s3)
+    monkeypatch.setattr(download_runner, "YoutubeDL", YoutubeDLSimples)
+    monkeypatch.setattr(download_runner, "obter_info_video_sincrono", lambda url: {"id": "1"})
+    monkeypatch.chdir(tmp_path)
+
+    task_store.get_task_store().criar("t4", {"video_url": "https://vimeo.com/1"})
+    resultado = download_runner.executar_download(
+        "t4", {"video_url": "https://vimeo.com/1", "format": "mp4", "engine": "yt-dlp"}
+    )
+    assert resultado["status"] == "completed"
+    assert not list(Path("app/download").glob("t4*"))
+    assert result_cache.get_result_cache().bytes_remotos() == len(b"video do worker")
+
+    resposta = client.get("/api/v1/download/t4", follow_redirects=False)
+    assert resposta.status_code == 307
+    with urlopen(resposta.headers["location"]) as objeto:
+        assert objeto.read() == b"video do worker"
@@ -0,0 +1,183 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+import app.services.segmented_downloader as segmented_downloader
+from app.services.segmented_downloader import (
+    DownloadSegmentadoError,
+    baixar_segmentado,
+    dividir_em_segmentos,
+    selecionar_formato_progressivo,
+)
+
+CONTEUDO = os.urandom(300_000)
+
+
+class _ServidorRange(BaseHTTPRequestHandler):
+    aceita_ranges = True
+    falhas_restantes = 0
+    ranges_pedidos = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        cabecalho = self.headers.get("Range")
+        if not cabecalho or not self.aceita_ranges:
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(CONTEUDO)))
+            self.end_headers()
+            self.wfile.write(CONTEUDO)
+            return
+        if type(self).ranges_pedidos is not None:
+            type(self).ranges_pedidos.append(cabecalho)
+        inicio_txt, fim_txt = cabecalho.split("=")[1].split("-")
+        inicio, fim = int(inicio_txt), int(fim_txt or len(CONTEUDO) - 1)
+        corpo = CONTEUDO[inicio:fim + 1]
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {inicio}-{fim}/{len(CONTEUDO)}")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        if inicio > 0 and type(self).falhas_restantes > 0:
+            # Simula uma conexão que cai no meio do segmento
+            type(self).falhas_restantes -= 1
+            self.wfile.write(corpo[: len(corpo) // 2])
+            return
+        self.wfile.write(corpo)
+
+
+@pytest.fixture
+def servidor():
+    handler = type("Handler", (_ServidorRange,), {})
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{httpd.server_address[1]}/video.mp4"
+    httpd.shutdown()
+
+
+def test_dividir_em_segmentos_cobre_arquivo_inteiro():
+    segmentos = dividir_em_segmentos(1000, 3, tamanho_minimo=100)
+    assert segmentos[0][0] == 0 and segmentos[-1][1] == 999
+    assert sum(fim - inicio + 1 for inicio, fim in segmentos) == 1000
+    assert dividir_em_segmentos(50, 8, tamanho_minimo=100) == [(0, 49)]
+
+
+def test_download_segmentado_com_retry_de_segmento(servidor, tmp_path):
+    handler, url = servidor
+    handler.falhas_restantes = 2
+    eventos = []
+    destino = tmp_path / "video.mp4"
+
+    total = baixar_segmentado(
+        url, str(destino), conexoes=4, tamanho_minimo_segmento=50_000, ao_progredir=eventos.append
+    )
+    assert total == len(CONTEUDO)
+    assert destino.read_bytes() == CONTEUDO
+    assert not (tmp_path / "video.mp4.part").exists()
+    assert eventos[-1]["total_bytes"] == len(CONTEUDO)
+
+
+def test_retoma_do_checkpoint_apos_queda(servidor, tmp_path):
+    handler, url = servidor
+    destino = tmp_path / "video.mp4"
+    opcoes = {"conexoes": 3, "tamanho_minimo_segmento": 100_000, "identidade": "v:18"}
+
+    # Primeira execução "cai": os segmentos após o primeiro param na metade
+    handler.falhas_restantes = 2
+    with pytest.raises(DownloadSegmentadoError):
+        baixar_segmentado(url, str(destino), tentativas=0, **opcoes)
+    assert (tmp_path / "video.mp4.part.json").exists()
+
+    # A reentrega pede só o que falta: nada do primeiro segmento, o resto a partir da metade
+    handler.ranges_pedidos = []
+    eventos = []
+    assert baixar_segmentado(url, str(destino), ao_progredir=eventos.append, **opcoes) == len(CONTEUDO)
+    assert destino.read_bytes() == CONTEUDO
+    assert not (tmp_path / "video.mp4.part.json").exists()
+    inicios = sorted(int(r.split("=")[1].split("-")[0]) for r in handler.ranges_pedidos)
+    assert inicios[0] == 0  # sondagem (bytes=0-0)
+    assert inicios[1:] == [150_000, 250_000]
+    assert eventos[0]["downloaded_bytes"] > 150_000
+
+
+def test_checkpoint_de_outro_recurso_e_ignorado(servidor, tmp_path):
+    handler, url = servidor
+    destino = tmp_path / "video.mp4"
+    handler.falhas_restantes = 2
+    with pytest.raises(DownloadSegmentadoError):
+        baixar_segmentado(url, str(destino), conexoes=3, tamanho_minimo_segmento=100_000, tentativas=0, identidade="a")
+    handler.ranges_pedidos = []
+    baixar_segmentado(url, str(destino), conexoes=3, tamanho_minimo_segmento=100_000, identidade="b")
+    assert destino.read_bytes() == CONTEUDO
+    assert "bytes=0-99999" in handler.ranges_pedidos
+
+
+def test_checkpoint_gravado_por_varias_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(segmented_downloader, "SEGMENTED_CHECKPOINT_INTERVAL", 0)
+    parcial = tmp_path / "video.mp4.part"
+    parcial.write_bytes(b"\0" * 4000)
+    segmentos = [(i * 1000, i * 1000 + 999) for i in range(4)]
+    with open(parcial, "r+b") as arquivo:
+        checkpoint = segmented_downloader._Checkpoint(
+            str(parcial) + ".json", arquivo.fileno(), 4000, "v", {s: s[0] for s in segmentos}
+        )
+        erros = []
+
+        def avancar(segmento):
+            try:
+                for posicao in range(segmento[0], segmento[1] + 2, 10):
+                    checkpoint.avancar(segmento, posicao)
+            except Exception as e:
+                erros.append(e)
+
+        threads = [threading.Thread(target=avancar, args=(s,)) for s in segmentos]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        checkpoint.gravar()
+    assert erros == []
+    posicoes = segmented_downloader._Checkpoint.carregar(str(parcial) + ".json", str(parcial), 4000, "v")
+    assert posicoes == {s: s[1] + 1 for s in segmentos}
+
+
+def test_excecao_do_callback_aborta_todos_os_segmentos_sem_repetir(servidor, tmp_path):
+    handler, url = servidor
+    handler.ranges_pedidos = []
+
+    class Cancelada(Exception):
+        pass
+
+    def ao_progredir(evento):
+        raise Cancelada()
+
+    with pytest.raises(Cancelada):
+        baixar_segmentado(url, str(tmp_path / "video.mp4"), conexoes=3, tamanho_minimo_segmento=100_000,
+                          ao_progredir=ao_progredir)
+    # Uma requisição por segmento, nenhuma repetição
+    assert len(handler.ranges_pedidos) <= 4
+
+
+def test_servidor_sem_range_usa_conexao_unica(servidor, tmp_path):
+    handler, url = servidor
+    handler.aceita_ranges = False
+    destino = tmp_path / "video.mp4"
+    assert baixar_segmentado(url, str(destino)) == len(CONTEUDO)
+    assert destino.read_bytes() == CONTEUDO
+
+
+def test_seleciona_formato_progressivo():
+    info = {"formats": [
+        {"format_id": "hls", "protocol": "m3u8_native", "url": "u", "vcodec": "avc1", "acodec": "mp4a"},
+        {"format_id": "video", "protocol": "https", "url": "u", "vcodec": "avc1", "acodec": "none"},
+        {"format_id": "18", "protocol": "https", "url": "u", "vcodec": "avc1", "acodec": "mp4a", "ext": "mp4", "height": 360},
+        {"format_id": "audio", "protocol": "https", "url": "u", "vcodec": "none", "acodec": "opus", "ext": "webm"},
+    ]}
+    assert selecionar_formato_progressivo(info, {"format": "mp4"})["format_id"] == "18"
+    assert selecionar_formato_progressivo(info, {"audio_only": True})["format_id"] == "audio"
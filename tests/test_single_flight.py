@@ -0,0 +1,76 @@
+import asyncio
+import gc
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+def test_chamadas_concorrentes_compartilham_execucao():
+    async def cenario():
+        grupo = SingleFlight()
+        execucoes = []
+
+        async def extrair():
+            execucoes.append(1)
+            await asyncio.sleep(0.05)
+            return {"id": "abc"}
+
+        resultados = await asyncio.gather(*(grupo.executar("youtube:abc", extrair) for _ in range(10)))
+        assert all(r == {"id": "abc"} for r in resultados)
+        assert len(execucoes) == 1
+        assert grupo.estatisticas() == {"executions": 1, "coalesced": 9, "in_flight": 0}
+
+    asyncio.run(cenario())
+
+
+def test_erro_propagado_para_todos_os_chamadores():
+    async def cenario():
+        grupo = SingleFlight()
+
+        async def falhar():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("origem indisponível")
+
+        resultados = await asyncio.gather(
+            *(grupo.executar("youtube:x", falhar) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in resultados)
+        # A chave é liberada; uma nova chamada executa novamente
+        with pytest.raises(RuntimeError):
+            await grupo.executar("youtube:x", falhar)
+        assert grupo.execucoes == 2
+
+    asyncio.run(cenario())
+
+
+def test_falha_sem_chamadores_e_consumida_e_libera_a_chave(caplog):
+    async def cenario():
+        grupo = SingleFlight()
+        nao_lidas = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, contexto: nao_lidas.append(contexto))
+
+        async def falhar():
+            await asyncio.sleep(0.02)
+            raise RuntimeError("origem indisponível")
+
+        chamadores = [asyncio.ensure_future(grupo.executar("youtube:y", falhar)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for chamador in chamadores:
+            chamador.cancel()
+        await asyncio.gather(*chamadores, return_exceptions=True)
+        assert grupo.em_andamento == 1
+
+        # A execução compartilhada segue sozinha, falha e sai da tabela
+        await asyncio.sleep(0.05)
+        assert grupo.em_andamento == 0
+        del chamadores
+        gc.collect()
+        assert nao_lidas == []
+
+    asyncio.run(cenario())
+    assert "Execução compartilhada falhou" in caplog.text
@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.services.download_runner as download_runner
+import app.services.engine_stats as engine_stats
+import app.services.result_cache as result_cache
+import app.services.storage_manager as storage_manager
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.engine_stats import EngineStats
+from app.services.result_cache import ResultCache
+from app.services.storage_manager import ArmazenamentoCheioError, GerenciadorArmazenamento
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+
+@pytest.fixture
+def ambiente(tmp_path):
+    diretorio = tmp_path / "download"
+    diretorio.mkdir()
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    cache = ResultCache(str(tmp_path / "app.db"))
+    return diretorio, store, cache
+
+
+def _nome_de_tarefa(nome):
+    # Só arquivos nomeados por tarefa ({task_id}.<ext>) contam no uso do diretório
+    return "0b4a6f2e-1c2d-4e5f-8a9b-%012x.%s" % (sum(map(ord, nome)), nome.split(".")[-1])
+
+
+def _resultado(diretorio, cache, nome, tamanho, task_id=None):
+    caminho = diretorio / _nome_de_tarefa(nome)
+    caminho.write_bytes(b"x" * tamanho)
+    cache.registrar(nome, str(caminho), task_id or f"tarefa-{nome}")
+    if task_id is None:
+        cache.liberar_referencia(f"tarefa-{nome}")
+    return caminho
+
+
+def test_despejo_lru_comeca_pelos_sem_referencia(ambiente):
+    diretorio, store, cache = ambiente
+    antigo_referenciado = _resultado(diretorio, cache, "a.mp4", 400, task_id="t-a")
+    antigo = _resultado(diretorio, cache, "b.mp4", 300)
+    recente = _resultado(diretorio, cache, "c.mp4", 300, task_id="t-c")
+    cache.marcar_servido("c.mp4")
+
+    gerenciador = GerenciadorArmazenamento(
+        str(diretorio), cota=1000, marca_alta=0.9, marca_baixa=0.75, livre_minimo=0, store=store, cache=cache
+    )
+    # 1000 bytes em uso: acima da marca alta (900); basta liberar 300 para chegar a 750
+    assert gerenciador.liberar_espaco() == 300
+    assert not antigo.exists()
+    assert antigo_referenciado.exists() and recente.exists()
+
+    # Acima da marca alta só com referenciados: sai o menos servido, e a tarefa dele perde o arquivo
+    store.criar("t-a", {}, status="completed", file_path=str(antigo_referenciado), result_cache_key="a.mp4")
+    (diretorio / _nome_de_tarefa("outro.bin")).write_bytes(b"x" * 300)
+    assert gerenciador.liberar_espaco() == 400
+    assert not antigo_referenciado.exists() and recente.exists()
+    assert cache.contar_referencias("a.mp4") == 0
+    assert store.obter("t-a")["file_path"] is None
+    assert store.obter("t-a")["error"] == storage_manager.MOTIVO_DESPEJO
+    gerenciador.verificar_admissao()
+
+
+class YoutubeDLDe400Bytes:
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def process_ie_result(self, info, download=True):
+        caminho = self.opcoes["outtmpl"].replace("%(ext)s", "mp4")
+        Path(caminho).write_bytes(b"x" * 400)
+        return {**info, "requested_downloads": [{"filepath": caminho}]}
+
+
+def test_disco_cheio_de_resultados_referenciados_volta_a_admitir(ambiente, monkeypatch):
+    diretorio, store, cache = ambiente
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(result_cache, "_result_cache", cache)
+    monkeypatch.setattr(engine_stats, "_engine_stats", EngineStats(str(diretorio.parent / "app.db")))
+    monkeypatch.setattr(download_runner, "YoutubeDL", YoutubeDLDe400Bytes)
+    monkeypatch.setattr(download_runner, "obter_info_video_sincrono", lambda url: {"id": url})
+    monkeypatch.chdir(diretorio.parent)
+
+    # Tarefas concluídas de verdade: cada uma registra o resultado e mantém a referência
+    tarefas = []
+    for numero in range(3):
+        task_id = "0b4a6f2e-1c2d-4e5f-8a9b-%012d" % numero
+        store.criar(task_id, {})
+        dados = {"video_url": f"https://vimeo.com/{numero}", "format": "mp4", "engine": "yt-dlp"}
+        assert download_runner.executar_download(task_id, dados)["status"] == "completed"
+        tarefas.append(task_id)
+    assert all(cache.contar_referencias(store.obter(t)["result_cache_key"]) == 1 for t in tarefas)
+
+    gerenciador = GerenciadorArmazenamento(
+        "app/download", cota=1000, marca_alta=0.9, marca_baixa=0.75, livre_minimo=0, store=store, cache=cache
+    )
+    monkeypatch.setattr(storage_manager, "_gerenciador", gerenciador)
+    with pytest.raises(ArmazenamentoCheioError):
+        gerenciador.verificar_admissao()
+
+    # 1200 bytes: o zelador despeja os dois menos servidos e novos downloads voltam a entrar
+    assert gerenciador.executar_ciclo()["evicted_bytes"] == 800
+    gerenciador.verificar_admissao()
+    resposta = client.get(f"/api/v1/download/{tarefas[0]}")
+    assert resposta.status_code == 410
+    assert resposta.json()["detail"] == storage_manager.MOTIVO_DESPEJO
+    assert client.get(f"/api/v1/download/{tarefas[2]}").content == b"x" * 400
+
+
+def test_uso_conta_so_arquivos_de_tarefas(ambiente):
+    diretorio, store, cache = ambiente
+    (diretorio / "page.tsx").write_text("x" * 500)
+    _resultado(diretorio, cache, "a.mp4", 100)
+    gerenciador = GerenciadorArmazenamento(str(diretorio), cota=1000, livre_minimo=0, store=store, cache=cache)
+    assert gerenciador.medir_uso() == 100
+
+
+def test_resultados_remotos_tem_cota_propria(ambiente):
+    diretorio, store, cache = ambiente
+    local = _resultado(diretorio, cache, "a.mp4", 300)
+    cache.registrar("r1", "s3://resultados/results/r1.mp4", "t-r1", tamanho=5000)
+    cache.liberar_referencia("t-r1")
+    cache.registrar("r2", "s3://resultados/results/r2.mp4", "t-r2", tamanho=5000)
+
+    gerenciador = GerenciadorArmazenamento(
+        str(diretorio), cota=1000, cota_remota=11_000, livre_minimo=0, store=store, cache=cache
+    )
+    # O bucket não ocupa a cota local nem faz o disco despejar
+    assert gerenciador.medir_uso() == 300
+    gerenciador.verificar_admissao()
+    # 10000 bytes remotos passam da marca alta (9900): sai só o objeto sem referências
+    assert gerenciador.liberar_espaco() == 5000
+    assert local.exists()
+    assert not cache.contem_arquivo("s3://resultados/results/r1.mp4")
+    assert gerenciador.uso_remoto() == 5000
+
+
+def test_expira_tarefas_com_resultado_remoto_sem_backend_s3(ambiente):
+    diretorio, store, cache = ambiente
+    arquivo = diretorio / _nome_de_tarefa("local.mp4")
+    arquivo.write_bytes(b"x")
+    store.criar("remota", {}, status="completed", created_at="2000-01-01T00:00:00")
+    store.atualizar("remota", file_path="s3://resultados/results/remota.mp4")
+    store.criar("local", {}, status="completed", created_at="2000-01-01T00:00:00")
+    store.atualizar("local", file_path=str(arquivo))
+
+    gerenciador = GerenciadorArmazenamento(
+        str(diretorio), cota=10 ** 9, ttl_tarefas=24 * 3600, livre_minimo=0, store=store, cache=cache
+    )
+    assert gerenciador.expirar_tarefas() == 2
+    assert store.obter("remota") is None and store.obter("local") is None
+    assert not arquivo.exists()
+
+
+def test_expira_tarefas_e_arquivos_legados(ambiente):
+    diretorio, store, cache = ambiente
+    store.criar("velha", {}, status="completed", created_at="2000-01-01T00:00:00")
+    store.criar("em-andamento", {}, status="processing", created_at="2000-01-01T00:00:00")
+    store.criar("nova", {}, status="completed")
+    compartilhado = _resultado(diretorio, cache, "r.mp4", 10, task_id="velha")
+    store.atualizar("velha", file_path=str(compartilhado))
+
+    legado = diretorio / "0b4a6f2e-1c2d-4e5f-8a9b-0c1d2e3f4a5b.json"
+    legado.write_text("{}")
+    os.utime(legado, (time.time() - 10 * 24 * 3600,) * 2)
+    (diretorio / "page.tsx").write_text("export default function Page() {}")
+
+    gerenciador = GerenciadorArmazenamento(
+        str(diretorio), cota=10 ** 9, ttl_tarefas=24 * 3600, livre_minimo=0, store=store, cache=cache
+    )
+    resultado = gerenciador.executar_ciclo()
+    assert resultado["expired_tasks"] == 1
+    assert resultado["legacy_files"] == 1
+    assert store.obter("velha") is None
+    assert store.obter("em-andamento") is not None and store.obter("nova") is not None
+    # O arquivo continua no cache (sem referências) até o despejo por cota
+    assert compartilhado.exists() and cache.contar_referencias("r.mp4") == 0
+    assert (diretorio / "page.tsx").exists()
+
+
+def test_coleta_parciais_orfaos(ambiente):
+    diretorio, store, cache = ambiente
+    terminada, andamento, sem_registro, recente = (
+        "0b4a6f2e-1c2d-4e5f-8a9b-0c1d2e3f4a5%d" % i for i in range(4)
+    )
+    store.criar(terminada, {}, status="failed")
+    store.criar(andamento, {}, status="processing")
+    arquivos = {
+        terminada: [f"{terminada}.mp4.part", f"{terminada}.mp4.part.json"],
+        andamento: [f"{andamento}.f137.mp4.part", f"{andamento}.f137.mp4.ytdl"],
+        sem_registro: [f"{sem_registro}.f251.webm.part-Frag3"],
+        recente: [f"{recente}.mp4.part"],
+    }
+    for task_id, nomes in arquivos.items():
+        for nome in nomes:
+            (diretorio / nome).write_bytes(b"x")
+    antigo = time.time() - 2 * storage_manager.STORAGE_PARTIAL_GRACE
+    os.utime(diretorio / arquivos[sem_registro][0], (antigo, antigo))
+    (diretorio / f"{terminada}.mp4").write_bytes(b"final")
+
+    gerenciador = GerenciadorArmazenamento(str(diretorio), cota=10 ** 9, livre_minimo=0, store=store, cache=cache)
+    assert gerenciador.executar_ciclo()["orphaned_partials"] == 3
+    restantes = sorted(p.name for p in diretorio.iterdir())
+    assert restantes == sorted([f"{terminada}.mp4", *arquivos[andamento], *arquivos[recente]])
+
+
+def test_admissao_recusa_com_503(ambiente, monkeypatch):
+    diretorio, store, cache = ambiente
+    (diretorio / _nome_de_tarefa("grande.mp4")).write_bytes(b"x" * 200)
+    gerenciador = GerenciadorArmazenamento(str(diretorio), cota=100, livre_minimo=0, store=store, cache=cache)
+    with pytest.raises(ArmazenamentoCheioError):
+        gerenciador.verificar_admissao()
+
+    monkeypatch.setattr(storage_manager, "_gerenciador", gerenciador)
+    monkeypatch.setattr(task_store, "_task_store", store)
+    res = client.post("/api/v1/video/download", json={"video_url": "https://vimeo.com/3", "format": "mp4"})
+    assert res.status_code == 503
+    assert res.headers["retry-after"] == str(storage_manager.STORAGE_RETRY_AFTER)
@@ -0,0 +1,126 @@
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.routes.download_endpoint as download_endpoint
+import app.services.result_cache as result_cache
+import app.services.stream_passthrough as stream_passthrough
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.result_cache import ResultCache
+from app.services.stream_passthrough import RemuxIndisponivelError, TransmissaoDownload, montar_comandos
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+PRODUTOR = [sys.executable, "-c", "import sys; [sys.stdout.buffer.write(b'abc' * 1000) for _ in range(50)]"]
+MAIUSCULAS = [sys.executable, "-c", "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read().upper())"]
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    monkeypatch.chdir(tmp_path)
+    return store
+
+
+def test_montar_comandos_seleciona_formato_de_arquivo_unico(monkeypatch):
+    monkeypatch.setattr(stream_passthrough.shutil, "which", lambda programa: "/usr/bin/ffmpeg")
+    comandos = montar_comandos({"video_url": "https://vimeo.com/1", "format": "mp3", "audio_only": True})
+    assert comandos[0][-3:] == ["-o", "-", "https://vimeo.com/1"]
+    assert comandos[0][comandos[0].index("-f") + 1].startswith("bestaudio[acodec=mp3]")
+    assert comandos[1][0] == "ffmpeg"
+
+
+
+def test_origem_de_audio_compativel_nao_reencoda(monkeypatch):
+    monkeypatch.setattr(stream_passthrough.shutil, "which", lambda programa: "/usr/bin/ffmpeg")
+    info = {"formats": [
+        {"format_id": "251", "protocol": "https", "vcodec": "none", "acodec": "opus", "ext": "webm", "abr": 160},
+        {"format_id": "140", "protocol": "https", "vcodec": "none", "acodec": "mp4a.40.2", "ext": "m4a", "abr": 128},
+        {"format_id": "18", "protocol": "https", "vcodec": "avc1", "acodec": "mp4a.40.2", "ext": "mp4"},
+    ]}
+    pedido = {"video_url": "https://vimeo.com/1", "audio_only": True}
+
+    # Mesmo codec e contêiner: os bytes da origem saem como estão, sem ffmpeg
+    comandos = montar_comandos({**pedido, "format": "m4a"}, info)
+    assert len(comandos) == 1
+    assert comandos[0][comandos[0].index("-f") + 1] == "140"
+
+    # Mesmo codec em outro contêiner: o ffmpeg só copia o fluxo
+    comandos = montar_comandos({**pedido, "format": "ogg"}, info)
+    assert comandos[0][comandos[0].index("-f") + 1] == "251"
+    assert comandos[1][comandos[1].index("-c:a") + 1] == "copy"
+
+    # Nenhuma origem em mp3: aí sim transcodifica
+    comandos = montar_comandos({**pedido, "format": "mp3"}, info)
+    assert comandos[1][comandos[1].index("-c:a") + 1] == "libmp3lame"
+
+def test_transmite_pipeline_e_grava_copia_no_cache(ambiente, monkeypatch):
+    monkeypatch.setattr(download_endpoint, "montar_comandos", lambda dados, info=None: [PRODUTOR, MAIUSCULAS])
+    corpo = {"video_url": "https://vimeo.com/7", "format": "mp4"}
+
+    res = client.post("/api/v1/video/download/stream", json=corpo)
+    assert res.status_code == 200
+    assert res.headers["content-type"] == "video/mp4"
+    assert res.content == b"ABC" * 50000
+    task_id = res.headers["x-task-id"]
+
+    registro = ambiente.obter(task_id)
+    assert registro["status"] == "completed"
+    assert Path(registro["file_path"]).read_bytes() == res.content
+
+    # Segunda requisição idêntica sai do cache, já com suporte a Range
+    res = client.post("/api/v1/video/download/stream", json=corpo, headers={"Range": "bytes=0-2"})
+    assert res.status_code == 206
+    assert res.content == b"ABC"
+
+
+def test_falha_antes_do_primeiro_byte_vira_502(ambiente, monkeypatch):
+    falha = [sys.executable, "-c", "import sys; sys.stderr.write('video indisponivel'); sys.exit(1)"]
+    monkeypatch.setattr(download_endpoint, "montar_comandos", lambda dados, info=None: [falha])
+
+    res = client.post(
+        "/api/v1/video/download/stream",
+        json={"video_url": "https://vimeo.com/8", "format": "mp4"},
+        params={"save_copy": "false"},
+    )
+    assert res.status_code == 502
+    assert "video indisponivel" in res.json()["detail"]
+
+
+def test_fila_limitada_pausa_o_motor(tmp_path):
+    async def cenario():
+        destino = str(tmp_path / "saida.bin")
+        grande = [sys.executable, "-c", "import sys; [sys.stdout.buffer.write(b'x' * 65536) for _ in range(100)]"]
+        transmissao = TransmissaoDownload([grande], destino, tamanho_fila=2)
+        await transmissao.iniciar()
+        await asyncio.sleep(0.3)
+        # Sem consumo, apenas a fila e os pipes do SO guardam dados; o produtor segue vivo
+        assert transmissao._fila.full()
+        assert transmissao._processos[0].returncode is None
+        await transmissao.encerrar()
+        assert not Path(destino + ".part").exists()
+        assert not Path(destino).exists()
+
+    asyncio.run(cenario())
+
+
+def test_sem_ffmpeg_nao_serve_bytes_de_outro_formato(ambiente, monkeypatch):
+    monkeypatch.setattr(stream_passthrough.shutil, "which", lambda programa: None)
+    with pytest.raises(RemuxIndisponivelError):
+        montar_comandos({"video_url": "https://vimeo.com/1", "format": "webm"})
+    # AVI não tem muxer em pipe: só arquivos já em AVI são aceitos
+    comandos = montar_comandos({"video_url": "https://vimeo.com/1", "format": "avi"})
+    assert comandos[0][comandos[0].index("-f") + 1] == "best[ext=avi][vcodec!=none][acodec!=none]"
+
+    resposta = client.post("/api/v1/video/download/stream", json={"video_url": "https://vimeo.com/1", "format": "mp4"})
+    assert resposta.status_code == 503
+    assert ambiente.listar() == []
@@ -0,0 +1,96 @@
+import sys
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient
+
+import app.services.task_store as task_store
+from app.main import app_fastapi
+from app.services.task_store import SQLiteTaskStore
+
+client = TestClient(app_fastapi)
+
+
+def test_status_lido_do_store_sem_gravar(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    store.criar("t1", {"video_url": "https://vimeo.com/1"})
+    antes = store.obter("t1")["updated_at"]
+
+    res = client.get("/api/v1/video/task/t1")
+    assert res.status_code == 200
+    assert res.json()["data"]["status"] == "pending"
+    assert store.obter("t1")["updated_at"] == antes
+
+    assert client.get("/api/v1/video/task/inexistente").status_code == 404
+
+
+def test_cache_invalida_com_gravacao_de_outro_processo(tmp_path):
+    caminho = str(tmp_path / "app.db")
+    api = SQLiteTaskStore(caminho)
+    worker = SQLiteTaskStore(caminho)
+    api.criar("t2", {"video_url": "https://vimeo.com/2"})
+    assert api.obter("t2")["status"] == "pending"
+
+    worker.atualizar("t2", status="completed", progress=100)
+    registro = api.obter("t2")
+    assert registro["status"] == "completed"
+    assert registro["progress"] == 100
+
+
+def test_listar_por_status(tmp_path):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    store.criar("a", {})
+    store.criar("b", {}, status="completed")
+    assert [r["task_id"] for r in store.listar(status="completed")] == ["b"]
+
+
+def test_atualizacoes_concorrentes_de_processos_nao_se_perdem(tmp_path):
+    caminho = str(tmp_path / "app.db")
+    api = SQLiteTaskStore(caminho)
+    worker = SQLiteTaskStore(caminho)
+    api.criar("t3", {})
+
+    def gravar(store, campo):
+        for i in range(1000):
+            store.atualizar("t3", **{campo: i})
+
+    threads = [threading.Thread(target=gravar, args=(api, "a")), threading.Thread(target=gravar, args=(worker, "b"))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    registro = SQLiteTaskStore(caminho).obter("t3")
+    assert (registro["a"], registro["b"]) == (999, 999)
+
+
+def test_filhos_acrescentados_em_paralelo_nao_se_perdem(tmp_path):
+    caminho = str(tmp_path / "app.db")
+    stores = [SQLiteTaskStore(caminho), SQLiteTaskStore(caminho)]
+    stores[0].criar("lote", {}, kind="batch", children=[])
+
+    def acrescentar(indice):
+        for i in range(200):
+            stores[indice].adicionar_filhos("lote", [f"{indice}-{i}"])
+
+    threads = [threading.Thread(target=acrescentar, args=(indice,)) for indice in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    filhos = SQLiteTaskStore(caminho).obter("lote")["children"]
+    assert sorted(filhos) == sorted(f"{indice}-{i}" for indice in range(2) for i in range(200))
+
+def test_gravacao_de_outro_processo_invalida_so_o_registro_alterado(tmp_path):
+    caminho = str(tmp_path / "app.db")
+    api = SQLiteTaskStore(caminho)
+    worker = SQLiteTaskStore(caminho)
+    api.criar("quente", {})
+    api.criar("alterada", {})
+    api.obter("quente")
+
+    worker.atualizar("alterada", progress=50)
+    assert api.obter("alterada")["progress"] == 50
+    assert "quente" in api._cache
@@ -0,0 +1,104 @@
+import math
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+from fastapi.testclient import TestClient
+
+import app.services.download_runner as download_runner
+import app.services.engine_stats as engine_stats
+import app.services.result_cache as result_cache
+import app.services.stream_passthrough as stream_passthrough
+import app.services.task_store as task_store
+import app.services.trimming as trimming
+from app.main import app_fastapi
+from app.services.engine_stats import EngineStats
+from app.services.result_cache import ResultCache
+from app.services.stream_passthrough import montar_comandos
+from app.services.task_store import SQLiteTaskStore
+from app.services.trimming import (
+    MetricasRecorte,
+    argumento_secao,
+    estimar_tamanho_completo,
+    intervalo_recorte,
+)
+
+client = TestClient(app_fastapi)
+
+
+def test_intervalo_recorte():
+    assert intervalo_recorte({"start_time": None, "end_time": None}) is None
+    assert intervalo_recorte({"start_time": "00:01:30", "end_time": "00:02:00"}) == (90.0, 120.0)
+    assert intervalo_recorte({"start_time": None, "end_time": "00:00:10"}) == (0.0, 10.0)
+    assert intervalo_recorte({"start_time": "01:00:00"}) == (3600.0, math.inf)
+    assert argumento_secao((90.0, math.inf)) == ["--download-sections", "*90-inf"]
+
+
+def test_estimar_tamanho_completo():
+    assert estimar_tamanho_completo({"requested_formats": [{"filesize": 100}, {"filesize_approx": 50}]}) == 150
+    assert estimar_tamanho_completo({"tbr": 800, "duration": 10}) == 1_000_000
+    assert estimar_tamanho_completo({"duration": 10}) is None
+
+
+def test_modo_em_fluxo_pede_apenas_o_trecho(monkeypatch):
+    monkeypatch.setattr(stream_passthrough.shutil, "which", lambda programa: "/usr/bin/ffmpeg")
+    comandos = montar_comandos(
+        {"video_url": "https://vimeo.com/1", "format": "mp4", "start_time": "00:00:05", "end_time": "00:00:35"}
+    )
+    assert comandos[0][comandos[0].index("--download-sections") + 1] == "*5-35"
+
+
+class YoutubeDLRecortado:
+    opcoes_recebidas = None
+
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+        YoutubeDLRecortado.opcoes_recebidas = opcoes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def process_ie_result(self, info, download=True):
+        trechos = list(self.opcoes["download_ranges"](info, None))
+        assert trechos == [{"start_time": 60.0, "end_time": 90.0}]
+        caminho = self.opcoes["outtmpl"].replace("%(ext)s", "mp4")
+        Path(caminho).write_bytes(b"x" * 1000)
+        return {**info, "requested_downloads": [{"filepath": caminho}]}
+
+
+def test_runner_baixa_so_o_trecho_e_registra_economia(tmp_path, monkeypatch):
+    store = SQLiteTaskStore(str(tmp_path / "app.db"))
+    metricas = MetricasRecorte(str(tmp_path / "app.db"))
+    monkeypatch.setattr(task_store, "_task_store", store)
+    monkeypatch.setattr(result_cache, "_result_cache", ResultCache(str(tmp_path / "app.db")))
+    stats = EngineStats(str(tmp_path / "app.db"))
+    # Com o yt-dlp falhando no domínio, vimeo.com passaria a tentar o motor segmentado primeiro
+    for _ in range(3):
+        stats.registrar("vimeo.com", "yt-dlp", False)
+    monkeypatch.setattr(engine_stats, "_engine_stats", stats)
+    monkeypatch.setattr(trimming, "_metricas_recorte", metricas)
+    monkeypatch.setattr(download_runner, "YoutubeDL", YoutubeDLRecortado)
+    monkeypatch.setattr(
+        download_runner, "obter_info_video_sincrono", lambda url: {"id": "1", "duration": 600, "filesize": 20000}
+    )
+    monkeypatch.chdir(tmp_path)
+
+    resultado = download_runner.executar_download(
+        "t1",
+        {"video_url": "https://vimeo.com/5", "format": "mp4", "start_time": "00:01:00", "end_time": "00:01:30"},
+    )
+    assert resultado["status"] == "completed"
+    # Recortes vão direto ao yt-dlp mesmo assim: o motor segmentado baixaria o arquivo inteiro
+    assert resultado["engine_used"] == "yt-dlp"
+    registro = store.obter("t1")
+    assert registro["bytes_fetched"] == 1000
+    assert registro["bytes_saved"] == 19000
+
+    dados = client.get("/api/v1/admin/trimming/stats").json()["data"]
+    assert dados["trimmed_downloads"] == 1
+    assert dados["bytes_saved"] == 19000
+    assert dados["saved_ratio"] == 0.95